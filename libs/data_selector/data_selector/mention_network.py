@@ -0,0 +1,193 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import Iterable, List, Optional, Tuple
+
+
+class MentionGraph:
+    """
+    The in sample mention network as a sparse matrix. Users are coded as
+    integers 0..n_users - 1 and `adjacency[i, j]` is the number of times user
+    i mentioned user j. Neighbor queries read one row of the CSR matrix (or
+    of its transpose for in-neighbors) so they cost O(degree) instead of a
+    scan over the whole edge list.
+
+    Users are referred to by their user id string everywhere, use
+    `user_id` / `screen_name` to go back and forth.
+
+    Parameters
+    ----------
+    mentions: pd.DataFrame
+        Mention network with "uid1", "uid2", "1to2freq" and "2to1freq" columns
+    id_map: pd.DataFrame
+        Optional table with "user_id" and "screen_name" columns
+    """
+
+    def __init__(self, mentions: pd.DataFrame, id_map: Optional[pd.DataFrame] = None):
+
+        uid1 = mentions["uid1"].astype(str).values
+        uid2 = mentions["uid2"].astype(str).values
+        codes, self.user_ids = pd.factorize(np.concatenate((uid1, uid2)))
+        self.user_ids = np.asarray(self.user_ids, dtype=object)
+        self.id_index = {user_id: i for i, user_id in enumerate(self.user_ids)}
+
+        # each row of the table is two directed edges
+        n_edges = mentions.shape[0]
+        sources = np.concatenate((codes[:n_edges], codes[n_edges:]))
+        targets = np.concatenate((codes[n_edges:], codes[:n_edges]))
+        weights = np.concatenate((mentions["1to2freq"].values,
+                                  mentions["2to1freq"].values)).astype(np.int64)
+
+        # only keep directions that actually happened. duplicate rows add up
+        keep = weights > 0
+        n_users = self.user_ids.shape[0]
+        self.adjacency = sp.csr_matrix((weights[keep], (sources[keep], targets[keep])),
+                                       shape=(n_users, n_users))
+        self.adjacency.sum_duplicates()
+        self.reverse = self.adjacency.T.tocsr()
+
+        self.id_to_name = {}
+        self.name_to_id = {}
+        if id_map is not None:
+            user_ids = id_map["user_id"].astype(str).values
+            screen_names = id_map["screen_name"].values
+            self.id_to_name = dict(zip(user_ids, screen_names))
+            self.name_to_id = dict(zip(screen_names, user_ids))
+
+    @classmethod
+    def from_files(cls, network_path: str, id_map_path: Optional[str] = None) -> "MentionGraph":
+        """
+        Load the graph from `in_sample_mentions.tsv` and the user id map.
+        """
+        mentions = pd.read_csv(network_path, sep="\t",
+                               dtype={"uid1": str, "uid2": str,
+                                      "1to2freq": int, "2to1freq": int})
+        id_map = None
+        if id_map_path is not None:
+            id_map = pd.read_csv(id_map_path, sep="\t",
+                                 dtype={"screen_name": str, "user_id": str})
+        return cls(mentions, id_map)
+
+    # little helpers to convert screen name to user id and vice versa
+    def user_id(self, screen_name: str) -> Optional[str]:
+        return self.name_to_id.get(screen_name)
+
+    def screen_name(self, user_id) -> Optional[str]:
+        return self.id_to_name.get(str(user_id))
+
+    def _row(self, matrix: sp.csr_matrix, user_id) -> Tuple[np.ndarray, np.ndarray]:
+        i = self.id_index.get(str(user_id))
+        if i is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=matrix.dtype)
+        start, end = matrix.indptr[i], matrix.indptr[i + 1]
+        return matrix.indices[start:end], matrix.data[start:end]
+
+    def out_neighbors(self, user_id) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Users this user mentioned and how many times.
+
+        Returns
+        -------
+        user_ids: np.ndarray
+            Neighbor user ids
+        weights: np.ndarray
+            Number of mentions of each neighbor
+        """
+        codes, weights = self._row(self.adjacency, user_id)
+        return self.user_ids[codes], weights
+
+    def in_neighbors(self, user_id) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Users who mentioned this user and how many times.
+        """
+        codes, weights = self._row(self.reverse, user_id)
+        return self.user_ids[codes], weights
+
+    def neighbors(self, user_id) -> np.ndarray:
+        """
+        Everyone connected to the user by a mention in either direction.
+        """
+        out_codes, _ = self._row(self.adjacency, user_id)
+        in_codes, _ = self._row(self.reverse, user_id)
+        return self.user_ids[np.union1d(out_codes, in_codes)]
+
+    def neighbor_names(self, screen_name: str) -> Optional[List[str]]:
+        """
+        Screen names of everyone connected to the user in either direction,
+        None if we can't find the user. Neighbors without a screen name are
+        skipped.
+        """
+        user_id = self.user_id(screen_name)
+        if user_id is None or user_id not in self.id_index:
+            return None
+
+        names = [self.id_to_name.get(neighbor) for neighbor in self.neighbors(user_id)]
+        return [name for name in names if name is not None]
+
+    def degree(self, user_id, direction: str = "out", weighted: bool = False):
+        """
+        Number of neighbors (or mentions with `weighted`) in one direction.
+        """
+        matrix = self.adjacency if direction == "out" else self.reverse
+        _, weights = self._row(matrix, user_id)
+        return weights.sum() if weighted else weights.shape[0]
+
+    def neighbor_sum(self,
+                     user_id,
+                     values: np.ndarray,
+                     direction: str = "out",
+                     weighted: bool = True) -> np.ndarray:
+        """
+        Sum of `values` over the user's neighbors, optionally weighted by
+        the number of mentions. `values` has one row per user in graph order
+        (`self.user_ids`) and any number of trailing dimensions.
+        """
+        matrix = self.adjacency if direction == "out" else self.reverse
+        codes, weights = self._row(matrix, user_id)
+        values = np.asarray(values)
+        if not weighted:
+            return values[codes].sum(axis=0)
+        return np.tensordot(weights, values[codes], axes=(0, 0))
+
+    def matrix(self, direction: str = "out", weighted: bool = True) -> sp.csr_matrix:
+        """
+        The adjacency matrix for one direction ("out", "in" or "both").
+        Unweighted matrices have a 1 for every edge.
+        """
+        if direction == "out":
+            matrix = self.adjacency
+        elif direction == "in":
+            matrix = self.reverse
+        elif direction == "both":
+            matrix = (self.adjacency + self.reverse).tocsr()
+        else:
+            raise ValueError(f"Unknown direction '{direction}'")
+
+        if not weighted:
+            matrix = matrix.copy()
+            matrix.data = np.ones_like(matrix.data)
+        return matrix
+
+    def adjacency_for(self,
+                      screen_names: Iterable[str],
+                      direction: str = "out",
+                      weighted: bool = True) -> sp.csr_matrix:
+        """
+        Adjacency matrix with rows and columns in the order of `screen_names`,
+        e.g. the users of a frame tensor. Users not in the graph get empty
+        rows and columns.
+        """
+        codes = np.array([self.id_index.get(self.name_to_id.get(name), -1)
+                          for name in screen_names], dtype=np.int64)
+        found = np.flatnonzero(codes >= 0)
+
+        # selection matrix picking graph rows in the requested order
+        select = sp.csr_matrix((np.ones(found.shape[0], dtype=np.int64), (found, codes[found])),
+                               shape=(codes.shape[0], self.user_ids.shape[0]))
+        return (select @ self.matrix(direction, weighted) @ select.T).tocsr()
+
+    def __contains__(self, user_id) -> bool:
+        return str(user_id) in self.id_index
+
+    def __len__(self) -> int:
+        return self.user_ids.shape[0]
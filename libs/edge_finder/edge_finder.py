@@ -1,10 +1,31 @@
+import csv
 import gzip
 import json
+import logging
+import os
 import re
+import tempfile
+import zlib
+import numpy as np
 import pandas as pd
-from typing import Dict, Optional
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Union
 from tqdm import tqdm
 
+logger = logging.getLogger(__name__)
+
+# text patterns identify_successors uses, compiled once
+RT_PREFIX = re.compile(r"RT @[a-zA-Z0-9]+\W")
+MENTION = re.compile(r"@([a-zA-Z0-9]+)")
+RT_USER = re.compile(r"RT @([a-zA-Z0-9_]+)")
+RT_USER_COLON = re.compile(r"RT @([a-zA-Z0-9_]+):")
+
+# files bigger than this are read by extract_edges itself and handed to the
+# workers in blocks of lines, so a single year long dump isn't stuck on one
+# core. smaller files (e.g. the daily retweet files) go to a worker whole
+SPLIT_BYTES = 2 ** 28
+LINES_PER_TASK = 20000
+
 
 def check_connections(tweet_json: Dict, group: str, check_mentions=False) -> Optional[Dict]:
     successors = identify_successors(tweet_json, group, check_mentions)
@@ -18,7 +39,218 @@ def check_connections(tweet_json: Dict, group: str, check_mentions=False) -> Opt
     return None
 
 
-def check_sample_group(edge_info: pd.Series, catalog: Dict,
+def extract_edges(input_paths: List[str],
+                  out_path: str,
+                  group: str = "public",
+                  n_workers: Optional[int] = None,
+                  shard_dir: Optional[str] = None,
+                  check_mentions: bool = False,
+                  split_bytes: int = SPLIT_BYTES,
+                  lines_per_task: int = LINES_PER_TASK) -> int:
+    """
+    Run `check_connections` over every tweet in a set of gzipped json-lines
+    files and write the connected tweets to one TSV edge list. Work is
+    spread over a process pool and each task streams its edges to its own
+    shard file so memory use does not grow with the size of the input.
+    Small files are one task each, files over `split_bytes` are read here
+    and split into tasks of `lines_per_task` lines.
+
+    Parameters
+    ----------
+    input_paths: List[str]
+        gzipped files with one tweet json object per line
+    out_path: str
+        where to write the merged TSV edge list
+    group: str
+        Which group the tweets belong to, passed to `identify_successors`
+    n_workers: int
+        Number of worker processes, defaults to the number of cpus
+    shard_dir: str
+        Directory for the per-task shards. A temporary directory is used and
+        cleaned up if this is not given
+    check_mentions: bool
+        Whether to also extract mentions from the tweet text
+    split_bytes: int
+        Size above which a file is split into blocks of lines
+    lines_per_task: int
+        Lines in each block of a split file
+
+    Returns
+    -------
+    n_edges: int
+        Number of edges written to `out_path`
+    """
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if shard_dir is None:
+            shard_dir = tmp_dir
+        os.makedirs(shard_dir, exist_ok=True)
+        shard_path = lambda i: os.path.join(shard_dir, f"edges_{i:05d}.jsonl")
+
+        # tasks in input order so the edge list keeps the order of the tweets
+        tasks = []
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            # blocks waiting for a worker, more would only take up memory
+            max_pending = 2 * (n_workers or os.cpu_count() or 1)
+
+            for path in input_paths:
+                if os.path.getsize(path) <= split_bytes:
+                    tasks.append(pool.submit(extract_edges_from_file, path, group,
+                                             shard_path(len(tasks)), check_mentions))
+                    continue
+
+                for lines in read_line_blocks(path, lines_per_task):
+                    pending = [task for task in tasks if not task.done()]
+                    if len(pending) >= max_pending:
+                        wait(pending, return_when=FIRST_COMPLETED)
+                    tasks.append(pool.submit(extract_edges_from_lines, lines, path, group,
+                                             shard_path(len(tasks)), check_mentions))
+
+            for _ in tqdm(as_completed(tasks), total=len(tasks)):
+                pass
+
+        # workers report back which columns they saw so we can write a header
+        shard_info = [task.result() for task in tasks]
+        columns = set()
+        for info in shard_info:
+            columns.update(info["columns"])
+
+        return merge_edge_shards([info["shard"] for info in shard_info],
+                                 order_edge_columns(columns),
+                                 out_path)
+
+
+def read_line_blocks(path: str, lines_per_block: int) -> Iterator[List[bytes]]:
+    # raw lines of a gzip file in blocks, stopping at a corrupted member
+    # like extract_edges_from_file does
+    block = []
+    line_i = 0
+    try:
+        with gzip.open(path, "rb") as fin:
+            for line_i, line in enumerate(fin):
+                block.append(line)
+                if len(block) == lines_per_block:
+                    yield block
+                    block = []
+    except (OSError, EOFError, zlib.error) as e:
+        logger.warning(f"Corrupted gzip member in {path} after line {line_i}: "
+                       f"{type(e).__name__}: {e}")
+    if block:
+        yield block
+
+
+def extract_edges_from_file(path: str,
+                            group: str,
+                            shard_path: str,
+                            check_mentions: bool = False) -> Dict:
+
+    # stream one gzip file into a json-lines shard
+    info = new_shard_info(path, shard_path)
+
+    line_i = 0
+    with open(shard_path, "w") as shard:
+        try:
+            with gzip.open(path, "rb") as fin:
+                for line_i, line in enumerate(fin):
+                    write_edges(line, group, shard, info, check_mentions)
+
+        # at least one of the daily retweet files is corrupted. keep what we
+        # read before the bad member and say where it happened
+        except (OSError, EOFError, zlib.error) as e:
+            info["corrupted"] = True
+            logger.warning(f"Corrupted gzip member in {path} after line {line_i}: "
+                           f"{type(e).__name__}: {e}")
+
+    log_shard_problems(info)
+    return info
+
+
+def extract_edges_from_lines(lines: Iterable[bytes],
+                             path: str,
+                             group: str,
+                             shard_path: str,
+                             check_mentions: bool = False) -> Dict:
+
+    # one block of a split file into a json-lines shard
+    info = new_shard_info(path, shard_path)
+    with open(shard_path, "w") as shard:
+        for line in lines:
+            write_edges(line, group, shard, info, check_mentions)
+
+    log_shard_problems(info)
+    return info
+
+
+def new_shard_info(path: str, shard_path: str) -> Dict:
+    return {"path": path, "shard": shard_path, "n_edges": 0, "columns": set(),
+            "bad_lines": 0, "bad_tweets": 0, "corrupted": False}
+
+
+def write_edges(line: bytes, group: str, shard, info: Dict, check_mentions: bool = False):
+    try:
+        tweet_json = json.loads(line)
+    except ValueError:
+        info["bad_lines"] += 1
+        return
+
+    # a tweet missing a field we expect shouldn't take down the whole pool
+    try:
+        edges = check_connections(tweet_json, group, check_mentions)
+    except Exception as e:
+        info["bad_tweets"] += 1
+        tweet_id = tweet_json.get("id") if isinstance(tweet_json, dict) else None
+        # the first one of a task in full, the rest are counted
+        log = logger.warning if info["bad_tweets"] == 1 else logger.debug
+        log(f"Skipping tweet {tweet_id} in {info['path']}: {type(e).__name__}: {e}")
+        return
+
+    if edges:
+        shard.write(json.dumps(edges) + "\n")
+        info["columns"].update(edges.keys())
+        info["n_edges"] += 1
+
+
+def log_shard_problems(info: Dict):
+    if info["bad_lines"] > 0:
+        logger.warning(f"Skipped {info['bad_lines']} undecodable lines in {info['path']}")
+    if info["bad_tweets"] > 0:
+        logger.warning(f"Skipped {info['bad_tweets']} tweets check_connections failed on "
+                       f"in {info['path']}")
+
+
+def order_edge_columns(columns) -> List[str]:
+    # same order identify_successors adds them in, with mentions numbered
+    leading = ["tweet_id", "user_id", "user_name"]
+    trailing = [col for kind in ["reply", "quote", "retweet"]
+                for col in EDGE_KIND_COLUMNS[kind]]
+    mentions = sorted([col for col in columns if col.startswith("mention_")],
+                      key=lambda col: int(col.split("_")[1]))
+
+    ordered = [col for col in leading if col in columns] + mentions
+    ordered += [col for col in trailing if col in columns]
+    ordered += sorted(set(columns) - set(ordered))
+
+    return ordered
+
+
+def merge_edge_shards(shard_paths: List[str], columns: List[str], out_path: str) -> int:
+
+    n_edges = 0
+    with open(out_path, "w", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=columns, delimiter="\t",
+                                restval="", lineterminator="\n")
+        writer.writeheader()
+
+        for shard_path in shard_paths:
+            with open(shard_path, "r") as shard:
+                for line in shard:
+                    writer.writerow(json.loads(line))
+                    n_edges += 1
+
+    return n_edges
+
+
+def check_sample_group(edge_info: pd.Series, catalog: Union[Dict, "SampleCatalog"],
                        kinds=["reply", "quote", "retweet"]) -> Dict:
     
     matches = {}
@@ -28,23 +260,21 @@ def check_sample_group(edge_info: pd.Series, catalog: Dict,
     return matches
 
 
-def check_group_kind_single(edge_info: pd.Series, catalog: Dict, kind: str) -> Dict:
+# edge list columns describing the target of each kind of interaction. the
+# order matches SampleCatalog.kinds
+EDGE_KIND_COLUMNS = {"reply": ["reply_to", "reply_to_user", "reply_to_user_name"],
+                     "retweet": ["retweet_of", "retweet_of_user", "retweet_of_user_name"],
+                     "quote": ["quote_of", "quote_of_user", "quote_of_user_name"]}
+
 
-    if kind == "reply":
-        target_tweet_id = "reply_to"
-        target_user_id = "reply_to_user"
-        target_user_name = "reply_to_user_name"
-    elif kind == "retweet":
-        target_tweet_id = "retweet_of"
-        target_user_id = "retweet_of_user"
-        target_user_name = "retweet_of_user_name"
-    elif kind == "quote":
-        target_tweet_id = "quote_of"
-        target_user_id = "quote_of_user"
-        target_user_name = "quote_of_user_name"
+def check_group_kind_single(edge_info: pd.Series, catalog: Union[Dict, "SampleCatalog"],
+                            kind: str) -> Dict:
 
-    edge_info_keys = [target_tweet_id, target_user_id, target_user_name]
-    catalog_keys = ["tweet_id", "user_id", "user_name"]
+    if kind not in EDGE_KIND_COLUMNS:
+        raise ValueError(f"`kind` must be one of {list(EDGE_KIND_COLUMNS.keys())}")
+
+    edge_info_keys = EDGE_KIND_COLUMNS[kind]
+    catalog_keys = SampleCatalog.kinds
 
     new_cols = {"tweet_id": edge_info["tweet_id"]}
 
@@ -53,24 +283,131 @@ def check_group_kind_single(edge_info: pd.Series, catalog: Dict, kind: str) -> D
         if edge_key in edge_info.keys():
             if edge_info[edge_key]:
 
-                new_cols[edge_key + "_in_sample"] = None
-
-                # check the catalog
-                if str(edge_info[edge_key]).lower() in str(catalog[cata_key].keys()):
-                    new_cols[edge_key + "_in_sample"] = catalog[cata_key][edge_info[edge_key]]
+                # exact lookup on the normalized key
+                new_cols[edge_key + "_in_sample"] = lookup_catalog(catalog,
+                                                                   cata_key,
+                                                                   edge_info[edge_key])
 
     return new_cols
 
 
-def build_sample_catalog(paths: Dict) -> Dict:
+def check_sample_group_batch(edges_df: pd.DataFrame,
+                             catalog: Union[Dict, "SampleCatalog"],
+                             kinds=["reply", "quote", "retweet"]) -> pd.DataFrame:
+    """
+    Vectorized version of `check_sample_group` for a whole edge list. Every
+    target column present in `edges_df` gets a matching `_in_sample` column
+    holding the sample the target belongs to, or None if it is not in our data.
+    """
 
-    # catalog all the tweet ids, user ids, and screen names in our data
+    index = catalog.index if isinstance(catalog, SampleCatalog) else catalog
+
+    matches = pd.DataFrame({"tweet_id": edges_df["tweet_id"]})
+    for kind in kinds:
+
+        if kind not in EDGE_KIND_COLUMNS:
+            raise ValueError(f"`kind` must be one of {list(EDGE_KIND_COLUMNS.keys())}")
+
+        for edge_key, cata_key in zip(EDGE_KIND_COLUMNS[kind], SampleCatalog.kinds):
+            if edge_key not in edges_df.columns:
+                continue
+
+            # one hashed lookup per row instead of scanning the catalog
+            keys = normalize_catalog_keys(edges_df[edge_key], cata_key)
+            in_sample = keys.map(index[cata_key])
+            matches[edge_key + "_in_sample"] = in_sample.astype(object).where(in_sample.notna(), None)
+
+    return matches
+
+
+def normalize_catalog_key(key, kind: str) -> Optional[str]:
+    # ids can show up as ints, strings, or floats (after a round trip through
+    # pandas) and screen names with any capitalization so we need one form
+    if key is None or (isinstance(key, float) and np.isnan(key)):
+        return None
+
+    if isinstance(key, (float, np.floating)):
+        key = "{:.0f}".format(key)
+
+    key = str(key).strip()
+
+    if kind == "user_name":
+        key = key.lstrip("@").lower()
+
+    return key
+
+
+def normalize_catalog_keys(keys: pd.Series, kind: str) -> pd.Series:
+    # same as normalize_catalog_key but for a whole column at once
+    present = keys.notna()
+    normalized = pd.Series(None, index=keys.index, dtype=object)
+
+    if pd.api.types.is_float_dtype(keys):
+        normalized[present] = keys[present].astype("int64").astype(str)
+    else:
+        normalized[present] = keys[present].astype(str).str.strip()
+
+    if kind == "user_name":
+        normalized[present] = normalized[present].str.lstrip("@").str.lower()
+
+    return normalized
+
+
+def lookup_catalog(catalog: Union[Dict, "SampleCatalog"], kind: str, key) -> Optional[str]:
+    # plain dicts from older catalogs are keyed the same way as SampleCatalog
+    if isinstance(catalog, SampleCatalog):
+        return catalog.get(kind, key)
+
+    return catalog[kind].get(normalize_catalog_key(key, kind))
+
+
+class SampleCatalog:
+    """
+    Index of every tweet id, user id and screen name in our data mapped to the
+    sample it came from. Keys are normalized when they are added and when they
+    are looked up so membership checks are exact O(1) dict lookups.
+
+    Parameters
+    ----------
+    catalog: Dict
+        Optional dict of dicts keyed by kind ("tweet_id", "user_id",
+        "user_name") as built by older versions of `build_sample_catalog`
+    """
 
-    # first lets build the basic structure of the catalog
     kinds = ["tweet_id", "user_id", "user_name"]
-    groups = ["public", "congress", "journalists", "trump"]
-    catalog = {k: {} for k in kinds}
 
+    def __init__(self, catalog: Optional[Dict] = None):
+        self.index = {kind: {} for kind in self.kinds}
+
+        if catalog:
+            for kind in self.kinds:
+                for key, sample in catalog.get(kind, {}).items():
+                    self.add(kind, key, sample)
+
+    def add(self, kind: str, key, sample: str):
+        normalized = normalize_catalog_key(key, kind)
+        if normalized is not None:
+            self.index[kind][normalized] = sample
+
+    def add_tweet(self, tweet_id, user_id, user_name, sample: str):
+        self.add("tweet_id", tweet_id, sample)
+        self.add("user_id", user_id, sample)
+        self.add("user_name", user_name, sample)
+
+    def get(self, kind: str, key) -> Optional[str]:
+        return self.index[kind].get(normalize_catalog_key(key, kind))
+
+    def __getitem__(self, kind: str) -> Dict:
+        return self.index[kind]
+
+    def __len__(self) -> int:
+        return len(self.index["tweet_id"])
+
+
+def build_sample_catalog(paths: Dict) -> SampleCatalog:
+
+    # catalog all the tweet ids, user ids, and screen names in our data
+    catalog = SampleCatalog()
 
     # now let's fill all of the public information
     years = ["2018", "2019"]
@@ -78,9 +415,10 @@ def build_sample_catalog(paths: Dict) -> Dict:
         print(f"Cataloging {year} Public Tweets")
         for t in tqdm(gzip.open(paths["public"][f"{year}_json"])):
             tweet_json = json.loads(t)
-            catalog["tweet_id"][str(tweet_json["id"])] = f"public_{year}"
-            catalog["user_id"][str(tweet_json["user"]["id"])] = f"public_{year}"
-            catalog["user_name"][str(tweet_json["user"]["screen_name"]).lower()] = f"public_{year}"
+            catalog.add_tweet(tweet_json["id"],
+                              tweet_json["user"]["id"],
+                              tweet_json["user"]["screen_name"],
+                              f"public_{year}")
 
     # same for congress
     with open(paths["congress"]["tweet_json"], "r") as congress_json:
@@ -88,9 +426,10 @@ def build_sample_catalog(paths: Dict) -> Dict:
 
     print(f"Cataloging Congress Tweets")
     for tweet_json in tqdm(congress_tweets):
-        catalog["tweet_id"][str(tweet_json["id"])] = f"congress"
-        catalog["user_id"][str(tweet_json["user_id"])] = "congress"
-        catalog["user_name"][str(tweet_json["screen_name"]).lower()] = "congress"
+        catalog.add_tweet(tweet_json["id"],
+                          tweet_json["user_id"],
+                          tweet_json["screen_name"],
+                          "congress")
 
     # finally for journalists
     with open(paths["journalists"]["tweet_json"], "r") as journalists_json:
@@ -98,13 +437,19 @@ def build_sample_catalog(paths: Dict) -> Dict:
 
     print(f"Cataloging Journalists Tweets")
     for tweet_json in tqdm(journalists_tweets):
-        catalog["tweet_id"][str(tweet_json["id"])] = "journalists"
-        catalog["user_id"][str(tweet_json["author_id"])] = "journalists"
-        catalog["user_name"][str(tweet_json["screen_name"]).lower()] = "journalists"
+        catalog.add_tweet(tweet_json["id"],
+                          tweet_json["author_id"],
+                          tweet_json["screen_name"],
+                          "journalists")
 
     return catalog
 
 
+def text_mentions(text: str) -> List[str]:
+    # screen names mentioned in the text, leaving out the retweeted user
+    return MENTION.findall(RT_PREFIX.sub("", text))
+
+
 def identify_successors(tweet_json: Dict, group: str, check_mentions=False) -> Dict:
 
     succs = {}
@@ -116,9 +461,7 @@ def identify_successors(tweet_json: Dict, group: str, check_mentions=False) -> D
         succs["user_name"] = tweet_json["user"]["screen_name"]
 
         if check_mentions:
-            stripped_of_rt = re.sub(r"RT @[a-zA-Z0-9]+\W", "", tweet_json["text"])
-            mentions = re.findall(r"@([a-zA-Z0-9]+)", stripped_of_rt)
-            for m, mention in enumerate(mentions):
+            for m, mention in enumerate(text_mentions(tweet_json["text"])):
                 succs["mention_" + str(m)] = mention
 
         if tweet_json["in_reply_to_status_id"]:
@@ -143,9 +486,7 @@ def identify_successors(tweet_json: Dict, group: str, check_mentions=False) -> D
         succs["user_name"] = tweet_json["screen_name"]
 
         if check_mentions:
-            stripped_of_rt = re.sub(r"RT @[a-zA-Z0-9]+\W", "", tweet_json["text"])
-            mentions = re.findall(r"@([a-zA-Z0-9]+)", stripped_of_rt)
-            for m, mention in enumerate(mentions):
+            for m, mention in enumerate(text_mentions(tweet_json["text"])):
                 succs["mention_" + str(m)] = mention
 
         if "referenced_tweets" in tweet_json:
@@ -156,8 +497,7 @@ def identify_successors(tweet_json: Dict, group: str, check_mentions=False) -> D
 
                     succs["retweet_of"] = str(rt["id"])
                     try:
-                        succs["retweet_of_user_name"] = re.findall(
-                            r"RT @([a-zA-Z0-9_]+):", tweet_json["text"])[0]
+                        succs["retweet_of_user_name"] = RT_USER_COLON.findall(tweet_json["text"])[0]
                     except:
                         raise ValueError(
                             f"Username not found in text: {tweet_json['text']}")
@@ -187,20 +527,14 @@ def identify_successors(tweet_json: Dict, group: str, check_mentions=False) -> D
                    "user_name": tweet_json["screen_name"]}
 
         if check_mentions:
-            stripped_of_rt = re.sub(r"RT @[a-zA-Z0-9]+\W", "", tweet_json["text"])
-            mentions = re.findall(r"@([a-zA-Z0-9]+)", stripped_of_rt)
-            for m, mention in enumerate(mentions):
+            for m, mention in enumerate(text_mentions(tweet_json["text"])):
                 succs["mention_" + str(m)] = mention
                 succs.update(id_info)
 
-        if re.match(r"RT @[a-zA-Z0-9_]+", tweet_json["text"]):
+        retweet_of = RT_USER.match(tweet_json["text"])
+        if retweet_of:
             succs.update(id_info)
-            try:
-                succs["retweet_of_user_name"] = re.findall(
-                    r"RT @([a-zA-Z0-9_]+)", tweet_json["text"])[0]
-            except:
-                raise ValueError(
-                    f"Username not found in text: {tweet_json['text']}")
+            succs["retweet_of_user_name"] = retweet_of.group(1)
 
     else:
         raise ValueError(
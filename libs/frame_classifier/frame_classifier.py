@@ -0,0 +1,156 @@
+import numpy as np
+import torch
+from prediction_cache import PredictionCache, normalize_text
+from resumable_tsv import classify_tsv
+from simpletransformers.classification import MultiLabelClassificationModel as MLCM
+from typing import Dict, List, Optional, Union
+
+FRAME_TYPES = ["generic", "specific", "narrative"]
+
+
+class FrameClassifier:
+    """
+    The three multilabel frame classifiers (generic, specific, narrative)
+    run together. All three heads are fine-tuned from the same base model so
+    each batch of texts is tokenized once and passed through every head,
+    instead of calling `.predict` on the whole corpus once per model.
+
+    Parameters
+    ----------
+    config: Dict
+        The workflow config, used for the model names and frame labels
+    batch_size: int
+        Number of texts per forward pass
+    n_threads: int
+        Number of cpu threads torch is allowed to use
+    use_cuda: bool
+        Whether to run the models on the gpu
+    frame_types: List[str]
+        Which of the classifiers to load
+    cache: PredictionCache
+        Optional cache consulted before running any text through the models
+    """
+
+    def __init__(self,
+                 config: Dict,
+                 batch_size: int = 64,
+                 n_threads: Optional[int] = None,
+                 use_cuda: bool = False,
+                 frame_types: List[str] = FRAME_TYPES,
+                 cache: Optional[PredictionCache] = None):
+
+        if n_threads:
+            torch.set_num_threads(n_threads)
+
+        self.batch_size = batch_size
+        self.cache = cache
+        self.frame_types = frame_types
+        self.frame_labels = {ft: config["frames"][ft] for ft in frame_types}
+        self.model_names = {ft: config["model_names"][ft] for ft in frame_types}
+
+        self.models = {}
+        for frame_type in frame_types:
+            self.models[frame_type] = MLCM(model_type=config["model"],
+                                           model_name=config["model_names"][frame_type],
+                                           use_cuda=use_cuda)
+            self.models[frame_type].model.eval()
+
+        # every head shares the base model tokenizer
+        first = self.models[frame_types[0]]
+        self.tokenizer = first.tokenizer
+        self.max_seq_length = first.args.max_seq_length
+        self.device = first.device
+
+    def predict(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Binary frame predictions for every text. Repeated texts only go
+        through the models once, and texts already in the cache not at all.
+
+        Returns
+        -------
+        predictions: Dict[str, np.ndarray]
+            One (n_texts, n_labels) array of 0/1 predictions per frame type
+        """
+        # identical texts (after cleaning) share one prediction
+        first_seen = {}
+        inverse = np.zeros(len(texts), dtype=int)
+        for i, text in enumerate(texts):
+            inverse[i] = first_seen.setdefault(normalize_text(text), len(first_seen))
+        unique_texts = [None] * len(first_seen)
+        for i, text in enumerate(texts):
+            if unique_texts[inverse[i]] is None:
+                unique_texts[inverse[i]] = text
+
+        unique_predictions = {ft: np.zeros((len(unique_texts), len(self.frame_labels[ft])), dtype=int)
+                              for ft in self.frame_types}
+        todo = {ft: np.arange(len(unique_texts)) for ft in self.frame_types}
+
+        if self.cache is not None:
+            for frame_type in self.frame_types:
+                cached = self.cache.get_many(self.model_names[frame_type], unique_texts)
+                missing = []
+                for i, labels in enumerate(cached):
+                    if labels is None:
+                        missing.append(i)
+                    else:
+                        unique_predictions[frame_type][i] = labels
+                todo[frame_type] = np.array(missing, dtype=int)
+
+        # anything still needed by at least one head gets tokenized once
+        need = np.unique(np.concatenate([todo[ft] for ft in self.frame_types]))
+        for start in range(0, len(need), self.batch_size):
+            batch_i = need[start:start + self.batch_size]
+            heads = [ft for ft in self.frame_types if np.isin(batch_i, todo[ft]).any()]
+            batch_predictions = self._predict_batch([unique_texts[i] for i in batch_i], heads)
+
+            for frame_type in heads:
+                unique_predictions[frame_type][batch_i] = batch_predictions[frame_type]
+
+        if self.cache is not None:
+            for frame_type in self.frame_types:
+                self.cache.put_many(self.model_names[frame_type],
+                                    [unique_texts[i] for i in todo[frame_type]],
+                                    unique_predictions[frame_type][todo[frame_type]])
+
+        return {ft: unique_predictions[ft][inverse] for ft in self.frame_types}
+
+    def _predict_batch(self, texts: List[str],
+                       frame_types: Optional[List[str]] = None) -> Dict[str, np.ndarray]:
+
+        if frame_types is None:
+            frame_types = self.frame_types
+
+        inputs = self.tokenizer(list(texts),
+                                padding=True,
+                                truncation=True,
+                                max_length=self.max_seq_length,
+                                return_tensors="pt").to(self.device)
+
+        batch_predictions = {}
+        with torch.no_grad():
+            for frame_type in frame_types:
+                model = self.models[frame_type]
+                logits = model.model(**inputs)[0]
+                probabilities = torch.sigmoid(logits).cpu().numpy()
+                batch_predictions[frame_type] = (probabilities >= model.args.threshold).astype(int)
+
+        return batch_predictions
+
+    def classify_tsv(self,
+                     data_files: Union[str, List[str]],
+                     out_prefix: str,
+                     chunksize: int = 10000,
+                     checkpoint_path: Optional[str] = None) -> int:
+        """
+        Stream tweets from TSV files (with "id_str" and "text" columns) and
+        append predictions to one TSV per frame type named
+        `{out_prefix}_{frame_type}.tsv`. An interrupted run picks up where
+        it stopped, see `resumable_tsv.classify_tsv`.
+
+        Returns
+        -------
+        n_classified: int
+            Number of tweets classified in this run
+        """
+        return classify_tsv(self.predict, self.frame_labels, data_files, out_prefix,
+                            chunksize, checkpoint_path)
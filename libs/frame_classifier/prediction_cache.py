@@ -0,0 +1,120 @@
+import hashlib
+import sqlite3
+import numpy as np
+from tweet_handler import clean_text
+from typing import Dict, List, Optional
+
+
+def normalize_text(text: str) -> str:
+    # same cleaning the tweet tables get in tweet_handler, plus surrounding
+    # whitespace which the tokenizer ignores anyway
+    return clean_text(text).strip()
+
+
+def cache_key(model_name: str, text: str) -> str:
+    return hashlib.sha1((model_name + "\n" + normalize_text(text)).encode("utf-8")).hexdigest()
+
+
+class PredictionCache:
+    """
+    Persistent cache of frame predictions keyed by a hash of the model name
+    and the normalized tweet text. Retweets and quote chains repeat the same
+    text over and over so most of them never need to go through the model.
+    Once the cache holds more than `max_entries` predictions the least
+    recently used ones are evicted.
+
+    Parameters
+    ----------
+    path: str
+        sqlite file to keep the cache in, ":memory:" for a throwaway cache
+    max_entries: int
+        Maximum number of (model, text) predictions to keep
+    """
+
+    def __init__(self, path: str, max_entries: int = 10_000_000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS predictions
+                                   (key TEXT PRIMARY KEY,
+                                    labels BLOB NOT NULL,
+                                    last_used INTEGER NOT NULL)""")
+        self.connection.execute("""CREATE INDEX IF NOT EXISTS lru
+                                   ON predictions (last_used)""")
+        self.connection.commit()
+
+        # logical clock for least recently used ordering
+        self.clock = self.connection.execute("SELECT COALESCE(MAX(last_used), 0) "
+                                             "FROM predictions").fetchone()[0]
+
+    def get_many(self, model_name: str, texts: List[str]) -> List[Optional[np.ndarray]]:
+        """
+        Cached 0/1 predictions for each text, None where we have to run the
+        model.
+        """
+        keys = [cache_key(model_name, text) for text in texts]
+        found = {}
+
+        # sqlite limits the number of bound parameters per statement
+        unique_keys = list(set(keys))
+        for start in range(0, len(unique_keys), 500):
+            key_batch = unique_keys[start:start + 500]
+            marks = ",".join("?" * len(key_batch))
+            rows = self.connection.execute(f"SELECT key, labels FROM predictions "
+                                           f"WHERE key IN ({marks})", key_batch)
+            for key, labels in rows:
+                found[key] = np.frombuffer(labels, dtype=np.uint8).astype(int)
+
+        if found:
+            self.clock += 1
+            self.connection.executemany("UPDATE predictions SET last_used = ? WHERE key = ?",
+                                        [(self.clock, key) for key in found])
+            self.connection.commit()
+
+        cached = [found.get(key) for key in keys]
+        n_hits = sum(labels is not None for labels in cached)
+        self.hits += n_hits
+        self.misses += len(cached) - n_hits
+
+        return cached
+
+    def put_many(self, model_name: str, texts: List[str], predictions: np.ndarray):
+        """
+        Store one row of 0/1 predictions per text.
+        """
+        self.clock += 1
+        rows = [(cache_key(model_name, text),
+                 np.asarray(labels, dtype=np.uint8).tobytes(),
+                 self.clock)
+                for text, labels in zip(texts, predictions)]
+        self.connection.executemany("INSERT OR REPLACE INTO predictions VALUES (?, ?, ?)", rows)
+        self._evict()
+        self.connection.commit()
+
+    def _evict(self):
+        n_entries = len(self)
+        if n_entries > self.max_entries:
+            n_evict = n_entries - self.max_entries
+            self.connection.execute("""DELETE FROM predictions WHERE key IN
+                                       (SELECT key FROM predictions
+                                        ORDER BY last_used LIMIT ?)""", (n_evict,))
+            self.evictions += n_evict
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups > 0 else 0.0,
+                "evictions": self.evictions,
+                "entries": len(self)}
+
+    def close(self):
+        self.connection.close()
+
+    def __len__(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
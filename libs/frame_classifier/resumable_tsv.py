@@ -0,0 +1,137 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+from typing import Callable, Dict, List, Optional, Union
+
+
+# resumable tsv classification. after every chunk we record, per input file,
+# how many rows are done (along with the input's size and mtime so a
+# regenerated input isn't mistaken for the old one) and how long each
+# output is. a restart truncates the outputs back to the last checkpoint and
+# skips the rows already done. if the outputs don't match the checkpoint any
+# more (deleted by snakemake before a rerun, or shortened) or an input
+# changed, the run starts over. the checkpoint is removed once every input
+# is done so the next run is a fresh one
+
+
+def input_fingerprint(path: str) -> Dict:
+    stat = os.stat(path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def classify_tsv(predict: Callable[[List[str]], Dict[str, np.ndarray]],
+                 frame_labels: Dict[str, List[str]],
+                 data_files: Union[str, List[str]],
+                 out_prefix: str,
+                 chunksize: int = 10000,
+                 checkpoint_path: Optional[str] = None) -> int:
+    """
+    Stream tweets from TSV files (with "id_str" and "text" columns) and
+    append predictions to one TSV per frame type named
+    `{out_prefix}_{frame_type}.tsv`, picking up where an interrupted run
+    stopped.
+
+    Parameters
+    ----------
+    predict: Callable[[List[str]], Dict[str, np.ndarray]]
+        Texts to one (n_texts, n_labels) array of 0/1 predictions per frame
+        type, e.g. `FrameClassifier.predict`
+    frame_labels: Dict[str, List[str]]
+        Label names of each frame type, in prediction column order
+
+    Returns
+    -------
+    n_classified: int
+        Number of tweets classified in this run
+    """
+    if isinstance(data_files, str):
+        data_files = [data_files]
+    if checkpoint_path is None:
+        checkpoint_path = out_prefix + "_checkpoint.json"
+
+    out_paths = {ft: f"{out_prefix}_{ft}.tsv" for ft in frame_labels}
+    checkpoint = _load_checkpoint(checkpoint_path, out_paths, data_files)
+
+    # fresh outputs get their header up front, so an input with no tweets
+    # still leaves a (header only) output behind
+    for frame_type, out_path in out_paths.items():
+        if checkpoint["out_bytes"][out_path] == 0:
+            header = pd.DataFrame(columns=["id_str"] + list(frame_labels[frame_type]) + ["text"])
+            header.to_csv(out_path, sep="\t", index=False)
+            checkpoint["out_bytes"][out_path] = os.path.getsize(out_path)
+    _save_checkpoint(checkpoint_path, checkpoint)
+
+    n_classified = 0
+    for data_file in data_files:
+        rows_done = checkpoint["inputs"][data_file]["rows_done"]
+        chunks = pd.read_csv(data_file, sep="\t", chunksize=chunksize,
+                             skiprows=range(1, rows_done + 1))
+
+        for chunk in tqdm(chunks, desc=data_file):
+            tweets = chunk.dropna(subset="text")
+            texts = list(tweets["text"])
+            predictions = predict(texts)
+
+            for frame_type, out_path in out_paths.items():
+                new_df = pd.DataFrame(predictions[frame_type],
+                                      columns=frame_labels[frame_type])
+                new_df["text"] = texts
+                new_df["id_str"] = list(tweets["id_str"])
+                new_df = new_df.set_index("id_str")
+
+                new_df.to_csv(out_path, sep="\t", mode="a", header=False)
+                checkpoint["out_bytes"][out_path] = os.path.getsize(out_path)
+
+            rows_done += chunk.shape[0]
+            n_classified += tweets.shape[0]
+            checkpoint["inputs"][data_file]["rows_done"] = rows_done
+            _save_checkpoint(checkpoint_path, checkpoint)
+
+    # everything is done, the next run starts from scratch
+    os.remove(checkpoint_path)
+    return n_classified
+
+
+def _load_checkpoint(checkpoint_path: str, out_paths: Dict[str, str], data_files: List[str]) -> Dict:
+
+    fresh = {"inputs": {data_file: {"fingerprint": input_fingerprint(data_file), "rows_done": 0}
+                        for data_file in data_files},
+             "out_bytes": {out_path: 0 for out_path in out_paths.values()}}
+
+    checkpoint = None
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "r") as fin:
+            checkpoint = json.loads(fin.read())
+
+        # only resume if the inputs are the ones we were reading and the
+        # outputs still have everything we wrote to them
+        same_inputs = (checkpoint.get("inputs", {}).keys() == fresh["inputs"].keys() and
+                       all(checkpoint["inputs"][data_file]["fingerprint"] == fresh["inputs"][data_file]["fingerprint"]
+                           for data_file in data_files))
+        outputs_intact = all(out_path in checkpoint.get("out_bytes", {}) and
+                             os.path.exists(out_path) and
+                             os.path.getsize(out_path) >= checkpoint["out_bytes"][out_path]
+                             for out_path in out_paths.values())
+        if not (same_inputs and outputs_intact):
+            checkpoint = None
+
+    if checkpoint is None:
+        checkpoint = fresh
+
+    # throw away anything written after the last checkpoint so a chunk that
+    # was half written when we died doesn't end up in the output twice
+    for out_path in out_paths.values():
+        if os.path.exists(out_path):
+            with open(out_path, "r+b") as fout:
+                fout.truncate(checkpoint["out_bytes"][out_path])
+
+    return checkpoint
+
+
+def _save_checkpoint(checkpoint_path: str, checkpoint: Dict):
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as fout:
+        json.dump(checkpoint, fout)
+    os.replace(tmp_path, checkpoint_path)
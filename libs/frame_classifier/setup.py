@@ -0,0 +1,11 @@
+from setuptools import setup, find_packages
+
+setup(
+    name='frameclassifier',
+    version='0.0.1',
+    url='https://github.com/godzilla-but-nicer/frame-diffusion.git',
+    author='pat wall and Julia Mendelsohn',
+    author_email='patrick.gordon.wall@gmail.com',
+    description='These are the tools that will help us classify the frames',
+    packages=find_packages(),
+)
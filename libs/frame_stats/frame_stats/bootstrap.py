@@ -0,0 +1,534 @@
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from numpy.typing import ArrayLike
+from scipy.stats import norm
+from typing import Callable, Optional, Tuple, Union
+
+
+# batched bootstrap. instead of resampling and evaluating the statistic once
+# per iteration we draw every resample at once and evaluate the statistic
+# along the resample axis. data can be one column or a (n, n_columns) array,
+# in which case every column is resampled with the same rows.
+#
+# when the data only takes a few distinct rows (e.g. binary frame columns) a
+# resample is completely described by how many times each distinct row was
+# drawn, and those counts are exactly multinomial(n, row frequencies), so we
+# draw the counts instead of n indices per resample
+
+
+# largest number of resampled values we hold in memory at once
+MAX_ELEMENTS = 2 ** 24
+
+# use the multinomial shortcut when there are at most this many distinct rows
+MAX_PATTERNS = 256
+
+
+def _mean(samples: np.ndarray, axis: int) -> np.ndarray:
+    return samples.mean(axis=axis)
+
+
+def _entropy(samples: np.ndarray, axis: int) -> np.ndarray:
+    # shannon entropy (in nats) of the distribution of values in each column
+    samples = np.moveaxis(samples, axis, -1)
+    values, codes = np.unique(samples, return_inverse=True)
+    codes = codes.reshape(samples.shape)
+
+    flat = codes.reshape(-1, codes.shape[-1])
+    offsets = np.arange(flat.shape[0])[:, None] * values.shape[0]
+    value_counts = np.bincount((flat + offsets).ravel(),
+                               minlength=flat.shape[0] * values.shape[0])
+    value_counts = value_counts.reshape(samples.shape[:-1] + (values.shape[0],))
+
+    return _entropy_from_counts(value_counts, samples.shape[-1])
+
+
+def _entropy_from_counts(value_counts: np.ndarray, n: int) -> np.ndarray:
+    p = value_counts / n
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return -np.where(p > 0, p * np.log(p), 0.0).sum(axis=-1)
+
+
+# statistics that work on a whole batch of resamples
+VECTORIZED_STATISTICS = {"mean": _mean,
+                         "proportion": _mean,
+                         "entropy": _entropy}
+
+
+def resolve_statistic(statistic: Union[str, Callable]) -> Callable:
+    """
+    Look up a named statistic. Callables are passed through and have to
+    accept an array of resamples and an `axis` keyword like `np.mean` does.
+    """
+    if callable(statistic):
+        return statistic
+    if statistic not in VECTORIZED_STATISTICS:
+        raise ValueError(f"statistic must be callable or in {list(VECTORIZED_STATISTICS)}")
+    return VECTORIZED_STATISTICS[statistic]
+
+
+def bootstrap_indices(n: int,
+                      n_samples: int,
+                      rng: np.random.Generator) -> np.ndarray:
+    """
+    (n_samples, n) matrix of row indices, one resample per row.
+    """
+    return rng.integers(0, n, size=(n_samples, n))
+
+
+def point_estimate(data: ArrayLike, statistic: Union[str, Callable]) -> Union[float, np.ndarray]:
+    """
+    The statistic evaluated on the data itself, one value per column.
+    """
+    data = np.asarray(data)
+    estimate = resolve_statistic(statistic)(data[None], axis=1)[0]
+    return estimate if data.ndim > 1 else float(estimate)
+
+
+def bootstrap_distribution(data: ArrayLike,
+                           statistic: Union[str, Callable] = "mean",
+                           n_samples: int = 10000,
+                           seed: Optional[int] = None,
+                           rng: Optional[np.random.Generator] = None,
+                           shortcut: bool = True,
+                           max_elements: int = MAX_ELEMENTS,
+                           return_se: bool = False) -> Union[np.ndarray, Tuple[np.ndarray, np.ndarray]]:
+    """
+    Bootstrapped values of a statistic.
+
+    Parameters
+    ----------
+    data: ArrayLike
+        (n,) values or a (n, n_columns) array whose rows are resampled together
+    statistic: Union[str, Callable]
+        "mean", "proportion", "entropy" or a function of (resamples, axis)
+    n_samples: int
+        Number of bootstrap resamples
+    seed: int
+        Seed for the random number generator, ignored if `rng` is given
+    rng: np.random.Generator
+        Random number generator to draw from
+    shortcut: bool
+        Whether to draw multinomial counts of the distinct rows instead of
+        indices when there are few distinct rows
+    max_elements: int
+        Largest number of resampled values to hold in memory at once
+    return_se: bool
+        Also return the standard error of the mean within every resample,
+        which studentized intervals need. Only for "mean" and "proportion"
+
+    Returns
+    -------
+    boot_statistics: np.ndarray
+        (n_samples,) for one column of data, (n_samples, n_columns) otherwise
+    boot_se: np.ndarray
+        Standard errors in the same shape, only with `return_se`
+    """
+    if return_se and statistic not in ("mean", "proportion"):
+        raise ValueError("standard errors are only available for 'mean' and 'proportion'")
+
+    if rng is None:
+        rng = np.random.default_rng(seed)
+
+    data = np.asarray(data)
+    one_column = data.ndim == 1
+    table = data[:, None] if one_column else data
+    n = table.shape[0]
+
+    # batches of resamples small enough to keep in memory
+    batch_size = max(1, min(n_samples, max_elements // max(n * table.shape[1], 1)))
+
+    patterns = None
+    if shortcut and not callable(statistic):
+        patterns, inverse = np.unique(table, axis=0, return_inverse=True)
+        if patterns.shape[0] > MAX_PATTERNS:
+            patterns = None
+        else:
+            frequencies = np.bincount(inverse.ravel(), minlength=patterns.shape[0]) / n
+            batch_size = max(1, min(n_samples, max_elements // patterns.shape[0]))
+
+    batches = []
+    se_batches = []
+    for start in range(0, n_samples, batch_size):
+        size = min(batch_size, n_samples - start)
+
+        if patterns is not None:
+            counts = rng.multinomial(n, frequencies, size=size)
+            batches.append(_statistic_from_counts(statistic, counts, patterns, n))
+            if return_se:
+                squares = counts @ (patterns.astype(float) ** 2) / n
+                se_batches.append(_mean_se(batches[-1], squares, n))
+        else:
+            samples = table[bootstrap_indices(n, size, rng)]
+            batches.append(resolve_statistic(statistic)(samples, axis=1))
+            if return_se:
+                se_batches.append(_mean_se(batches[-1], (samples.astype(float) ** 2).mean(axis=1), n))
+
+    boot_statistics = np.concatenate(batches)
+    if one_column:
+        boot_statistics = boot_statistics[:, 0]
+    if not return_se:
+        return boot_statistics
+
+    boot_se = np.concatenate(se_batches)
+    return boot_statistics, boot_se[:, 0] if one_column else boot_se
+
+
+def _mean_se(means: np.ndarray, squares: np.ndarray, n: int) -> np.ndarray:
+    # standard error of the mean from the mean and mean square of a sample
+    variance = np.maximum(squares - means ** 2, 0) * n / max(n - 1, 1)
+    return np.sqrt(variance / n)
+
+
+def mean_se(data: ArrayLike) -> Union[float, np.ndarray]:
+    """
+    Standard error of the mean of each column.
+    """
+    data = np.asarray(data, dtype=float)
+    return data.std(axis=0, ddof=1) / np.sqrt(data.shape[0])
+
+
+def _statistic_from_counts(statistic: str,
+                           counts: np.ndarray,
+                           patterns: np.ndarray,
+                           n: int) -> np.ndarray:
+    # counts is (size, n_patterns), how many times each distinct row was drawn
+    if statistic in ("mean", "proportion"):
+        return counts @ patterns / n
+
+    # entropy: counts of each distinct value per column
+    columns = []
+    for col in range(patterns.shape[1]):
+        _, value_codes = np.unique(patterns[:, col], return_inverse=True)
+        value_counts = counts @ np.eye(value_codes.max() + 1, dtype=counts.dtype)[value_codes]
+        columns.append(_entropy_from_counts(value_counts, n))
+    return np.stack(columns, axis=1)
+
+
+# resampling whole tables. a statistic that only depends on the column sums
+# of the resample (frame diversity, overall frame shares) never needs the
+# resampled rows, only how many times each row was drawn, so we draw those
+# counts and multiply them into the table
+
+def resampled_row_sums(table: np.ndarray,
+                       n_samples: int,
+                       rng: np.random.Generator,
+                       max_elements: int = MAX_ELEMENTS) -> np.ndarray:
+    """
+    (n_samples, n_columns) column sums of bootstrap resamples of the rows.
+    """
+    table = np.asarray(table, dtype=float)
+    n = table.shape[0]
+
+    # few distinct rows, draw counts of the distinct rows
+    patterns, inverse = np.unique(table, axis=0, return_inverse=True)
+    if patterns.shape[0] <= MAX_PATTERNS:
+        frequencies = np.bincount(inverse.ravel(), minlength=patterns.shape[0]) / n
+    else:
+        patterns, frequencies = table, np.full(n, 1 / n)
+
+    batch_size = max(1, min(n_samples, max_elements // patterns.shape[0]))
+    sums = np.zeros((n_samples, table.shape[1]))
+    for start in range(0, n_samples, batch_size):
+        size = min(batch_size, n_samples - start)
+        counts = rng.multinomial(n, frequencies, size=size)
+        sums[start:start + size] = counts @ patterns
+
+    return sums
+
+
+def resampled_tables(table: np.ndarray,
+                     n_samples: int,
+                     rng: np.random.Generator,
+                     max_elements: int = MAX_ELEMENTS):
+    """
+    Yield bootstrap resamples of the rows of `table` one at a time. Indices
+    are drawn in chunks as one matrix, only one chunk is held in memory.
+    """
+    n = table.shape[0]
+    batch_size = max(1, min(n_samples, max_elements // max(n, 1)))
+    for start in range(0, n_samples, batch_size):
+        indices = bootstrap_indices(n, min(batch_size, n_samples - start), rng)
+        for rows in indices:
+            yield table[rows]
+
+
+# jackknife leave one out values for the bca acceleration constant. rows
+# with the same values give the same leave one out statistic, so we only
+# evaluate it once per distinct row (twice for a binary column) and results
+# are cached by the contents of the data so repeated intervals on the same
+# data don't redo it
+
+JACKKNIFE_CACHE_SIZE = 128
+_jackknife_cache = OrderedDict()
+
+
+def jackknife_statistics(data: ArrayLike,
+                         statistic: Union[str, Callable],
+                         vectorized: Optional[bool] = None,
+                         block_size: int = 256) -> np.ndarray:
+    """
+    Leave one out values of the statistic.
+
+    Parameters
+    ----------
+    data: ArrayLike
+        (n,) values or a (n, n_columns) array
+    statistic: Union[str, Callable]
+        A named statistic, a vectorized function of (samples, axis), or a
+        function of one sample
+    vectorized: bool
+        Whether a callable statistic takes (samples, axis). Named statistics
+        always are, callables are assumed not to be
+    block_size: int
+        Number of leave one out samples to evaluate at once
+
+    Returns
+    -------
+    jackknife: np.ndarray
+        (n,) or (n, n_columns) statistic with row i left out
+    """
+    data = np.asarray(data)
+    if vectorized is None:
+        vectorized = not callable(statistic)
+
+    key = (hashlib.sha1(np.ascontiguousarray(data).tobytes()).hexdigest(),
+           data.shape, data.dtype.str, statistic, vectorized)
+    if key in _jackknife_cache:
+        _jackknife_cache.move_to_end(key)
+        return _jackknife_cache[key]
+
+    table = data[:, None] if data.ndim == 1 else data
+    n = table.shape[0]
+
+    if statistic in ("mean", "proportion"):
+        # closed form
+        jackknife = (table.sum(axis=0) - table) / (n - 1)
+
+    else:
+        patterns, first_rows, inverse = np.unique(table, axis=0, return_index=True,
+                                                  return_inverse=True)
+        inverse = inverse.ravel()
+        keep = np.arange(n - 1)
+
+        pattern_values = []
+        for start in range(0, first_rows.shape[0], block_size):
+            dropped = first_rows[start:start + block_size]
+            # row j of a leave one out sample is j, or j + 1 from the dropped row on
+            loo_rows = keep[None, :] + (keep[None, :] >= dropped[:, None])
+
+            if vectorized:
+                pattern_values.append(resolve_statistic(statistic)(table[loo_rows], axis=1))
+            else:
+                samples = data[loo_rows]
+                pattern_values.append(np.array([statistic(sample) for sample in samples]))
+
+        pattern_values = np.concatenate(pattern_values)
+        jackknife = pattern_values[inverse]
+
+    if data.ndim == 1 and jackknife.ndim > 1:
+        jackknife = jackknife[:, 0]
+
+    _jackknife_cache[key] = jackknife
+    if len(_jackknife_cache) > JACKKNIFE_CACHE_SIZE:
+        _jackknife_cache.popitem(last=False)
+
+    return jackknife
+
+
+def acceleration(jackknife: np.ndarray) -> Union[float, np.ndarray]:
+    """
+    BCa acceleration constant from leave one out statistics.
+    """
+    deviations = jackknife.mean(axis=0) - jackknife
+    numerator = (deviations ** 3).sum(axis=0)
+    denominator = 6 * (deviations ** 2).sum(axis=0) ** 1.5
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(denominator > 0, numerator / denominator, 0.0)
+
+
+def bca_ci(boot_estimates: ArrayLike,
+           alpha: float,
+           point_estimate: Union[float, np.ndarray],
+           jackknife: np.ndarray) -> Tuple[float, float]:
+    """
+    Bias corrected and accelerated interval. Unlike the residual interval
+    it stays inside the range of the bootstrapped values, so proportions
+    near zero don't get negative lower bounds.
+    """
+    boot_estimates = np.asarray(boot_estimates)
+    n_samples = boot_estimates.shape[0]
+
+    # bias correction, ties count half so discrete statistics aren't pushed
+    # to one side
+    below = (boot_estimates < point_estimate).mean(axis=0)
+    ties = (boot_estimates == point_estimate).mean(axis=0)
+    proportion = np.clip(below + ties / 2, 1 / (n_samples + 1), n_samples / (n_samples + 1))
+    z0 = norm.ppf(proportion)
+
+    a = acceleration(jackknife)
+    bounds = []
+    for q in (alpha / 2, 1 - alpha / 2):
+        z = z0 + norm.ppf(q)
+        adjusted = norm.cdf(z0 + z / (1 - a * z))
+        bounds.append(_column_quantiles(boot_estimates, adjusted))
+
+    return tuple(bounds)
+
+
+def studentized_ci(boot_estimates: ArrayLike,
+                   boot_se: ArrayLike,
+                   alpha: float,
+                   point_estimate: Union[float, np.ndarray],
+                   se: Union[float, np.ndarray]) -> Tuple[float, float]:
+    """
+    Bootstrap-t interval. Resamples with no spread (e.g. all zeros) have no
+    t statistic and are left out.
+    """
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = np.where(np.asarray(boot_se) > 0,
+                     (np.asarray(boot_estimates) - point_estimate) / boot_se,
+                     np.nan)
+
+    lower = point_estimate - np.nanquantile(t, 1 - (alpha / 2), axis=0) * se
+    upper = point_estimate - np.nanquantile(t, alpha / 2, axis=0) * se
+
+    return (lower, upper)
+
+
+def _column_quantiles(boot_estimates: np.ndarray, q: Union[float, np.ndarray]):
+    # a different quantile for every column
+    if boot_estimates.ndim == 1:
+        return np.quantile(boot_estimates, float(q))
+    return np.array([np.quantile(boot_estimates[:, col], q[col])
+                     for col in range(boot_estimates.shape[1])])
+
+
+# parallel replicates. the replicates are cut into fixed blocks and block b
+# always gets the b-th child of the seed sequence, so the draws don't depend
+# on which worker runs which block and the result is bit for bit the same
+# for any number of workers. early stopping is only checked at fixed block
+# counts for the same reason
+
+def quantile_mc_error(boot_estimates: ArrayLike,
+                      q: float,
+                      z: float = 1.96) -> Union[float, np.ndarray]:
+    """
+    Monte Carlo error of the q quantile of the replicates, half the distance
+    between the order statistics bracketing it at confidence level `z`.
+    """
+    boot_estimates = np.sort(np.asarray(boot_estimates, dtype=float), axis=0)
+    boot_estimates = boot_estimates[~np.isnan(boot_estimates).reshape(boot_estimates.shape[0], -1).any(axis=1)]
+    n = boot_estimates.shape[0]
+    if n < 2:
+        return np.inf
+
+    spread = z * np.sqrt(n * q * (1 - q))
+    lo = int(np.clip(np.floor(n * q - spread), 0, n - 1))
+    hi = int(np.clip(np.ceil(n * q + spread), 0, n - 1))
+    return (boot_estimates[hi] - boot_estimates[lo]) / 2
+
+
+def parallel_replicates(replicate: Callable,
+                        n_replicates: int,
+                        args: tuple = (),
+                        seed: Optional[int] = None,
+                        n_workers: int = 1,
+                        block_size: int = 100,
+                        tolerance: Optional[float] = None,
+                        alpha: float = 0.05,
+                        check_every: int = 10) -> np.ndarray:
+    """
+    Run `replicate(rng, size, *args)`, which returns an array of `size`
+    replicates, over blocks of `block_size` replicates on a process pool.
+
+    Parameters
+    ----------
+    replicate: Callable
+        Function producing a block of replicates, has to be picklable (module
+        level) when `n_workers` > 1
+    n_replicates: int
+        Maximum number of replicates
+    args: tuple
+        Extra arguments for `replicate`
+    seed: int
+        Root seed, block b uses `SeedSequence(seed).spawn(n_blocks)[b]`
+    n_workers: int
+        Number of processes, 1 runs everything here
+    block_size: int
+        Replicates per block
+    tolerance: float
+        Stop once the Monte Carlo error of both interval endpoints (the
+        alpha / 2 and 1 - alpha / 2 quantiles) is below this
+    alpha: float
+        Significance of the interval the endpoints belong to
+    check_every: int
+        Number of blocks between early stopping checks
+
+    Returns
+    -------
+    replicates: np.ndarray
+        The replicates in block order
+    """
+    n_blocks = -(-n_replicates // block_size)
+    sizes = [min(block_size, n_replicates - b * block_size) for b in range(n_blocks)]
+    block_seeds = np.random.SeedSequence(seed).spawn(n_blocks)
+
+    def converged(blocks: list) -> bool:
+        if tolerance is None or len(blocks) % check_every != 0:
+            return False
+        replicates = np.concatenate(blocks)
+        errors = [quantile_mc_error(replicates, q) for q in (alpha / 2, 1 - alpha / 2)]
+        return all(np.all(np.asarray(error) <= tolerance) for error in errors)
+
+    blocks = []
+    if n_workers == 1:
+        for b in range(n_blocks):
+            blocks.append(np.asarray(replicate(np.random.default_rng(block_seeds[b]), sizes[b], *args)))
+            if converged(blocks):
+                break
+
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            # keep a few blocks queued per worker, results are used in block order
+            pending = {}
+            next_block = 0
+            while len(blocks) < n_blocks:
+                while next_block < n_blocks and len(pending) < 2 * n_workers:
+                    pending[next_block] = pool.submit(_run_block, replicate, block_seeds[next_block],
+                                                      sizes[next_block], args)
+                    next_block += 1
+
+                blocks.append(np.asarray(pending.pop(len(blocks)).result()))
+                if converged(blocks):
+                    for future in pending.values():
+                        future.cancel()
+                    break
+
+    return np.concatenate(blocks)
+
+
+def _run_block(replicate: Callable,
+               block_seed: np.random.SeedSequence,
+               size: int,
+               args: tuple) -> np.ndarray:
+    return replicate(np.random.default_rng(block_seed), size, *args)
+
+
+def bootstrap_block(rng: np.random.Generator,
+                    size: int,
+                    data: np.ndarray,
+                    statistic: Union[str, Callable],
+                    return_se: bool = False) -> np.ndarray:
+    """
+    Block of bootstrap replicates for `parallel_replicates`. Callable
+    statistics take one sample like the ones `bootstrap_ci` loops over.
+    """
+    if not callable(statistic):
+        boot = bootstrap_distribution(data, statistic, size, rng=rng, return_se=return_se)
+        # stack the standard errors behind the estimates so they travel together
+        return np.stack(boot, axis=1) if return_se else boot
+
+    return np.array([statistic(rng.choice(data, size=data.shape, replace=True))
+                     for _ in range(size)])
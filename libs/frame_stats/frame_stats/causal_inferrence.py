@@ -1,6 +1,8 @@
 import numpy as np
 import pandas as pd
-from typing import List, Dict, Optional
+import scipy.sparse as sp
+from numpy.typing import ArrayLike
+from typing import List, Dict, NamedTuple, Optional, Union
 
 import frame_stats.time_series as ts
 
@@ -137,3 +139,342 @@ def construct_tweet_alter_influence_pairs(user: str,
         return user_frame_pairs
     else:
         return None
+
+
+# array versions of the functions above. instead of walking the time series
+# with iterrows and .loc we line the tweets up with the time series once
+# using searchsorted and pull out every exposure with one fancy index
+
+class InfluencePairs(NamedTuple):
+    """
+    Dense exposure/outcome pairs. Row i of `exposure` holds the frames seen at
+    time t and row i of `outcome` the frames cued at time t+1.
+    """
+    exposure: np.ndarray
+    outcome: np.ndarray
+    dates: np.ndarray
+    ids: Optional[np.ndarray] = None
+
+
+def as_utc_datetime64(time_stamps: ArrayLike) -> np.ndarray:
+    # tz aware and naive time stamps both come out as naive utc datetime64
+    return pd.DatetimeIndex(pd.to_datetime(time_stamps, utc=True)).tz_localize(None).values
+
+
+def time_series_arrays(user_time_series: pd.DataFrame) -> tuple:
+    """
+    Split a frame time series dataframe (indexed by time stamp) into the
+    frame matrix and an array of utc datetime64 dates.
+    """
+    return (user_time_series.values.astype(float),
+            as_utc_datetime64(user_time_series.index))
+
+
+def lookup_periods(dates: np.ndarray, targets: np.ndarray) -> np.ndarray:
+    """
+    Row of `dates` matching each of `targets` exactly, -1 if there isn't one.
+    `dates` must be sorted.
+    """
+    if dates.shape[0] == 0:
+        return np.full(np.shape(targets), -1)
+
+    positions = np.searchsorted(dates, targets)
+    positions = np.minimum(positions, dates.shape[0] - 1)
+    found = dates[positions] == targets
+
+    return np.where(found, positions, -1)
+
+
+def construct_frame_pairs_array(frame_matrix: np.ndarray,
+                                dates: np.ndarray,
+                                time_delta: str = "1D") -> InfluencePairs:
+    """
+    Array version of `construct_frame_pairs`. Pairs every period with the
+    period `time_delta` later when both of them cued at least one frame.
+    """
+    frame_matrix = np.asarray(frame_matrix, dtype=float)
+    next_rows = lookup_periods(dates, dates + pd.Timedelta(time_delta).to_timedelta64())
+
+    active = frame_matrix.sum(axis=1) > 0
+    keep = (next_rows >= 0) & active & active[next_rows]
+
+    return InfluencePairs(exposure=frame_matrix[keep],
+                          outcome=frame_matrix[next_rows[keep]],
+                          dates=dates[next_rows[keep]])
+
+
+def tweet_exposure_array(frame_matrix: np.ndarray,
+                         dates: np.ndarray,
+                         tweet_times: ArrayLike,
+                         time_delta: str = "1D") -> tuple:
+    """
+    Frames in the period `time_delta` before the day each tweet was posted.
+
+    Returns
+    -------
+    exposure: np.ndarray
+        (n_tweets, n_frames) exposures, zero where the period is missing
+    found: np.ndarray
+        boolean mask of tweets whose period is in the time series
+    """
+    frame_matrix = np.asarray(frame_matrix, dtype=float)
+    posting_days = as_utc_datetime64(tweet_times).astype("datetime64[D]").astype(dates.dtype)
+    rows = lookup_periods(dates, posting_days - pd.Timedelta(time_delta).to_timedelta64())
+
+    found = rows >= 0
+    exposure = np.zeros((rows.shape[0], frame_matrix.shape[1]))
+    exposure[found] = frame_matrix[rows[found]]
+
+    return exposure, found
+
+
+def construct_tweet_self_influence_arrays(user_frame_matrix: np.ndarray,
+                                          dates: np.ndarray,
+                                          tweet_times: ArrayLike,
+                                          tweet_frames: np.ndarray,
+                                          tweet_ids: Optional[ArrayLike] = None,
+                                          time_delta: str = "1D") -> Optional[InfluencePairs]:
+    """
+    Array version of `construct_tweet_self_influence_pairs`. Takes one
+    user's frame time series as a matrix plus the time stamps and frames of
+    their tweets and keeps the tweets with frames cued in the previous period.
+    """
+    exposure, found = tweet_exposure_array(user_frame_matrix, dates, tweet_times, time_delta)
+
+    return _exposed_tweet_pairs(exposure, found, tweet_times, tweet_frames, tweet_ids)
+
+
+def construct_tweet_alter_influence_arrays(alter_frame_matrices: Union[np.ndarray, List[np.ndarray]],
+                                           dates: np.ndarray,
+                                           tweet_times: ArrayLike,
+                                           tweet_frames: np.ndarray,
+                                           tweet_ids: Optional[ArrayLike] = None,
+                                           time_delta: str = "1D") -> Optional[InfluencePairs]:
+    """
+    Array version of `construct_tweet_alter_influence_pairs`. The alter
+    time series (all on the same `dates`) are summed and then treated like
+    the user's own time series.
+    """
+    if len(alter_frame_matrices) < 1:
+        return None
+
+    # a list of per alter matrices or a (n_alters, n_dates, n_frames) array
+    if isinstance(alter_frame_matrices, np.ndarray):
+        combined = alter_frame_matrices.sum(axis=0)
+    else:
+        shape = np.shape(alter_frame_matrices[0])
+        combined = np.sum([m for m in alter_frame_matrices if np.shape(m) == shape], axis=0)
+
+    exposure, found = tweet_exposure_array(combined, dates, tweet_times, time_delta)
+
+    return _exposed_tweet_pairs(exposure, found, tweet_times, tweet_frames, tweet_ids)
+
+
+def _exposed_tweet_pairs(exposure: np.ndarray,
+                         found: np.ndarray,
+                         tweet_times: ArrayLike,
+                         tweet_frames: np.ndarray,
+                         tweet_ids: Optional[ArrayLike]) -> Optional[InfluencePairs]:
+
+    # same rule as the dict versions, only keep tweets with prior frames
+    keep = found & (exposure.sum(axis=1) > 0)
+    if not keep.any():
+        return None
+
+    return InfluencePairs(exposure=exposure[keep],
+                          outcome=np.asarray(tweet_frames)[keep],
+                          dates=as_utc_datetime64(tweet_times)[keep],
+                          ids=None if tweet_ids is None else np.asarray(tweet_ids)[keep])
+
+
+# exposure to alters for every user and period at once. with the frame
+# counts as a (n_users, n_periods, n_frames) tensor and the mention network
+# as a sparse (n_users, n_users) matrix, summing each user's alters is one
+# sparse-dense product and the window is a difference of cumulative sums
+
+def rolling_window_sum(counts: np.ndarray,
+                       window: int = 1,
+                       lag: int = 1) -> np.ndarray:
+    """
+    Sum of the `window` periods ending `lag` periods before each period,
+    i.e. period t gets periods t - lag - window + 1 to t - lag. Periods
+    before the start of the time series count as zero.
+
+    Parameters
+    ----------
+    counts: np.ndarray
+        (n_users, n_periods, n_frames) frame counts
+    window: int
+        Number of periods to sum over
+    lag: int
+        How many periods before t the window ends
+
+    Returns
+    -------
+    windowed: np.ndarray
+        (n_users, n_periods, n_frames) float array of window sums
+    """
+    counts = np.asarray(counts, dtype=float)
+    return _window_sum(counts, 0, np.arange(counts.shape[1]), window, lag)
+
+
+def alter_exposure(counts: np.ndarray,
+                   adjacency: sp.spmatrix,
+                   window: int = 1,
+                   lag: int = 1,
+                   weighted: bool = True,
+                   chunk_periods: Optional[int] = None,
+                   out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Frames every user's alters cued in the window before each period.
+    `adjacency[i, j]` is how much user j's frames count towards user i's
+    exposure, e.g. `MentionGraph.adjacency_for(tensor.users)`.
+
+    Parameters
+    ----------
+    counts: np.ndarray
+        (n_users, n_periods, n_frames) frame counts, can be a memmap
+    adjacency: sp.spmatrix
+        (n_users, n_users) matrix with rows and columns in the order of `counts`
+    window: int
+        Number of periods to sum over
+    lag: int
+        How many periods before t the window ends
+    weighted: bool
+        Weight each alter by its edge weight, otherwise every alter counts once
+    chunk_periods: int
+        Number of output periods to compute at a time, bounds the memory used
+        on top of `out`
+    out: np.ndarray
+        Optional (n_users, n_periods, n_frames) array (e.g. a memmap) to write to
+
+    Returns
+    -------
+    exposure: np.ndarray
+        (n_users, n_periods, n_frames) alter exposure
+    """
+    n_users, n_periods, n_frames = counts.shape
+    adjacency = sp.csr_matrix(adjacency, dtype=float)
+    if not weighted:
+        adjacency.data = np.ones_like(adjacency.data)
+
+    if out is None:
+        out = np.zeros((n_users, n_periods, n_frames))
+    if chunk_periods is None:
+        chunk_periods = n_periods
+
+    for start in range(0, n_periods, chunk_periods):
+        end = min(start + chunk_periods, n_periods)
+
+        # input periods any of these output periods can see
+        lo = min(max(start - lag - window + 1, 0), n_periods)
+        hi = min(max(end - lag, lo), n_periods)
+
+        block = np.asarray(counts[:, lo:hi], dtype=float).reshape(n_users, -1)
+        mixed = (adjacency @ block).reshape(n_users, hi - lo, n_frames)
+        out[:, start:end] = _window_sum(mixed, lo, np.arange(start, end), window, lag)
+
+    return out
+
+
+def _window_sum(x: np.ndarray,
+                x_start: int,
+                periods: np.ndarray,
+                window: int,
+                lag: int) -> np.ndarray:
+    # x holds periods x_start onwards. cumulative[k] is the sum of the first
+    # k of them so a window is the difference of two entries
+    cumulative = np.zeros((x.shape[0], x.shape[1] + 1, x.shape[2]))
+    np.cumsum(x, axis=1, out=cumulative[:, 1:])
+
+    upper = np.clip(periods - lag + 1 - x_start, 0, x.shape[1])
+    lower = np.clip(periods - lag - window + 1 - x_start, 0, x.shape[1])
+    return cumulative[:, upper] - cumulative[:, lower]
+
+
+def lookup_tweet_exposure(exposure: np.ndarray,
+                          periods: ArrayLike,
+                          user_rows: ArrayLike,
+                          tweet_times: ArrayLike) -> tuple:
+    """
+    Row of an exposure tensor for each tweet, picked by the tweet's user row
+    and the period the tweet was posted in.
+
+    Returns
+    -------
+    tweet_exposure: np.ndarray
+        (n_tweets, n_frames) exposures, zero where the user or period is missing
+    found: np.ndarray
+        boolean mask of tweets we found a user and period for
+    """
+    dates = as_utc_datetime64(periods)
+    posting_days = as_utc_datetime64(tweet_times).astype("datetime64[D]").astype(dates.dtype)
+    period_rows = lookup_periods(dates, posting_days)
+    user_rows = np.asarray(user_rows)
+
+    found = (period_rows >= 0) & (user_rows >= 0)
+    tweet_exposure = np.zeros((found.shape[0], exposure.shape[2]))
+    tweet_exposure[found] = exposure[user_rows[found], period_rows[found]]
+
+    return tweet_exposure, found
+
+
+def tweet_window_exposure(counts: np.ndarray,
+                          periods: ArrayLike,
+                          user_rows: ArrayLike,
+                          tweet_times: ArrayLike,
+                          window: int = 1,
+                          lag: int = 1,
+                          adjacency: Optional[sp.spmatrix] = None,
+                          weighted: bool = True) -> tuple:
+    """
+    Self exposure (`lookup_tweet_exposure(rolling_window_sum(counts, ...))`)
+    or, with `adjacency`, alter exposure (`lookup_tweet_exposure(
+    alter_exposure(counts, adjacency, ...))`) of each tweet, computed only
+    at the (user, period) cells the tweets fall in. Only the window rows of
+    the users and alters involved are read from `counts`, so nothing of the
+    size of the whole tensor is ever allocated.
+
+    Returns
+    -------
+    tweet_exposure: np.ndarray
+        (n_tweets, n_frames) exposures, zero where the user or period is missing
+    found: np.ndarray
+        boolean mask of tweets we found a user and period for
+    """
+    n_users, n_periods, n_frames = counts.shape
+    if adjacency is None:
+        adjacency = sp.identity(n_users, format="csr")
+    adjacency = sp.csr_matrix(adjacency, dtype=float)
+    if not weighted:
+        adjacency.data = np.ones_like(adjacency.data)
+
+    dates = as_utc_datetime64(periods)
+    posting_days = as_utc_datetime64(tweet_times).astype("datetime64[D]").astype(dates.dtype)
+    period_rows = lookup_periods(dates, posting_days)
+    user_rows = np.asarray(user_rows)
+    found = (period_rows >= 0) & (user_rows >= 0)
+
+    # every distinct (user, period) cell once, however many tweets are in it
+    cells, inverse = np.unique(np.column_stack((user_rows[found], period_rows[found])),
+                               axis=0, return_inverse=True)
+    cell_exposure = np.zeros((cells.shape[0], n_frames))
+
+    for period in np.unique(cells[:, 1]):
+        lo = min(max(period - lag - window + 1, 0), n_periods)
+        hi = min(max(period - lag + 1, lo), n_periods)
+        if hi == lo:
+            continue
+
+        at = np.flatnonzero(cells[:, 1] == period)
+        mixing = adjacency[cells[at, 0]]
+        alters = np.unique(mixing.indices)
+        if alters.shape[0] == 0:
+            continue
+
+        window_counts = np.asarray(counts[alters, lo:hi], dtype=float).sum(axis=1)
+        cell_exposure[at] = mixing[:, alters] @ window_counts
+
+    tweet_exposure = np.zeros((found.shape[0], n_frames))
+    tweet_exposure[found] = cell_exposure[inverse.ravel()]
+    return tweet_exposure, found
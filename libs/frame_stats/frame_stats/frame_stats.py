@@ -5,15 +5,23 @@ from functools import reduce
 from numpy.typing import ArrayLike
 from numbers import Number
 from tqdm import tqdm
-from typing import Callable, Tuple, Dict
+from typing import Callable, Tuple, Dict, Union
+
+from frame_stats.bootstrap import (bootstrap_distribution, point_estimate, jackknife_statistics,
+                                   bca_ci, studentized_ci, mean_se,
+                                   resampled_row_sums, resampled_tables,
+                                   parallel_replicates, bootstrap_block)
 
 
 def bootstrap_ci(data: ArrayLike,
-                 statistic: Callable[[ArrayLike], float],
+                 statistic: Union[str, Callable[[ArrayLike], float]],
                  n_samples: int,
                  alpha: float,
                  method: str = "residual",
-                 seed: int = None) -> Dict:
+                 seed: int = None,
+                 n_workers: int = None,
+                 tolerance: float = None,
+                 block_size: int = 1000) -> Dict:
     """
     Generate a bootstrapped confidence interval and point estimate for the
     statistic from the data.
@@ -21,18 +29,34 @@ def bootstrap_ci(data: ArrayLike,
     Parameters
     ----------
     data: ArrayLike[Number]
-        The data from which to calculate the statistic
-    statistic: Callable[[ArrayLike], float]
+        The data from which to calculate the statistic. With a named statistic
+        this can also be a (n, n_columns) array, every column is bootstrapped
+        from the same resamples
+    statistic: Union[str, Callable[[ArrayLike], float]]
         The value we want to estimate from the data provided as a function that
-        takes an array and returns a float
+        takes an array and returns a float, or one of "mean", "proportion" and
+        "entropy" to draw all of the resamples at once (see
+        `frame_stats.bootstrap`)
     n_samples: int
         Number of bootstrapped samples to use to estimate the confidence interval
     alpha: float
         Sognifigance. Probability of type I error
     method: str ()
-        Which confidence interval approach to use
+        Which confidence interval approach to use. One of "percentile",
+        "residual", "bca" (bias corrected and accelerated) or "studentized"
+        (only for "mean" and "proportion")
     seed: int
         Seed for random number generator
+    n_workers: int
+        Split the samples into blocks of `block_size` and run them on this
+        many processes (see `frame_stats.bootstrap.parallel_replicates`).
+        Results only depend on the seed, not the number of workers. Callable
+        statistics have to be picklable for more than one worker
+    tolerance: float
+        Stop drawing samples once the Monte Carlo error of the percentile
+        endpoints is below this. Implies the block runner
+    block_size: int
+        Samples per block for the block runner
 
 
     Returns
@@ -40,23 +64,55 @@ def bootstrap_ci(data: ArrayLike,
     result: dict
         Contains three fields: "estimate", the estimate of our statistic,
         "lower", the lower bound of our confidence interval, and "upper", the
-        upper bound of our confidence interval
+        upper bound of our confidence interval. Arrays with one value per
+        column for multi-column data
     """
 
     # the value we will return
     result = {}
 
-    # calculate the point estimate
-    result["estimate"] = statistic(data)
+    if method == "studentized" and statistic not in ("mean", "proportion"):
+        raise ValueError("studentized intervals need statistic 'mean' or 'proportion'")
 
-    # now the long part
-    rng = np.random.default_rng(seed)
-    boots_statistic = np.zeros(n_samples)
+    if n_workers is not None or tolerance is not None:
+        # blocks with their own seeds, possibly on several processes
+        if isinstance(statistic, str):
+            result["estimate"] = point_estimate(data, statistic)
+        else:
+            result["estimate"] = statistic(data)
+
+        boots_statistic = parallel_replicates(bootstrap_block,
+                                              n_samples,
+                                              args=(np.asarray(data), statistic,
+                                                    method == "studentized"),
+                                              seed=seed,
+                                              n_workers=n_workers or 1,
+                                              block_size=block_size,
+                                              tolerance=tolerance,
+                                              alpha=alpha)
+        if method == "studentized":
+            boots_statistic, boots_se = boots_statistic[:, 0], boots_statistic[:, 1]
+
+    elif isinstance(statistic, str):
+        # batched, no python loop over the samples
+        result["estimate"] = point_estimate(data, statistic)
+        boots_statistic = bootstrap_distribution(data, statistic, n_samples, seed=seed,
+                                                 return_se=method == "studentized")
+        if method == "studentized":
+            boots_statistic, boots_se = boots_statistic
+
+    else:
+        # calculate the point estimate
+        result["estimate"] = statistic(data)
+
+        # now the long part
+        rng = np.random.default_rng(seed)
+        boots_statistic = np.zeros(n_samples)
 
-    for s in tqdm(range(n_samples)):
-        boot_sample = rng.choice(data, size=data.shape, replace=True)
+        for s in tqdm(range(n_samples)):
+            boot_sample = rng.choice(data, size=data.shape, replace=True)
 
-        boots_statistic[s] = statistic(boot_sample)
+            boots_statistic[s] = statistic(boot_sample)
 
     if method == "percentile":
         result["lower"], result["upper"] = percentile_ci(boots_statistic,
@@ -65,9 +121,22 @@ def bootstrap_ci(data: ArrayLike,
         result["lower"], result["upper"] = residual_ci(boots_statistic,
                                                        alpha,
                                                        result["estimate"])
-    # want to implement BCA also
+    elif method == "bca":
+        # leave one out values are cached so repeat calls on the same data
+        # skip this step
+        jackknife = jackknife_statistics(data, statistic)
+        result["lower"], result["upper"] = bca_ci(boots_statistic,
+                                                  alpha,
+                                                  result["estimate"],
+                                                  jackknife)
+    elif method == "studentized":
+        result["lower"], result["upper"] = studentized_ci(boots_statistic,
+                                                          boots_se,
+                                                          alpha,
+                                                          result["estimate"],
+                                                          mean_se(data))
     else:
-        raise ValueError("method must be in  ['percentile', 'residual']")
+        raise ValueError("method must be in  ['percentile', 'residual', 'bca', 'studentized']")
 
     return result
 
@@ -77,30 +146,76 @@ def bootstrap_ci_multivariate(df,
                                sample_axis: str,
                                alpha: float,
                                method: str = "residual",
-                               seed: int = None) -> Dict:
+                               seed: int = None,
+                               sum_statistic: Callable[[np.ndarray], np.ndarray] = None) -> Dict:
+    """
+    Bootstrapped confidence interval for a statistic of a whole dataframe,
+    resampling its rows or columns.
+
+    The dataframe is converted to an array once and resamples are taken by
+    index. If the statistic only depends on the column sums of the resample
+    (e.g. frame diversity), pass `sum_statistic`, a vectorized version taking
+    a (n_samples, n_columns) array of column sums and returning one value per
+    row, and the resampled rows are never built at all.
+
+    Parameters
+    ----------
+    df: pd.DataFrame
+        The data from which to calculate the statistic
+    statistic: Callable[[pd.DataFrame], float]
+        The value we want to estimate from the data
+    n_samples: int
+        Number of bootstrapped samples to use to estimate the confidence interval
+    sample_axis: str
+        "rows" or "columns", what to resample
+    alpha: float
+        Sognifigance. Probability of type I error
+    method: str
+        "percentile" or "residual"
+    seed: int
+        Seed for random number generator
+    sum_statistic: Callable[[np.ndarray], np.ndarray]
+        Optional vectorized statistic of the column sums, rows only
+
+    Returns
+    -------
+    result: dict
+        "estimate", "lower" and "upper" like `bootstrap_ci`
+    """
     
     result = {}
     result["estimate"] = statistic(df)
 
-    # empty arrays for bootstrapped stats
-    boot_statistics = np.zeros(n_samples)
-    
     # check how to sample
     rng = np.random.default_rng(seed)
     if sample_axis == "rows":
-        sample_size = df.shape[0]
+        table = df.values
+        labels = df.columns
 
     elif sample_axis == "columns":
-        sample_size = df.shape[1]
+        table = df.values.T
+        labels = df.index
     
     else:
         raise ValueError("sample_axis must be in ['rows', 'columns;]")
 
-    # run the bootstrapping
-    for s in tqdm(range(n_samples)):
+    if sum_statistic is not None:
+        if sample_axis != "rows":
+            raise ValueError("sum_statistic only works with sample_axis='rows'")
+        boot_statistics = sum_statistic(resampled_row_sums(table, n_samples, rng))
 
-        boot_sample = df.sample(n=sample_size, axis=sample_axis, replace=True)
-        boot_statistics[s] = statistic(boot_sample)
+    else:
+        # empty arrays for bootstrapped stats
+        boot_statistics = np.zeros(n_samples)
+
+        # run the bootstrapping
+        for s, boot_table in enumerate(tqdm(resampled_tables(table, n_samples, rng),
+                                            total=n_samples)):
+            if sample_axis == "rows":
+                boot_sample = pd.DataFrame(boot_table, columns=labels, copy=False)
+            else:
+                boot_sample = pd.DataFrame(boot_table.T, index=labels, copy=False)
+            boot_statistics[s] = statistic(boot_sample)
 
     
     if method == "percentile":
@@ -120,8 +235,9 @@ def bootstrap_ci_multivariate(df,
 def percentile_ci(boot_estimates: ArrayLike,
                   alpha: float) -> Tuple[float, float]:
 
-    lower = np.quantile(boot_estimates, alpha / 2)
-    upper = np.quantile(boot_estimates, 1 - (alpha / 2))
+    # quantiles over the sample axis so multi-column bootstraps work too
+    lower = np.quantile(boot_estimates, alpha / 2, axis=0)
+    upper = np.quantile(boot_estimates, 1 - (alpha / 2), axis=0)
 
     return (lower, upper)
 
@@ -130,8 +246,8 @@ def residual_ci(boot_estimates: ArrayLike,
                 alpha: float,
                 point_estimate: float) -> Tuple[float, float]:
 
-    lower = 2 * point_estimate - np.quantile(boot_estimates, 1 - (alpha / 2))
-    upper = 2 * point_estimate - np.quantile(boot_estimates, alpha / 2)
+    lower = 2 * point_estimate - np.quantile(boot_estimates, 1 - (alpha / 2), axis=0)
+    upper = 2 * point_estimate - np.quantile(boot_estimates, alpha / 2, axis=0)
 
     return (lower, upper)
 
@@ -0,0 +1,138 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import Iterable, Iterator, List
+
+from frame_stats.time_series import FrameTimeSeries
+
+
+# on disk layout of the user x period x frame tensor:
+#   counts.npy   (n_users, n_periods, n_frames) array, memory mapped on read
+#   users.txt    one screen name per line in row order
+#   periods.npy  utc datetime64 start of each period
+#   frames.json  frame names in column order
+
+def save_frame_tensor(path: str,
+                      frame_time_series: FrameTimeSeries,
+                      dtype=np.uint16):
+    """
+    Write a FrameTimeSeries (dense or sparse) to `path` as a memory mappable
+    tensor. Sparse counts are densified one user at a time so we never hold
+    more than one copy of the data in memory. `dtype` is widened if the
+    largest count doesn't fit in it.
+    """
+    os.makedirs(path, exist_ok=True)
+
+    # a busy account can go past 65535 tweets in a period, don't let the
+    # counts wrap around
+    max_count = frame_time_series.counts.max() if np.prod(frame_time_series.counts.shape) > 0 else 0
+    if max_count > np.iinfo(dtype).max:
+        dtype = np.promote_types(dtype, np.min_scalar_type(int(max_count)))
+
+    n_users = frame_time_series.users.shape[0]
+    shape = (n_users, frame_time_series.periods.shape[0], len(frame_time_series.frames))
+    counts = np.lib.format.open_memmap(os.path.join(path, "counts.npy"),
+                                       mode="w+", dtype=dtype, shape=shape)
+    for i in range(n_users):
+        counts[i] = frame_time_series.user_frame_matrix(i)
+    counts.flush()
+    del counts
+
+    with open(os.path.join(path, "users.txt"), "w") as fout:
+        for user in frame_time_series.users:
+            fout.write(f"{user}\n")
+
+    periods = pd.DatetimeIndex(frame_time_series.periods).tz_convert("UTC").tz_localize(None)
+    np.save(os.path.join(path, "periods.npy"), periods.values)
+
+    with open(os.path.join(path, "frames.json"), "w") as fout:
+        json.dump(list(frame_time_series.frames), fout)
+
+
+class FrameTensor:
+    """
+    Read only view of a tensor written by `save_frame_tensor`. The counts
+    stay on disk and are paged in as they are sliced, so worker processes
+    that open the same tensor share one copy of the data through the page
+    cache.
+
+    It also behaves like the old `{screen_name: DataFrame}` time series hash
+    (`tensor[user]`, `user in tensor`) for code that wants a DataFrame.
+
+    Parameters
+    ----------
+    path: str
+        Directory the tensor was saved to
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.counts = np.load(os.path.join(path, "counts.npy"), mmap_mode="r")
+
+        with open(os.path.join(path, "users.txt"), "r") as fin:
+            self.users = np.array([line.rstrip("\n") for line in fin], dtype=object)
+        self.user_index = {user: i for i, user in enumerate(self.users)}
+
+        self.periods = pd.DatetimeIndex(np.load(os.path.join(path, "periods.npy"))).tz_localize("UTC")
+
+        with open(os.path.join(path, "frames.json"), "r") as fin:
+            self.frames = json.loads(fin.read())
+
+    def period_slice(self, start=None, end=None) -> slice:
+        """
+        Positions of the periods from `start` to `end`, both inclusive like
+        label slicing a DataFrame.
+        """
+        start_i = 0 if start is None else self.periods.searchsorted(_utc(start), side="left")
+        end_i = len(self.periods) if end is None else self.periods.searchsorted(_utc(end), side="right")
+        return slice(start_i, end_i)
+
+    def user(self, user: str, start=None, end=None) -> np.ndarray:
+        """
+        (n_periods, n_frames) counts for one user. No copy is made.
+        """
+        return self.counts[self.user_index[user], self.period_slice(start, end)]
+
+    def window(self, start=None, end=None) -> np.ndarray:
+        """
+        (n_users, n_periods, n_frames) counts for every user within a date
+        window. No copy is made.
+        """
+        return self.counts[:, self.period_slice(start, end)]
+
+    def select(self, users: Iterable[str], start=None, end=None) -> np.ndarray:
+        """
+        (n_selected, n_periods, n_frames) counts for a set of users such as
+        someone's alters. Users we don't have are skipped.
+        """
+        rows = self.rows(users)
+        return self.counts[rows[rows >= 0], self.period_slice(start, end)]
+
+    def rows(self, users: Iterable[str]) -> np.ndarray:
+        # row of each user, -1 if we don't have them
+        return np.array([self.user_index.get(user, -1) for user in users], dtype=np.int64)
+
+    def __getitem__(self, user: str) -> pd.DataFrame:
+        return pd.DataFrame(np.asarray(self.user(user), dtype=float),
+                            index=self.periods.rename("time_stamp"),
+                            columns=self.frames)
+
+    def __contains__(self, user: str) -> bool:
+        return user in self.user_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.users)
+
+    def __len__(self) -> int:
+        return self.users.shape[0]
+
+    def keys(self) -> List[str]:
+        return list(self.users)
+
+
+def _utc(time_stamp) -> pd.Timestamp:
+    time_stamp = pd.Timestamp(time_stamp)
+    if time_stamp.tzinfo is None:
+        return time_stamp.tz_localize("UTC")
+    return time_stamp.tz_convert("UTC")
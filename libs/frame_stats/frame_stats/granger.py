@@ -0,0 +1,492 @@
+import csv
+import os
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from numpy.typing import ArrayLike
+from scipy.stats import f as f_distribution
+from tqdm import tqdm
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+
+# granger causality sweeps over pairs of group time series and frames. the
+# model is the one the notebooks fit, a VAR on (source, target, events) with
+# the lag order picked by an information criterion, and we test whether the
+# source (optionally with the events) granger causes the target.
+#
+# nothing here calls statsmodels. lag orders come from one QR of the design
+# at the largest lag, which gives the residuals of every smaller order, and
+# only the target equation matters for the test: the restricted fits come
+# from the same QR as the full one, don't change when the source is
+# shuffled, and every shuffle only swaps out the source lag block. all of
+# it is batched over many pairs and frames at once
+
+GRANGER_COLUMNS = ["source", "target", "frame", "events_causing", "lag_order",
+                   "f_statistic", "p_value", "n_shuffles", "bootstrap_p"]
+
+N_EQUATIONS = 3  # source, target and events
+
+
+def lag_matrix(x: ArrayLike, p: int) -> np.ndarray:
+    """
+    (..., n - p, p) matrix whose column k - 1 is `x` lagged by k periods. `x`
+    can have leading batch dimensions.
+    """
+    x = np.asarray(x, dtype=float)
+    n = x.shape[-1]
+    if p == 0:
+        return np.zeros(x.shape[:-1] + (n, 0))
+    return np.stack([x[..., p - k:n - k] for k in range(1, p + 1)], axis=-1)
+
+
+class GrangerDesign(NamedTuple):
+    """
+    Target equation of a VAR(p) on (source, target, events), split into the
+    blocks the tests drop. Arrays can have leading batch dimensions.
+    """
+    y: np.ndarray
+    base: np.ndarray  # constant and target lags
+    events: np.ndarray  # event lags
+    source: np.ndarray  # source lags
+    p: int
+
+
+def granger_design(source: ArrayLike,
+                   target: ArrayLike,
+                   events: ArrayLike,
+                   p: int) -> GrangerDesign:
+
+    target = np.asarray(target, dtype=float)
+    target_lags = lag_matrix(target, p)
+    constant = np.ones(target_lags.shape[:-1] + (1,))
+    events = np.broadcast_to(np.asarray(events, dtype=float), target.shape)
+    return GrangerDesign(y=target[..., p:],
+                         base=np.concatenate((constant, target_lags), axis=-1),
+                         events=lag_matrix(events, p),
+                         source=lag_matrix(source, p),
+                         p=p)
+
+
+def residual_sum_of_squares(X: np.ndarray, y: np.ndarray) -> float:
+    coefficients = np.linalg.lstsq(X, y, rcond=None)[0]
+    residuals = y - X @ coefficients
+    return float(residuals @ residuals)
+
+
+# nested least squares. with Z = QR the residual cross products of Y
+# regressed on the first m columns of Z are Y'Y - C[:m]'C[:m] where C = Q'Y,
+# so one QR gives every nested model (every lag order, every restricted
+# model) at once. rank deficient designs (e.g. an events series with no
+# events in the window) break that, those fall back to lstsq
+
+def nested_cross_products(Z: np.ndarray,
+                          Y: np.ndarray,
+                          n_columns: Iterable[int]) -> np.ndarray:
+    """
+    Residual cross products of `Y` regressed on the first m columns of `Z`
+    for each m in `n_columns`.
+
+    Parameters
+    ----------
+    Z: np.ndarray
+        (batch, nobs, k) designs
+    Y: np.ndarray
+        (batch, nobs, n_eqs) responses
+    n_columns: Iterable[int]
+        Number of leading columns of each nested model
+
+    Returns
+    -------
+    sse: np.ndarray
+        (batch, n_models, n_eqs, n_eqs) residual cross products
+    """
+    n_columns = list(n_columns)
+    Q, R = np.linalg.qr(Z)
+    C = np.swapaxes(Q, 1, 2) @ Y
+
+    # cumulative[:, m] is C[:m]'C[:m]
+    outer = C[:, :, :, None] * C[:, :, None, :]
+    cumulative = np.concatenate((np.zeros_like(outer[:, :1]), np.cumsum(outer, axis=1)), axis=1)
+    sse = (np.swapaxes(Y, 1, 2) @ Y)[:, None] - cumulative[:, n_columns]
+
+    for b in np.flatnonzero(_rank_deficient(R)):
+        for i, m in enumerate(n_columns):
+            coefficients = np.linalg.lstsq(Z[b, :, :m], Y[b], rcond=None)[0]
+            residuals = Y[b] - Z[b, :, :m] @ coefficients
+            sse[b, i] = residuals.T @ residuals
+
+    return sse
+
+
+def _rank_deficient(R: np.ndarray) -> np.ndarray:
+    diagonal = np.abs(np.diagonal(R, axis1=-2, axis2=-1))
+    tolerance = diagonal.max(axis=-1, initial=0) * max(R.shape[-2:]) * np.finfo(float).eps
+    return (diagonal <= tolerance[..., None]).any(axis=-1)
+
+
+def var_lag_design(data: np.ndarray, maxlags: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    VAR design at the largest lag order, the sample statsmodels'
+    `select_order` uses for every order.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        (batch, n, n_eqs) series
+
+    Returns
+    -------
+    Z: np.ndarray
+        (batch, n - maxlags, 1 + n_eqs * maxlags) constant then lag 1 of every
+        series, lag 2 of every series, ... so the first 1 + n_eqs * p columns
+        are the VAR(p) design
+    Y: np.ndarray
+        (batch, n - maxlags, n_eqs)
+    """
+    data = np.asarray(data, dtype=float)
+    n = data.shape[1]
+    lags = [data[:, maxlags - k:n - k] for k in range(1, maxlags + 1)]
+    constant = np.ones((data.shape[0], n - maxlags, 1))
+    return np.concatenate([constant] + lags, axis=2), data[:, maxlags:]
+
+
+def information_criteria(data: np.ndarray, maxlags: int) -> Dict[str, np.ndarray]:
+    """
+    aic, bic, hqic and fpe of VAR(p) for p = 0..maxlags, computed like
+    `VAR.select_order` (every order fit on the last n - maxlags periods).
+
+    Returns
+    -------
+    criteria: Dict[str, np.ndarray]
+        (batch, maxlags + 1) values of each criterion
+    """
+    Z, Y = var_lag_design(data, maxlags)
+    nobs, n_eqs = Y.shape[1], Y.shape[2]
+    orders = np.arange(maxlags + 1)
+
+    sse = nested_cross_products(Z, Y, 1 + n_eqs * orders)
+    sign, ld = np.linalg.slogdet(sse / nobs)
+    ld = np.where(sign > 0, ld, -np.inf)
+
+    free_params = orders * n_eqs ** 2 + n_eqs
+    df_model = n_eqs * orders + 1
+    df_resid = nobs - df_model
+    return {"aic": ld + (2 / nobs) * free_params,
+            "bic": ld + (np.log(nobs) / nobs) * free_params,
+            "hqic": ld + (2 * np.log(np.log(nobs)) / nobs) * free_params,
+            "fpe": ((nobs + df_model) / df_resid) ** n_eqs * np.exp(ld)}
+
+
+def select_lag_orders(data: np.ndarray, maxlags: int = 21, ic: str = "aic") -> np.ndarray:
+    """
+    Lag order `VAR(...).fit(maxlags=maxlags, ic=ic)` would pick for each of
+    a batch of (batch, n, n_eqs) series.
+    """
+    return np.argmin(information_criteria(data, maxlags)[ic], axis=1)
+
+
+def select_lag_order(source: ArrayLike,
+                     target: ArrayLike,
+                     events: ArrayLike,
+                     maxlags: int = 21,
+                     ic: str = "aic") -> int:
+    """
+    Lag order `VAR(...).fit(maxlags=maxlags, ic=ic)` would pick.
+    """
+    data = np.column_stack((source, target, events))[None]
+    return int(select_lag_orders(data, maxlags, ic)[0])
+
+
+def granger_f_test(rss_restricted: ArrayLike,
+                   rss_unrestricted: ArrayLike,
+                   n_restrictions: int,
+                   nobs: int,
+                   p: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    F test that the restricted coefficients of the target equation are zero,
+    with the degrees of freedom statsmodels' `VARResults.test_causality` uses
+    (the residual degrees of freedom of every equation of the VAR).
+    """
+    df_resid = nobs - (N_EQUATIONS * p + 1)
+    f_statistic = ((np.asarray(rss_restricted) - rss_unrestricted) / n_restrictions) \
+        / (np.asarray(rss_unrestricted) / df_resid)
+    p_value = f_distribution.sf(f_statistic, n_restrictions, N_EQUATIONS * df_resid)
+    return f_statistic, p_value
+
+
+def granger_tests_batch(source: np.ndarray,
+                        target: np.ndarray,
+                        events: np.ndarray,
+                        p: int,
+                        n_shuffles: int = 0,
+                        rngs: Optional[List[np.random.Generator]] = None) -> Dict[bool, Dict]:
+    """
+    Granger tests for a batch of (batch, n) source and target series with
+    the same lag order. The restricted and full models come from one QR of
+    the design ordered [constant, target lags, event lags, source lags].
+
+    Shuffles keep the QR of the constant, target and event columns and only
+    orthogonalize the permuted source lags against it.
+
+    Returns
+    -------
+    tests: Dict[bool, Dict]
+        For events_causing False and True, (batch,) "f_statistic" and
+        "p_value" arrays and (batch, n_shuffles) "null_f_statistics"
+    """
+    source = np.asarray(source, dtype=float)
+    batch = source.shape[0]
+
+    if p == 0:
+        # nothing lagged, nothing can granger cause anything
+        return {events_causing: {"f_statistic": np.zeros(batch),
+                                 "p_value": np.ones(batch),
+                                 "null_f_statistics": np.zeros((batch, n_shuffles))}
+                for events_causing in (False, True)}
+
+    design = granger_design(source, target, events, p)
+    nobs = design.y.shape[-1]
+    X = np.concatenate((design.base, design.events, design.source), axis=2)
+
+    sse = nested_cross_products(X, design.y[:, :, None], [1 + p, 1 + 2 * p, 1 + 3 * p])[:, :, 0, 0]
+    rss_without_either, rss_without_source, rss_full = sse[:, 0], sse[:, 1], sse[:, 2]
+
+    tests = {}
+    for events_causing, rss_restricted, n_restrictions in [(False, rss_without_source, p),
+                                                           (True, rss_without_either, 2 * p)]:
+        f_statistic, p_value = granger_f_test(rss_restricted, rss_full, n_restrictions, nobs, p)
+        tests[events_causing] = {"f_statistic": f_statistic,
+                                 "p_value": p_value,
+                                 "null_f_statistics": np.zeros((batch, n_shuffles))}
+
+    if n_shuffles > 0:
+        if rngs is None:
+            rngs = [np.random.default_rng() for _ in range(batch)]
+
+        for b in range(batch):
+            restricted = X[b, :, :1 + 2 * p]
+            Q1 = np.linalg.qr(restricted)[0]
+            residual = design.y[b] - Q1 @ (Q1.T @ design.y[b])
+
+            shuffled = rngs[b].permuted(np.broadcast_to(source[b], (n_shuffles, source.shape[1])),
+                                        axis=1)
+            S = lag_matrix(shuffled, p)
+            S_perp = S - Q1 @ (np.swapaxes(Q1, 0, 1)[None] @ S)
+            Q2, R2 = np.linalg.qr(S_perp)
+            reduction = ((np.swapaxes(Q2, 1, 2) @ residual) ** 2).sum(axis=1)
+            null_rss_full = rss_without_source[b] - reduction
+
+            # a permutation that lines up with the other regressors, refit it
+            for s in np.flatnonzero(_rank_deficient(R2)):
+                null_rss_full[s] = residual_sum_of_squares(np.column_stack((restricted, S[s])),
+                                                           design.y[b])
+
+            tests[False]["null_f_statistics"][b] = granger_f_test(rss_without_source[b],
+                                                                  null_rss_full, p, nobs, p)[0]
+            tests[True]["null_f_statistics"][b] = granger_f_test(rss_without_either[b],
+                                                                 null_rss_full, 2 * p, nobs, p)[0]
+
+    return tests
+
+
+def granger_tests(source: ArrayLike,
+                  target: ArrayLike,
+                  events: ArrayLike,
+                  p: int,
+                  n_shuffles: int = 0,
+                  rng: Optional[np.random.Generator] = None) -> Dict[bool, Dict]:
+    """
+    Observed granger tests for the source alone and the source with events,
+    plus F statistics for `n_shuffles` permutations of the source.
+
+    Returns
+    -------
+    tests: Dict[bool, Dict]
+        For events_causing False and True, "f_statistic", "p_value" and
+        "null_f_statistics"
+    """
+    tests = granger_tests_batch(np.asarray(source, dtype=float)[None],
+                                np.asarray(target, dtype=float)[None],
+                                np.asarray(events, dtype=float)[None],
+                                p, n_shuffles, None if rng is None else [rng])
+    return {events_causing: {"f_statistic": float(test["f_statistic"][0]),
+                             "p_value": float(test["p_value"][0]),
+                             "null_f_statistics": test["null_f_statistics"][0]}
+            for events_causing, test in tests.items()}
+
+
+def granger_jobs(jobs: List[tuple]) -> List[List[Dict]]:
+    """
+    Output rows for a batch of jobs, each (source name, target name, frame,
+    source, target, events, maxlags, ic, lag order or None, n_shuffles,
+    seed). Lag orders and tests are computed for the whole batch at once.
+    Jobs where one of the series is constant get no rows, the same rule the
+    notebooks used.
+    """
+    rows = [[] for _ in jobs]
+    data = {}
+    for i, job in enumerate(jobs):
+        job_data = np.nan_to_num(np.column_stack((job[3], job[4], job[5])))
+        if (np.ptp(job_data, axis=0) > 0).all():
+            data[i] = job_data
+    if not data:
+        return rows
+
+    # lag orders for every job that doesn't have one yet, grouped by the
+    # arguments of the search
+    lag_orders = {i: jobs[i][8] for i in data}
+    searches = {}
+    for i in data:
+        if lag_orders[i] is None:
+            searches.setdefault((jobs[i][6], jobs[i][7]), []).append(i)
+    for (maxlags, ic), job_is in searches.items():
+        orders = select_lag_orders(np.stack([data[i] for i in job_is]), maxlags, ic)
+        lag_orders.update(zip(job_is, orders.tolist()))
+
+    # tests for every job with the same lag order and number of shuffles
+    groups = {}
+    for i in data:
+        groups.setdefault((lag_orders[i], jobs[i][9]), []).append(i)
+    for (p, n_shuffles), job_is in groups.items():
+        stacked = np.stack([data[i] for i in job_is])
+        tests = granger_tests_batch(stacked[:, :, 0], stacked[:, :, 1], stacked[:, :, 2],
+                                    p, n_shuffles,
+                                    [np.random.default_rng(jobs[i][10]) for i in job_is])
+
+        for b, i in enumerate(job_is):
+            for events_causing in (False, True):
+                test = tests[events_causing]
+                f_statistic = float(test["f_statistic"][b])
+                rows[i].append({"source": jobs[i][0],
+                                "target": jobs[i][1],
+                                "frame": jobs[i][2],
+                                "events_causing": events_causing,
+                                "lag_order": p,
+                                "f_statistic": f_statistic,
+                                "p_value": float(test["p_value"][b]),
+                                "n_shuffles": n_shuffles,
+                                "bootstrap_p": (np.mean(test["null_f_statistics"][b] > f_statistic)
+                                                if n_shuffles > 0 else np.nan)})
+    return rows
+
+
+def run_granger_sweep(series: Dict[str, Dict[str, ArrayLike]],
+                      pairs: Iterable[Tuple[str, str]],
+                      frames: Iterable[str],
+                      events: ArrayLike,
+                      out_path: str,
+                      maxlags: int = 21,
+                      ic: str = "aic",
+                      n_shuffles: int = 0,
+                      seed: Optional[int] = None,
+                      n_workers: Optional[int] = None,
+                      lag_orders: Optional[Dict[Tuple[str, str, str], int]] = None,
+                      batch_size: int = 64) -> pd.DataFrame:
+    """
+    Granger tests for every (source, target) pair and frame, run in batches
+    on a process pool. Rows are appended to `out_path` (tsv) as batches
+    finish, rerunning with the same arguments skips the jobs already in the
+    file.
+
+    Parameters
+    ----------
+    series: Dict[str, Dict[str, ArrayLike]]
+        Time series of every frame for every group, e.g. the AR residuals,
+        all aligned with `events`
+    pairs: Iterable[Tuple[str, str]]
+        (source, target) group names to test
+    frames: Iterable[str]
+        Frames to test
+    events: ArrayLike
+        Event indicator series
+    out_path: str
+        Tsv to write the results to
+    maxlags: int
+        Largest lag order to consider
+    ic: str
+        Information criterion to select the lag order with
+    n_shuffles: int
+        Number of source permutations for the shuffle null. Shuffles reuse
+        the observed lag order
+    seed: int
+        Seed for the shuffles, every job gets its own stream from it
+    n_workers: int
+        Number of processes
+    lag_orders: Dict[Tuple[str, str, str], int]
+        Already selected lag orders by (source, target, frame). Orders found
+        in an existing output file are reused too
+    batch_size: int
+        Number of (pair, frame) jobs solved together by one worker
+
+    Returns
+    -------
+    results: pd.DataFrame
+        Everything in `out_path`
+    """
+    lag_orders = dict(lag_orders or {})
+    done = _resume(out_path, lag_orders)
+
+    jobs = []
+    events = np.asarray(events, dtype=float)
+    for job_i, (pair, frame) in enumerate((pair, frame) for pair in pairs for frame in frames):
+        source_name, target_name = pair
+        if (source_name, target_name, frame) in done:
+            continue
+        jobs.append((source_name, target_name, frame,
+                     np.asarray(series[source_name][frame], dtype=float),
+                     np.asarray(series[target_name][frame], dtype=float),
+                     events, maxlags, ic,
+                     lag_orders.get((source_name, target_name, frame)),
+                     n_shuffles,
+                     # keyed by position in the full job list so resumed runs
+                     # draw the same shuffles
+                     np.random.SeedSequence([0 if seed is None else seed, job_i])))
+
+    new_file = not os.path.exists(out_path) or os.path.getsize(out_path) == 0
+    with open(out_path, "a", newline="") as fout:
+        writer = csv.DictWriter(fout, fieldnames=GRANGER_COLUMNS, delimiter="\t")
+        if new_file:
+            writer.writeheader()
+
+        # a job is only marked done once both of its rows are on disk
+        def write_rows(batch_rows: List[List[Dict]], batch: List[tuple]):
+            for rows, job in zip(batch_rows, batch):
+                writer.writerows(rows)
+                if not rows:
+                    writer.writerow({"source": job[0], "target": job[1], "frame": job[2]})
+            fout.flush()
+
+        batches = [jobs[i:i + batch_size] for i in range(0, len(jobs), batch_size)]
+        if n_workers == 1:
+            for batch in tqdm(batches):
+                write_rows(granger_jobs(batch), batch)
+        else:
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                futures = {pool.submit(granger_jobs, batch): batch for batch in batches}
+                for future in tqdm(as_completed(futures), total=len(futures)):
+                    write_rows(future.result(), futures[future])
+
+    results = pd.read_csv(out_path, sep="\t").dropna(subset=["f_statistic"])
+    results = results.drop_duplicates(["source", "target", "frame", "events_causing"], keep="last")
+    return results.reset_index(drop=True)
+
+
+def _resume(out_path: str, lag_orders: Dict) -> set:
+    # jobs already in the output, and their lag orders
+    if not os.path.exists(out_path) or os.path.getsize(out_path) == 0:
+        return set()
+
+    # drop a row that was cut off halfway through being written
+    with open(out_path, "rb+") as fout:
+        contents = fout.read()
+        fout.truncate(contents.rfind(b"\n") + 1)
+
+    previous = pd.read_csv(out_path, sep="\t")
+    done = set()
+    for key, job_rows in previous.groupby(["source", "target", "frame"]):
+        # both tests written, or a placeholder for a skipped job
+        if job_rows.shape[0] >= 2 or job_rows["f_statistic"].isna().all():
+            done.add(key)
+        if job_rows["lag_order"].notna().any():
+            lag_orders[key] = int(job_rows["lag_order"].dropna().iloc[0])
+    return done
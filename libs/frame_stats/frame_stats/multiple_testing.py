@@ -0,0 +1,180 @@
+import numpy as np
+import pandas as pd
+from numpy.typing import ArrayLike
+from typing import List, NamedTuple, Optional, Union
+
+
+# multiple testing corrections. every correction is a sort of the p-values,
+# a scale by the rank and a running max (step-down) or min (step-up) to keep
+# the adjusted p-values monotone, so everything is O(n log n) and vectorized.
+#
+# groups are handled in the same pass: we sort by (group, p-value) and the
+# ranks, family sizes and running max/min restart at every group boundary
+
+
+class MultipleTestingResult(NamedTuple):
+    rejected: np.ndarray
+    p_corrected: np.ndarray
+
+
+METHODS = ["holm", "bh", "by"]
+
+
+def adjust_p_values(p_values: ArrayLike,
+                    method: str = "holm",
+                    groups: Optional[ArrayLike] = None) -> np.ndarray:
+    """
+    Adjusted p-values, in the original order.
+
+    Parameters
+    ----------
+    p_values: ArrayLike
+        Raw p-values, nan p-values are left out of the family and stay nan
+    method: str
+        "holm" (family wise error rate), "bh" (Benjamini-Hochberg false
+        discovery rate) or "by" (Benjamini-Yekutieli, fdr under any
+        dependence)
+    groups: ArrayLike
+        Optional family label of every p-value, each family is corrected
+        separately
+
+    Returns
+    -------
+    p_corrected: np.ndarray
+        Adjusted p-values clipped to 1
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+
+    p_values = np.asarray(p_values, dtype=float)
+    p_corrected = np.full(p_values.shape, np.nan)
+    tested = np.flatnonzero(~np.isnan(p_values))
+    if tested.shape[0] == 0:
+        return p_corrected
+
+    if groups is None:
+        codes = np.zeros(tested.shape[0], dtype=np.int64)
+    else:
+        codes = pd.factorize(np.asarray(groups)[tested])[0]
+
+    # sort by family then p-value
+    order = np.lexsort((p_values[tested], codes))
+    p = p_values[tested][order]
+    codes = codes[order]
+
+    # rank within the family (0 based) and family size
+    family_sizes = np.bincount(codes)
+    starts = np.concatenate(([0], np.cumsum(family_sizes)[:-1]))
+    rank = np.arange(p.shape[0]) - starts[codes]
+    m = family_sizes[codes]
+
+    if method == "holm":
+        adjusted = (m - rank) * p
+        adjusted = pd.Series(adjusted).groupby(codes).cummax().values
+    else:
+        adjusted = p * m / (rank + 1)
+        if method == "by":
+            # harmonic number of each family
+            harmonic = np.cumsum(1 / np.arange(1, family_sizes.max() + 1))
+            adjusted = adjusted * harmonic[m - 1]
+        # step-up, running min from the largest p-value down
+        adjusted = pd.Series(adjusted[::-1]).groupby(codes[::-1]).cummin().values[::-1]
+
+    p_corrected[tested[order]] = np.minimum(adjusted, 1)
+    return p_corrected
+
+
+def holm(p_values: ArrayLike, alpha: float = 0.05, groups: Optional[ArrayLike] = None) -> MultipleTestingResult:
+    """
+    Holm-Bonferroni step-down correction.
+    """
+    p_corrected = adjust_p_values(p_values, "holm", groups)
+    return MultipleTestingResult(p_corrected <= alpha, p_corrected)
+
+
+def benjamini_hochberg(p_values: ArrayLike,
+                       alpha: float = 0.05,
+                       groups: Optional[ArrayLike] = None) -> MultipleTestingResult:
+    """
+    Benjamini-Hochberg step-up false discovery rate correction.
+    """
+    p_corrected = adjust_p_values(p_values, "bh", groups)
+    return MultipleTestingResult(p_corrected <= alpha, p_corrected)
+
+
+def benjamini_yekutieli(p_values: ArrayLike,
+                        alpha: float = 0.05,
+                        groups: Optional[ArrayLike] = None) -> MultipleTestingResult:
+    """
+    Benjamini-Yekutieli false discovery rate correction, valid for
+    arbitrarily dependent tests.
+    """
+    p_corrected = adjust_p_values(p_values, "by", groups)
+    return MultipleTestingResult(p_corrected <= alpha, p_corrected)
+
+
+def max_t(statistics: ArrayLike,
+          null_statistics: ArrayLike,
+          alpha: float = 0.05) -> MultipleTestingResult:
+    """
+    Westfall-Young step-down max-T correction from permutations. The
+    adjusted p-value of the test with the k-th largest statistic is the
+    fraction of permutations where the largest null statistic among the
+    tests ranked k and below reaches it.
+
+    The statistics should be on a common scale (e.g. all F statistics with
+    the same degrees of freedom) and the permutations should be shared by
+    every test, row b of `null_statistics` is one relabeling of the data.
+
+    Parameters
+    ----------
+    statistics: ArrayLike
+        (n_tests,) observed statistics, larger is more extreme
+    null_statistics: ArrayLike
+        (n_permutations, n_tests) statistics under the permutations
+    """
+    statistics = np.asarray(statistics, dtype=float)
+    null_statistics = np.asarray(null_statistics, dtype=float)
+
+    # most extreme test first
+    order = np.argsort(-statistics, kind="stable")
+
+    # successive maxima over the less extreme tests, from the bottom up
+    successive = np.maximum.accumulate(null_statistics[:, order[::-1]], axis=1)[:, ::-1]
+    exceed = (successive >= statistics[order]).mean(axis=0)
+
+    p_corrected = np.empty(statistics.shape[0])
+    p_corrected[order] = np.maximum.accumulate(exceed)
+    return MultipleTestingResult(p_corrected <= alpha, p_corrected)
+
+
+def correct_p_values(data: pd.DataFrame,
+                     method: str = "holm",
+                     alpha: float = 0.05,
+                     p_column: str = "p_value",
+                     by: Optional[Union[str, List[str]]] = None) -> pd.DataFrame:
+    """
+    Copy of a table of tests with "p_corrected" and "null_rejected" columns.
+
+    Parameters
+    ----------
+    data: pd.DataFrame
+        One row per test
+    method: str
+        "holm", "bh" or "by"
+    alpha: float
+        Level to reject at
+    p_column: str
+        Column with the raw p-values
+    by: Union[str, List[str]]
+        Column(s) defining separate families, e.g. "events_causing". The
+        whole table is one family by default
+    """
+    groups = None
+    if by is not None:
+        groups = data.groupby(by, sort=False).ngroup().values
+
+    corrected = data.copy()
+    corrected["p_corrected"] = adjust_p_values(corrected[p_column].values, method, groups)
+    corrected["null_rejected"] = corrected["p_corrected"] <= alpha
+    return corrected
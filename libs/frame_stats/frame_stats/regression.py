@@ -0,0 +1,270 @@
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.special import expit
+from scipy.stats import norm
+from typing import Dict, List, NamedTuple, Optional, Union
+
+
+# logistic regressions of frame use on frame exposure, one model per frame.
+# every frame's model has the same tweet level covariates and only the
+# exposure columns change, so instead of a DataFrame and a statsmodels fit
+# per frame we keep
+#   outcomes   (n_tweets, n_frames) did the tweet cue the frame
+#   exposures  {name: (n_tweets, n_frames)} e.g. self and alter exposure
+#   covariates (n_tweets, n_covariates) shared by every frame
+# and fit all the frames at once with newton's method (IRLS). each
+# iteration streams over blocks of tweets and builds every frame's design
+# block as a (n_frames, block, n_terms) stack, so the weighted gram matrices
+# and gradients of all the frames are one batched matmul.
+#
+# rows with a missing value in any column a frame's model uses are dropped
+# from that frame's model, like the dropna the notebooks did
+
+
+# exposure columns of each model specification
+SPECIFICATIONS = {"self": ["self_exposure"],
+                  "alter": ["alter_exposure"],
+                  "combined": ["alter_exposure", "self_exposure"]}
+
+# tweets per block when building the stacked designs
+BLOCK_SIZE = 2 ** 14
+
+
+class LogitFits(NamedTuple):
+    params: np.ndarray  # (n_frames, n_terms)
+    bse: np.ndarray  # (n_frames, n_terms)
+    llf: np.ndarray  # (n_frames,)
+    nobs: np.ndarray  # (n_frames,)
+    converged: np.ndarray  # (n_frames,)
+
+
+def _stacked_design(shared: np.ndarray, frame_columns: np.ndarray, rows: slice) -> np.ndarray:
+    # (n_frames, block, n_terms) designs, shared columns first
+    shared = shared[rows]
+    frame_columns = frame_columns[rows]
+    n_frames = frame_columns.shape[1]
+    return np.concatenate((np.broadcast_to(shared, (n_frames,) + shared.shape),
+                           np.moveaxis(frame_columns, 1, 0)), axis=2)
+
+
+def fit_stacked_logits(outcomes: np.ndarray,
+                       frame_columns: np.ndarray,
+                       shared: np.ndarray,
+                       maxiter: int = 100,
+                       tol: float = 1e-8,
+                       block_size: int = BLOCK_SIZE) -> LogitFits:
+    """
+    Logistic regressions of every outcome column on the shared columns and
+    its own frame specific columns, all fit together by IRLS.
+
+    Parameters
+    ----------
+    outcomes: np.ndarray
+        (n, n_frames) 0/1 outcomes
+    frame_columns: np.ndarray
+        (n, n_frames, n_frame_terms) regressors that differ by frame
+    shared: np.ndarray
+        (n, n_shared_terms) regressors every frame's model has, including the
+        constant
+    maxiter: int
+        Largest number of newton steps
+    tol: float
+        Stop a frame once no coefficient moves more than this
+
+    Returns
+    -------
+    fits: LogitFits
+        Coefficients in the order shared columns then frame columns
+    """
+    n, n_frames = outcomes.shape
+    n_terms = shared.shape[1] + frame_columns.shape[2]
+
+    # a frame only uses the rows where everything in its model is observed
+    valid = ~np.isnan(outcomes) & ~np.isnan(frame_columns).any(axis=2) \
+        & ~np.isnan(shared).any(axis=1)[:, None]
+    outcomes = np.where(valid, outcomes, 0)
+    frame_columns = np.nan_to_num(frame_columns)
+    shared = np.nan_to_num(shared)
+    nobs = valid.sum(axis=0)
+
+    params = np.zeros((n_frames, n_terms))
+    converged = np.zeros(n_frames, dtype=bool)
+    blocks = [slice(start, min(start + block_size, n)) for start in range(0, n, block_size)]
+
+    def gram_and_gradient(params: np.ndarray):
+        gram = np.zeros((n_frames, n_terms, n_terms))
+        gradient = np.zeros((n_frames, n_terms))
+        llf = np.zeros(n_frames)
+        for rows in blocks:
+            X = _stacked_design(shared, frame_columns, rows)
+            y = outcomes[rows].T
+            eta = np.einsum("fbk,fk->fb", X, params)
+            mu = expit(eta)
+            weight = mu * (1 - mu) * valid[rows].T
+
+            gram += np.swapaxes(X, 1, 2) @ (X * weight[:, :, None])
+            gradient += np.einsum("fbk,fb->fk", X, (y - mu) * valid[rows].T)
+            llf += ((y * eta - np.logaddexp(0, eta)) * valid[rows].T).sum(axis=1)
+        return gram, gradient, llf
+
+    for _ in range(maxiter):
+        gram, gradient, llf = gram_and_gradient(params)
+        step = (np.linalg.pinv(gram, hermitian=True) @ gradient[:, :, None])[:, :, 0]
+        step[converged] = 0
+        params += step
+        converged |= np.abs(step).max(axis=1) < tol
+        if converged.all():
+            break
+
+    gram, _, llf = gram_and_gradient(params)
+    covariance = np.linalg.pinv(gram, hermitian=True)
+    bse = np.sqrt(np.clip(np.diagonal(covariance, axis1=1, axis2=2), 0, None))
+
+    # frames with nothing to fit get no estimates
+    empty = nobs == 0
+    params[empty] = np.nan
+    bse[empty] = np.nan
+    llf[empty] = np.nan
+    return LogitFits(params, bse, llf, nobs, converged & ~empty)
+
+
+def _fit_frames(args: tuple) -> LogitFits:
+    return fit_stacked_logits(*args)
+
+
+class FrameRegressionData:
+    """
+    Everything the per frame logistic regressions need, built once. Fitting
+    the self, alter or combined specification only picks which exposure
+    arrays go into the design.
+
+    Parameters
+    ----------
+    outcomes: np.ndarray
+        (n_tweets, n_frames) whether each tweet cued each frame
+    exposures: Dict[str, np.ndarray]
+        (n_tweets, n_frames) exposure of each tweet's author to each frame,
+        by exposure name (e.g. "self_exposure", "alter_exposure"). nan means
+        unknown
+    covariates: pd.DataFrame
+        (n_tweets, n_covariates) tweet level controls shared by every frame
+    frames: List[str]
+        Frame names in column order
+    """
+
+    def __init__(self,
+                 outcomes: np.ndarray,
+                 exposures: Dict[str, np.ndarray],
+                 covariates: pd.DataFrame,
+                 frames: List[str]):
+
+        self.outcomes = np.asarray(outcomes, dtype=float)
+        self.exposures = {name: np.asarray(exposure, dtype=float)
+                          for name, exposure in exposures.items()}
+        self.covariates = covariates.reset_index(drop=True)
+        self.frames = list(frames)
+
+        shape = (self.covariates.shape[0], len(self.frames))
+        for name, array in [("outcomes", self.outcomes)] + list(self.exposures.items()):
+            if array.shape != shape:
+                raise ValueError(f"{name} has shape {array.shape}, expected {shape}")
+
+    @classmethod
+    def from_tweets(cls,
+                    tweets: pd.DataFrame,
+                    frames: List[str],
+                    exposures: Dict[str, np.ndarray],
+                    features: pd.DataFrame,
+                    covariates: List[str],
+                    on: str = "id_str") -> "FrameRegressionData":
+        """
+        Outcomes from the frame columns of a tweet table and covariates from
+        a features table joined on `on`. `exposures` are aligned with the rows
+        of `tweets`.
+        """
+        features = features.drop_duplicates(on)[[on] + list(covariates)]
+        joined = pd.merge(tweets[[on]], features, on=on, how="left")
+        return cls(tweets[frames].values, exposures, joined[covariates], frames)
+
+    def fit(self,
+            specification: Union[str, List[str]] = "combined",
+            frames: Optional[List[str]] = None,
+            covariates: Optional[List[str]] = None,
+            n_workers: int = 1,
+            maxiter: int = 100,
+            tol: float = 1e-8) -> pd.DataFrame:
+        """
+        Fit one logistic regression per frame.
+
+        Parameters
+        ----------
+        specification: Union[str, List[str]]
+            "self", "alter", "combined" or a list of exposure names
+        frames: List[str]
+            Frames to fit, all of them by default
+        covariates: List[str]
+            Controls to include, all of them by default
+        n_workers: int
+            Split the frames over this many processes, each fits its share
+            as one stacked problem
+
+        Returns
+        -------
+        table: pd.DataFrame
+            One row per frame and term with "coef", "std_err", "z",
+            "p_value", "n_obs", "log_likelihood" and "converged"
+        """
+        if isinstance(specification, str):
+            spec_name = specification
+            exposure_names = SPECIFICATIONS[specification]
+        else:
+            exposure_names = list(specification)
+            spec_name = "+".join(exposure_names)
+
+        frames = self.frames if frames is None else list(frames)
+        columns = [self.frames.index(frame) for frame in frames]
+
+        covariates = list(self.covariates.columns) if covariates is None else list(covariates)
+        shared = np.column_stack((np.ones(self.covariates.shape[0]),
+                                  self.covariates[covariates].values.astype(float)))
+        frame_columns = np.stack([self.exposures[name][:, columns] for name in exposure_names],
+                                 axis=2)
+        outcomes = self.outcomes[:, columns]
+
+        if n_workers == 1:
+            fits = fit_stacked_logits(outcomes, frame_columns, shared, maxiter, tol)
+        else:
+            chunks = [chunk for chunk in np.array_split(np.arange(len(frames)), n_workers)
+                      if chunk.shape[0] > 0]
+            jobs = [(outcomes[:, chunk], frame_columns[:, chunk], shared, maxiter, tol)
+                    for chunk in chunks]
+            with ProcessPoolExecutor(max_workers=n_workers) as pool:
+                chunk_fits = list(pool.map(_fit_frames, jobs))
+            fits = LogitFits(*[np.concatenate(field) for field in zip(*chunk_fits)])
+
+        terms = ["const"] + covariates + exposure_names
+        return logit_table(fits, frames, terms, spec_name)
+
+
+def logit_table(fits: LogitFits,
+                frames: List[str],
+                terms: List[str],
+                specification: str) -> pd.DataFrame:
+    """
+    Tidy coefficient table, one row per frame and term.
+    """
+    n_frames, n_terms = fits.params.shape
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z = fits.params / fits.bse
+
+    return pd.DataFrame({"specification": specification,
+                         "frame": np.repeat(frames, n_terms),
+                         "term": np.tile(terms, n_frames),
+                         "coef": fits.params.ravel(),
+                         "std_err": fits.bse.ravel(),
+                         "z": z.ravel(),
+                         "p_value": 2 * norm.sf(np.abs(z)).ravel(),
+                         "n_obs": np.repeat(fits.nobs, n_terms),
+                         "log_likelihood": np.repeat(fits.llf, n_terms),
+                         "converged": np.repeat(fits.converged, n_terms)})
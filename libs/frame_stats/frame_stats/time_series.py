@@ -1,6 +1,7 @@
 import numpy as np
 import pandas as pd
-from typing import Dict, List, Optional
+import scipy.sparse as sp
+from typing import Dict, List, NamedTuple, Optional, Union
 
 
 # core function for extracting the frame time series. used in the more complex
@@ -36,6 +37,92 @@ def construct_frame_time_series(user: str,
     
     return user_ts.set_index("time_stamp")
 
+class FrameTimeSeries(NamedTuple):
+    """
+    Frame counts for every user and period. `counts` is either a dense
+    (n_users, n_periods, n_frames) array or, with `sparse=True`, a CSR matrix
+    of shape (n_users * n_periods, n_frames) where user i's time series is
+    rows i * n_periods to (i + 1) * n_periods.
+    """
+    counts: Union[np.ndarray, sp.csr_matrix]
+    users: np.ndarray
+    periods: pd.DatetimeIndex
+    frames: List[str]
+
+    def user_index(self) -> Dict[str, int]:
+        return {user: i for i, user in enumerate(self.users)}
+
+    def user_frame_matrix(self, i: int) -> np.ndarray:
+        # (n_periods, n_frames) counts for the user in row i
+        if sp.issparse(self.counts):
+            n_periods = self.periods.shape[0]
+            return self.counts[i * n_periods:(i + 1) * n_periods].toarray()
+        return self.counts[i]
+
+    def user_time_series(self, user: str) -> pd.DataFrame:
+        # same layout construct_frame_time_series returns
+        i = int(np.flatnonzero(self.users == user)[0])
+        return pd.DataFrame(self.user_frame_matrix(i).astype(float),
+                            index=self.periods.rename("time_stamp"),
+                            columns=self.frames)
+
+
+# bulk version of construct_frame_time_series. instead of filtering the
+# whole table once per user we bin every tweet by (user, period) in a single
+# groupby and scatter the sums into one array
+def construct_all_frame_time_series(df: pd.DataFrame,
+                                    frequency: str,
+                                    config: Dict,
+                                    frame_cols: Optional[List[str]] = None,
+                                    sparse: bool = False,
+                                    dtype=np.int32) -> FrameTimeSeries:
+
+    if frame_cols is None:
+        frame_cols = [col for col in df.columns
+                      if col not in ["id_str", "screen_name", "group", "time_stamp"]]
+
+    user_codes, users = pd.factorize(df["screen_name"])
+    binned = df[frame_cols].copy()
+    binned["user"] = user_codes
+    binned["time_stamp"] = pd.to_datetime(df["time_stamp"], utc=True)
+
+    # the same empty first and last rows the per user version adds, under a
+    # fake user, so every user's bins line up with the study period
+    start = pd.to_datetime(config["dates"]["start"], utc=True)
+    end = pd.to_datetime(config["dates"]["end"], utc=True)
+    sentinels = pd.DataFrame({"user": [-1, -1], "time_stamp": [start, end]})
+    binned = pd.concat((binned, sentinels), ignore_index=True)
+    binned[frame_cols] = binned[frame_cols].fillna(0)
+
+    sums = binned.groupby(["user", pd.Grouper(key="time_stamp", freq=frequency)]).sum()
+
+    # every period in the study plus any that only show up in the data
+    study_periods = (pd.Series(0, index=pd.DatetimeIndex([start, end]))
+                     .resample(frequency).sum().index)
+    periods = study_periods.union(sums.index.get_level_values("time_stamp").unique())
+
+    sums = sums[sums.index.get_level_values("user") >= 0]
+    user_rows = sums.index.get_level_values("user").values
+    period_rows = periods.get_indexer(sums.index.get_level_values("time_stamp"))
+    values = sums[frame_cols].values.astype(dtype)
+
+    if sparse:
+        n_periods = periods.shape[0]
+        # summed row for (user, period) goes to row user * n_periods + period
+        rows = user_rows * n_periods + period_rows
+        nz_rows, nz_cols = np.nonzero(values)
+        counts = sp.csr_matrix((values[nz_rows, nz_cols], (rows[nz_rows], nz_cols)),
+                               shape=(users.shape[0] * n_periods, len(frame_cols)))
+    else:
+        counts = np.zeros((users.shape[0], periods.shape[0], len(frame_cols)), dtype=dtype)
+        counts[user_rows, period_rows] = values
+
+    return FrameTimeSeries(counts=counts,
+                           users=np.asarray(users),
+                           periods=periods,
+                           frames=list(frame_cols))
+
+
 # this really is not about time series per se but is important to identify
 # neighbors in the mention network effectively
 def longer_mention_subset(mention_subset: pd.DataFrame) -> pd.DataFrame:
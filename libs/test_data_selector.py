@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from data_selector.mention_network import MentionGraph
+
+
+def toy_mention_graph() -> MentionGraph:
+    mentions = pd.DataFrame({"uid1": ["1", "1", "3"],
+                             "uid2": ["2", "3", "4"],
+                             "1to2freq": [2, 0, 1],
+                             "2to1freq": [1, 5, 0]})
+    id_map = pd.DataFrame({"user_id": ["1", "2", "3"],
+                           "screen_name": ["alice", "bob", "carol"]})
+    return MentionGraph(mentions, id_map)
+
+
+def test_mention_graph_neighbors():
+    graph = toy_mention_graph()
+
+    out_ids, out_weights = graph.out_neighbors("1")
+    assert dict(zip(out_ids, out_weights)) == {"2": 2}
+    in_ids, in_weights = graph.in_neighbors("1")
+    assert dict(zip(in_ids, in_weights)) == {"2": 1, "3": 5}
+    assert set(graph.neighbors("3")) == {"1", "4"}
+
+    # user 4 has no screen name so gets dropped
+    assert sorted(graph.neighbor_names("carol")) == ["alice"]
+    assert graph.neighbor_names("dave") is None
+    assert graph.degree("1", "in", weighted=True) == 6
+
+
+def test_mention_graph_aggregates():
+    graph = toy_mention_graph()
+    values = np.arange(len(graph) * 2).reshape(len(graph), 2)
+
+    expected = sum(w * values[graph.id_index[u]] for u, w in zip(*graph.in_neighbors("1")))
+    assert np.all(graph.neighbor_sum("1", values, "in") == expected)
+    assert np.all(graph.matrix("in") @ values == np.vstack([graph.neighbor_sum(u, values, "in")
+                                                             for u in graph.user_ids]))
+
+    # rows and columns follow the requested order, unknown users are empty
+    aligned = graph.adjacency_for(["carol", "nobody", "alice"], "out").toarray()
+    assert np.all(aligned == np.array([[0, 0, 5],
+                                       [0, 0, 0],
+                                       [0, 0, 0]]))
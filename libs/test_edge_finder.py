@@ -1,7 +1,10 @@
+import gzip
 import json
 from typing import Dict
 
+import pandas as pd
 from edge_finder import identify_successors, check_connections, check_sample_group
+from edge_finder import SampleCatalog, check_sample_group_batch, extract_edges
 
 def test_congress_retweet_mention():
     successors = identify_successors(congress_tweet(), "congress")
@@ -63,6 +66,79 @@ def test_check_sample_group():
     assert congress_check["retweet_of_user_name_in_sample"] is None
 
 
+def test_sample_catalog_exact_match():
+    catalog = SampleCatalog(build_dummy_catalog())
+
+    # substrings of ids in the catalog used to count as matches
+    assert catalog.get("tweet_id", "94828089577295053") is None
+    assert catalog.get("tweet_id", 948280895772950535) == "congress"
+    assert catalog.get("user_id", 2853309155.0) == "congress"
+    assert catalog.get("user_name", "@RepCurbelo") == "congress"
+
+    journalist_successors = identify_successors(journalist_tweet(), "journalists")
+    journalist_check = check_sample_group(journalist_successors, catalog)
+    assert journalist_check["reply_to_in_sample"] == "congress"
+
+
+def test_check_sample_group_batch():
+    catalog = SampleCatalog(build_dummy_catalog())
+    successors = [identify_successors(public_tweet(), "public"),
+                  identify_successors(journalist_tweet(), "journalists"),
+                  identify_successors(congress_tweet(), "congress")]
+    edges = pd.DataFrame(successors)
+
+    batch = check_sample_group_batch(edges, catalog)
+    for row_i, edge_info in edges.iterrows():
+        single = check_sample_group(edge_info.dropna(), catalog)
+        for col, sample in single.items():
+            assert batch.loc[row_i, col] == sample
+
+    assert batch.loc[1, "reply_to_user_in_sample"] == "congress"
+    assert batch.loc[0, "quote_of_in_sample"] is None
+
+
+def test_extract_edges(tmp_path):
+    good_path = tmp_path / "good.gz"
+    with gzip.open(good_path, "wt") as fout:
+        fout.write(json.dumps(public_tweet()) + "\n")
+        fout.write("not json\n")
+
+    # valid first member followed by garbage
+    bad_path = tmp_path / "bad.gz"
+    with open(bad_path, "wb") as fout:
+        fout.write(gzip.compress((json.dumps(public_tweet()) + "\n").encode()))
+        fout.write(b"\x1f\x8b\x08\x00garbage")
+
+    out_path = tmp_path / "edges.tsv"
+    n_edges = extract_edges([str(good_path), str(bad_path)], str(out_path), "public", n_workers=2)
+
+    edges = pd.read_csv(out_path, sep="\t", dtype=str)
+    assert n_edges == 2
+    assert list(edges.columns) == ["tweet_id", "user_id", "user_name", "quote_of", "quote_of_user"]
+    assert (edges["quote_of"] == "1053110153883643905").all()
+
+
+def test_extract_edges_splits_large_files(tmp_path):
+    # a tweet check_connections can't handle is skipped, not fatal
+    malformed = {k: v for k, v in public_tweet().items() if k != "user"}
+    path = tmp_path / "year.gz"
+    with gzip.open(path, "wt") as fout:
+        for i in range(5):
+            fout.write(json.dumps(dict(public_tweet(), id=i)) + "\n")
+            fout.write(json.dumps(malformed) + "\n")
+
+    whole_path = tmp_path / "whole.tsv"
+    assert extract_edges([str(path)], str(whole_path), "public", n_workers=2) == 5
+
+    # every two lines is a task of its own, the edges come out the same and in order
+    split_path = tmp_path / "split.tsv"
+    assert extract_edges([str(path)], str(split_path), "public", n_workers=2,
+                         split_bytes=0, lines_per_task=2) == 5
+    edges = pd.read_csv(split_path, sep="\t", dtype=str)
+    assert edges["tweet_id"].tolist() == [str(i) for i in range(5)]
+    assert edges.equals(pd.read_csv(whole_path, sep="\t", dtype=str))
+
+
 def build_dummy_catalog() -> Dict:
     # sort of copying the code in the actual catalog function to do a halfassed test kind of hting
     kinds = ["tweet_id", "user_id", "user_name"]
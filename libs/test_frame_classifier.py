@@ -0,0 +1,113 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from prediction_cache import PredictionCache, cache_key
+from resumable_tsv import classify_tsv
+
+
+def test_prediction_cache_normalized_keys():
+    cache = PredictionCache(":memory:")
+    cache.put_many("generic", ["some\ttext about\nimmigration"], np.array([[1, 0, 1]]))
+
+    # tabs and newlines are cleaned the same way as the tweet tables
+    cached = cache.get_many("generic", ["some text about immigration", "other text"])
+    assert list(cached[0]) == [1, 0, 1]
+    assert cached[1] is None
+
+    # the model name is part of the key
+    assert cache.get_many("specific", ["some text about immigration"])[0] is None
+    assert cache_key("generic", "a\tb") == cache_key("generic", "a b")
+
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_prediction_cache_evicts_least_recently_used():
+    cache = PredictionCache(":memory:", max_entries=2)
+    cache.put_many("generic", ["first"], np.array([[1]]))
+    cache.put_many("generic", ["second"], np.array([[0]]))
+
+    # touching "first" makes "second" the oldest
+    cache.get_many("generic", ["first"])
+    cache.put_many("generic", ["third"], np.array([[1]]))
+
+    cached = cache.get_many("generic", ["first", "second", "third"])
+    assert cached[0] is not None
+    assert cached[1] is None
+    assert cached[2] is not None
+    assert cache.stats()["evictions"] == 1
+
+
+FRAME_LABELS = {"generic": ["Economic", "Crime"], "narrative": ["Episodic"]}
+
+
+def fake_predict(texts, fail_on=None):
+    # "frames" are just properties of the text so reruns are comparable
+    if fail_on is not None and fail_on in texts:
+        raise RuntimeError("interrupted")
+    lengths = np.array([len(text) for text in texts], dtype=int)
+    return {"generic": np.column_stack((lengths % 2, lengths % 3 == 0)).astype(int),
+            "narrative": (lengths[:, None] % 5 == 0).astype(int)}
+
+
+def write_tweets(path, n):
+    pd.DataFrame({"id_str": [str(1000 + i) for i in range(n)],
+                  "text": ["tweet " + "x" * i for i in range(n)]}).to_csv(path, sep="\t", index=False)
+    return path
+
+
+def read_outputs(out_prefix):
+    return {ft: pd.read_csv(f"{out_prefix}_{ft}.tsv", sep="\t", dtype={"id_str": str})
+            for ft in FRAME_LABELS}
+
+
+def test_classify_tsv_resumes_after_interruption(tmp_path):
+    data_files = [write_tweets(str(tmp_path / "a.tsv"), 25), write_tweets(str(tmp_path / "b.tsv"), 7)]
+    expected_prefix = str(tmp_path / "expected")
+    classify_tsv(fake_predict, FRAME_LABELS, data_files, expected_prefix, chunksize=4)
+    expected = read_outputs(expected_prefix)
+    assert expected["generic"].shape == (32, 4)
+    assert not os.path.exists(expected_prefix + "_checkpoint.json")
+
+    # die part way through the first file, then pick up from the checkpoint
+    out_prefix = str(tmp_path / "out")
+    with pytest.raises(RuntimeError):
+        classify_tsv(lambda texts: fake_predict(texts, fail_on="tweet " + "x" * 13),
+                     FRAME_LABELS, data_files, out_prefix, chunksize=4)
+    assert os.path.exists(out_prefix + "_checkpoint.json")
+
+    n_classified = classify_tsv(fake_predict, FRAME_LABELS, data_files, out_prefix, chunksize=4)
+    assert n_classified == 32 - 12
+    for frame_type, df in read_outputs(out_prefix).items():
+        pd.testing.assert_frame_equal(df, expected[frame_type])
+
+
+def test_classify_tsv_reruns_when_outputs_or_inputs_change(tmp_path):
+    data_file = write_tweets(str(tmp_path / "a.tsv"), 10)
+    out_prefix = str(tmp_path / "out")
+    with pytest.raises(RuntimeError):
+        classify_tsv(lambda texts: fake_predict(texts, fail_on="tweet " + "x" * 5),
+                     FRAME_LABELS, data_file, out_prefix, chunksize=4)
+
+    # outputs deleted before the rerun (like snakemake does): start over
+    # instead of skipping the rows the stale checkpoint says are done
+    for frame_type in FRAME_LABELS:
+        os.remove(f"{out_prefix}_{frame_type}.tsv")
+    assert classify_tsv(fake_predict, FRAME_LABELS, data_file, out_prefix, chunksize=4) == 10
+    assert read_outputs(out_prefix)["generic"].shape == (10, 4)
+
+    # a regenerated input at the same path isn't resumed into
+    with pytest.raises(RuntimeError):
+        classify_tsv(lambda texts: fake_predict(texts, fail_on="tweet " + "x" * 5),
+                     FRAME_LABELS, data_file, out_prefix, chunksize=4)
+    write_tweets(data_file, 3)
+    assert classify_tsv(fake_predict, FRAME_LABELS, data_file, out_prefix, chunksize=4) == 3
+    assert read_outputs(out_prefix)["narrative"]["id_str"].tolist() == ["1000", "1001", "1002"]
+
+    # an input with nothing in it still gets header only outputs
+    empty_file = write_tweets(str(tmp_path / "empty.tsv"), 0)
+    assert classify_tsv(fake_predict, FRAME_LABELS, empty_file, str(tmp_path / "empty")) == 0
+    assert read_outputs(str(tmp_path / "empty"))["generic"].columns.tolist() == ["id_str", "Economic", "Crime", "text"]
@@ -0,0 +1,403 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+
+import frame_stats as fs
+import frame_stats.causal_inferrence as ci
+import frame_stats.granger as granger
+import frame_stats.multiple_testing as multiple_testing
+import frame_stats.regression as regression
+import frame_stats.time_series as ts
+from frame_stats.bootstrap import (bootstrap_distribution, jackknife_statistics,
+                                   parallel_replicates, bootstrap_block)
+from frame_stats.frame_tensor import FrameTensor, save_frame_tensor
+
+
+def toy_time_series() -> pd.DataFrame:
+    dates = pd.date_range("2018-01-01", periods=6, freq="1D", tz="UTC")
+    frames = np.array([[1, 0],
+                       [0, 2],
+                       [0, 0],
+                       [1, 1],
+                       [3, 0],
+                       [0, 1]])
+    return pd.DataFrame(frames, index=dates, columns=["Economic", "Crime and Punishment"])
+
+
+def test_construct_frame_pairs_array():
+    user_ts = toy_time_series()
+    expected = ci.construct_frame_pairs(user_ts)
+
+    pairs = ci.construct_frame_pairs_array(*ci.time_series_arrays(user_ts))
+    assert pairs.exposure.shape == (len(expected), 2)
+    for i, pair in enumerate(expected):
+        assert np.all(pairs.exposure[i] == pair["t"].values)
+        assert np.all(pairs.outcome[i] == pair["t+1"].values)
+        assert pairs.dates[i] == pair["t+1_date"].tz_localize(None).to_datetime64()
+
+
+def test_construct_tweet_self_influence_arrays():
+    frame_matrix, dates = ci.time_series_arrays(toy_time_series())
+    tweet_times = pd.Series(["2018-01-02 13:00:00+00:00",  # day before has frames
+                             "2018-01-04 08:00:00+00:00",  # day before is empty
+                             "2018-01-05 23:00:00+00:00",
+                             "2019-01-01 00:00:00+00:00"])  # outside the series
+    tweet_frames = np.array([[0, 1], [1, 1], [1, 0], [0, 0]])
+
+    pairs = ci.construct_tweet_self_influence_arrays(frame_matrix, dates, tweet_times,
+                                                     tweet_frames, ["a", "b", "c", "d"])
+    assert list(pairs.ids) == ["a", "c"]
+    assert np.all(pairs.exposure == np.array([[1, 0], [1, 1]]))
+    assert np.all(pairs.outcome == np.array([[0, 1], [1, 0]]))
+
+    # two copies of the same alter doubles the exposure
+    alter_pairs = ci.construct_tweet_alter_influence_arrays([frame_matrix, frame_matrix], dates,
+                                                            tweet_times, tweet_frames)
+    assert np.all(alter_pairs.exposure == 2 * pairs.exposure)
+
+
+def toy_tweets() -> pd.DataFrame:
+    return pd.DataFrame({"id_str": ["1", "2", "3", "4", "5"],
+                         "time_stamp": pd.to_datetime(["2018-01-01 10:00:00+00:00",
+                                                       "2018-01-01 12:00:00+00:00",
+                                                       "2018-01-03 09:00:00+00:00",
+                                                       "2018-01-02 23:00:00+00:00",
+                                                       "2018-01-05 01:00:00+00:00"]),
+                         "screen_name": ["alice", "alice", "alice", "bob", "bob"],
+                         "group": ["public"] * 5,
+                         "Economic": [1, 1, 0, 0, 1],
+                         "Crime and Punishment": [0, 1, 1, 1, 0]})
+
+
+def test_construct_all_frame_time_series():
+    config = {"dates": {"start": "01-01-2018 00:00:00", "end": "01-06-2018 23:59:59"}}
+    tweets = toy_tweets()
+
+    dense = ts.construct_all_frame_time_series(tweets, "1D", config)
+    sparse = ts.construct_all_frame_time_series(tweets, "1D", config, sparse=True)
+    assert dense.counts.shape == (2, 6, 2)
+
+    for i, user in enumerate(dense.users):
+        expected = ts.construct_frame_time_series(user, tweets, "1D", config)
+        assert np.all(dense.periods == expected.index)
+        assert np.all(dense.counts[i] == expected.values)
+        assert np.all(sparse.user_frame_matrix(i) == expected.values)
+        pd.testing.assert_frame_equal(dense.user_time_series(user), expected,
+                                      check_freq=False)
+
+
+def test_frame_tensor_round_trip(tmp_path):
+    config = {"dates": {"start": "01-01-2018 00:00:00", "end": "01-06-2018 23:59:59"}}
+    tweets = toy_tweets()
+    all_time_series = ts.construct_all_frame_time_series(tweets, "1D", config, sparse=True)
+    save_frame_tensor(str(tmp_path), all_time_series)
+
+    tensor = FrameTensor(str(tmp_path))
+    assert "alice" in tensor and "carol" not in tensor
+    pd.testing.assert_frame_equal(tensor["bob"], all_time_series.user_time_series("bob"), check_freq=False)
+
+    # label style inclusive date windows
+    assert np.all(tensor.user("alice", "2018-01-01", "2018-01-03").sum(axis=0) == [2, 2])
+    assert tensor.window("2018-01-02", "2018-01-03").shape == (2, 2, 2)
+    assert np.all(tensor.select(["bob", "carol", "alice"], "2018-01-02", "2018-01-02").sum(axis=(0, 1)) == [0, 1])
+
+    # counts that don't fit in uint16 widen the dtype instead of wrapping
+    dense = ts.construct_all_frame_time_series(tweets, "1D", config)
+    big = dense._replace(counts=dense.counts * 70000)
+    save_frame_tensor(str(tmp_path / "big"), big)
+    assert np.all(FrameTensor(str(tmp_path / "big")).counts == big.counts)
+
+
+def test_alter_exposure():
+    rng = np.random.default_rng(0)
+    counts = rng.integers(0, 3, size=(4, 10, 2))
+    adjacency = sp.csr_matrix(np.array([[0, 2, 0, 1],
+                                        [1, 0, 0, 0],
+                                        [0, 0, 0, 0],
+                                        [3, 0, 1, 0]]))
+
+    for window, weighted in [(1, True), (3, False), (12, True)]:
+        weights = adjacency.toarray() if weighted else (adjacency.toarray() > 0).astype(int)
+        exposure = ci.alter_exposure(counts, adjacency, window=window,
+                                     weighted=weighted, chunk_periods=4)
+
+        # straight loop over users, alters and days
+        for i in range(4):
+            for t in range(10):
+                lo = max(t - window, 0)
+                expected = sum(weights[i, j] * counts[j, lo:t].sum(axis=0) for j in range(4))
+                assert np.all(exposure[i, t] == expected)
+
+    assert np.all(ci.rolling_window_sum(counts, 2, lag=0)[:, 1:] == counts[:, 1:] + counts[:, :-1])
+
+    # per tweet lookups without the full exposure tensor
+    periods = pd.date_range("2018-01-01", periods=10, freq="D", tz="UTC")
+    user_rows = np.array([0, 3, 3, 1, -1, 2, 0])
+    tweet_times = pd.to_datetime(["2018-01-05 10:00", "2018-01-01 03:00", "2018-01-09 23:00",
+                                  "2018-01-05 01:00", "2018-01-05 01:00", "2018-01-07 12:00",
+                                  "2018-02-01 12:00"], utc=True)
+    for window, weighted in [(1, True), (3, False)]:
+        full = ci.alter_exposure(counts, adjacency, window=window, weighted=weighted)
+        expected = ci.lookup_tweet_exposure(full, periods, user_rows, tweet_times)
+        found = ci.tweet_window_exposure(counts, periods, user_rows, tweet_times, window,
+                                         adjacency=adjacency, weighted=weighted)
+        assert np.all(found[0] == expected[0]) and np.all(found[1] == expected[1])
+
+        expected = ci.lookup_tweet_exposure(ci.rolling_window_sum(counts, window), periods, user_rows, tweet_times)
+        assert np.all(ci.tweet_window_exposure(counts, periods, user_rows, tweet_times, window)[0] == expected[0])
+
+
+def test_bootstrap_distribution():
+    rng = np.random.default_rng(1)
+    frames = (rng.random((400, 3)) < [0.1, 0.5, 0.7]).astype(int)
+
+    for statistic in ["proportion", "entropy"]:
+        counts = bootstrap_distribution(frames, statistic, 4000, seed=1)
+        indices = bootstrap_distribution(frames, statistic, 4000, seed=1, shortcut=False)
+        assert counts.shape == indices.shape == (4000, 3)
+
+        # both ways of resampling give the same distribution
+        assert np.allclose(counts.mean(axis=0), indices.mean(axis=0), atol=0.005)
+        assert np.allclose(counts.std(axis=0), indices.std(axis=0), rtol=0.1)
+
+    # a single column against the one at a time loop
+    result = fs.bootstrap_ci(frames[:, 1], "proportion", 4000, 0.05, seed=2)
+    looped = fs.bootstrap_ci(frames[:, 1], lambda x: x.sum() / x.shape[0], 4000, 0.05, seed=2)
+    assert result["estimate"] == looped["estimate"]
+    assert abs(result["lower"] - looped["lower"]) < 0.01
+    assert abs(result["upper"] - looped["upper"]) < 0.01
+
+    columns = fs.bootstrap_ci(frames, "proportion", 4000, 0.05, seed=2)
+    assert np.all(columns["lower"] < columns["estimate"])
+    assert np.all(columns["estimate"] < columns["upper"])
+
+
+def test_jackknife_statistics():
+    rng = np.random.default_rng(3)
+    values = rng.integers(0, 4, size=50)
+    looped = np.array([np.std(np.delete(values, i)) for i in range(50)])
+
+    # one call per distinct value instead of per row, and cached after
+    calls = []
+    def spread(x):
+        calls.append(1)
+        return np.std(x)
+    assert np.allclose(jackknife_statistics(values, spread), looped)
+    assert len(calls) == 4
+    jackknife_statistics(values, spread)
+    assert len(calls) == 4
+
+    assert np.allclose(jackknife_statistics(values, "mean"),
+                       [np.delete(values, i).mean() for i in range(50)])
+
+
+def test_bca_interval():
+    # skewed, rare frame: bca stays inside [0, 1] where residual does not
+    frames = np.zeros(200, dtype=int)
+    frames[:2] = 1
+
+    residual = fs.bootstrap_ci(frames, "proportion", 4000, 0.05, method="residual", seed=4)
+    bca = fs.bootstrap_ci(frames, "proportion", 4000, 0.05, method="bca", seed=4)
+    assert residual["lower"] < 0
+    assert 0 <= bca["lower"] < bca["estimate"] < bca["upper"]
+
+    studentized = fs.bootstrap_ci(frames, "proportion", 4000, 0.05, method="studentized", seed=4)
+    assert studentized["lower"] < bca["estimate"] < studentized["upper"]
+
+
+def test_bootstrap_ci_multivariate():
+    rng = np.random.default_rng(5)
+    frames = pd.DataFrame((rng.random((300, 4)) < [0.05, 0.2, 0.3, 0.6]).astype(int),
+                          columns=["a", "b", "c", "d"])
+
+    def share_of_first(df):
+        sums = df.values.sum(axis=0)
+        return sums[0] / sums.sum()
+
+    def share_of_first_from_sums(sums):
+        return sums[:, 0] / sums.sum(axis=1)
+
+    looped = fs.bootstrap_ci_multivariate(frames, share_of_first, 3000, "rows", 0.05, seed=6)
+    summed = fs.bootstrap_ci_multivariate(frames, share_of_first, 3000, "rows", 0.05, seed=6,
+                                          sum_statistic=share_of_first_from_sums)
+    assert looped["estimate"] == summed["estimate"]
+    assert abs(looped["lower"] - summed["lower"]) < 0.01
+    assert abs(looped["upper"] - summed["upper"]) < 0.01
+
+    columns = fs.bootstrap_ci_multivariate(frames, lambda df: df.values.mean(), 200,
+                                           "columns", 0.05, seed=6)
+    assert columns["lower"] < columns["estimate"] < columns["upper"]
+
+
+def test_parallel_replicates():
+    frames = (np.random.default_rng(7).random(300) < 0.2).astype(int)
+
+    serial = parallel_replicates(bootstrap_block, 2000, args=(frames, "proportion"),
+                                 seed=8, n_workers=1, block_size=250)
+    pooled = parallel_replicates(bootstrap_block, 2000, args=(frames, "proportion"),
+                                 seed=8, n_workers=3, block_size=250)
+    assert serial.shape == (2000,)
+    assert np.array_equal(serial, pooled)
+
+    # early stopping happens at the same block whatever the worker count
+    stopped = parallel_replicates(bootstrap_block, 100000, args=(frames, "proportion"),
+                                  seed=8, n_workers=2, block_size=250,
+                                  tolerance=0.01, check_every=4)
+    assert stopped.shape[0] < 100000
+    # block seeds don't depend on how many blocks there are
+    n_shared = min(stopped.shape[0], serial.shape[0])
+    assert np.array_equal(stopped[:n_shared], serial[:n_shared])
+    assert np.array_equal(stopped, parallel_replicates(bootstrap_block, 100000,
+                                                       args=(frames, "proportion"),
+                                                       seed=8, n_workers=1, block_size=250,
+                                                       tolerance=0.01, check_every=4))
+
+
+def toy_granger_series(n: int = 200) -> tuple:
+    rng = np.random.default_rng(9)
+    events = (rng.random(n) < 0.05).astype(float)
+    left = rng.normal(size=n)
+    right = np.zeros(n)
+    for t in range(2, n):
+        right[t] = 0.3 * right[t - 1] + 0.5 * left[t - 1] + 0.3 * events[t - 2] + rng.normal()
+    series = {"left": {"Economic": left, "Crime": rng.normal(size=n)},
+              "right": {"Economic": right, "Crime": np.zeros(n)}}
+    return series, events
+
+
+def test_granger_tests_match_statsmodels():
+    from statsmodels.tsa.api import VAR
+    series, events = toy_granger_series()
+    source, target = series["left"]["Economic"], series["right"]["Economic"]
+
+    data = pd.DataFrame({"source": source, "target": target, "events": events})
+    fit = VAR(data).fit(maxlags=6, ic="aic")
+    tests = granger.granger_tests(source, target, events, fit.k_ar)
+    assert granger.select_lag_order(source, target, events, 6) == fit.k_ar
+
+    for events_causing, causing in [(False, "source"), (True, ["source", "events"])]:
+        expected = fit.test_causality("target", causing)
+        assert np.isclose(tests[events_causing]["f_statistic"], expected.test_statistic)
+        assert np.isclose(tests[events_causing]["p_value"], expected.pvalue)
+
+
+def test_batched_var_matches_statsmodels():
+    from statsmodels.tsa.api import VAR
+    rng = np.random.default_rng(10)
+    data = rng.normal(size=(5, 150, 3))
+    data[:, 1:, 1] += 0.6 * data[:, :-1, 0]
+    data[2, :, 2] = (rng.random(150) < 0.05)
+    data[3, :, 2] = 0
+    data[3, 40, 2] = 1  # a single event, rank deficient at larger lags
+
+    criteria = granger.information_criteria(data, 5)
+    orders = granger.select_lag_orders(data, 5)
+    for b in range(data.shape[0]):
+        selected = VAR(data[b]).select_order(5)
+        assert np.allclose(criteria["aic"][b], [selected.ics["aic"][p] for p in range(6)])
+        assert np.allclose(criteria["hqic"][b], [selected.ics["hqic"][p] for p in range(6)])
+        assert orders[b] == selected.selected_orders["aic"]
+
+    # every series at one lag order, shuffles against direct refits
+    p = 3
+    tests = granger.granger_tests_batch(data[:, :, 0], data[:, :, 1], data[:, :, 2], p,
+                                        n_shuffles=5, rngs=[np.random.default_rng(b) for b in range(5)])
+    for b in range(data.shape[0]):
+        fit = VAR(data[b]).fit(p)
+        expected = fit.test_causality(1, [0, 2])
+        assert np.isclose(tests[True]["f_statistic"][b], expected.test_statistic)
+        assert np.isclose(tests[True]["p_value"][b], expected.pvalue)
+
+        shuffled = np.random.default_rng(b).permuted(np.broadcast_to(data[b, :, 0], (5, 150)), axis=1)
+        for s in range(5):
+            null_fit = VAR(np.column_stack((shuffled[s], data[b, :, 1:]))).fit(p)
+            assert np.isclose(tests[False]["null_f_statistics"][b, s],
+                              null_fit.test_causality(1, 0).test_statistic)
+
+
+def test_run_granger_sweep_resumes(tmp_path):
+    series, events = toy_granger_series()
+    out_path = str(tmp_path / "sweep.tsv")
+    pairs = [("left", "right"), ("right", "left")]
+
+    results = granger.run_granger_sweep(series, pairs, ["Economic", "Crime"], events, out_path,
+                                        maxlags=4, n_shuffles=20, seed=1, n_workers=2)
+    # the constant series is skipped
+    assert results.shape[0] == 4
+    assert results.set_index(["source", "events_causing"]).loc[("left", False), "bootstrap_p"].item() == 0
+
+    # cut the file off halfway through the last row and rerun
+    with open(out_path, "rb+") as fout:
+        contents = fout.read()
+        fout.truncate(len(contents) - 10)
+    resumed = granger.run_granger_sweep(series, pairs, ["Economic", "Crime"], events, out_path,
+                                        maxlags=4, n_shuffles=20, seed=1, n_workers=1)
+    sort_cols = ["source", "target", "frame", "events_causing"]
+    pd.testing.assert_frame_equal(resumed.sort_values(sort_cols).reset_index(drop=True),
+                                  results.sort_values(sort_cols).reset_index(drop=True))
+
+
+def test_multiple_testing_matches_statsmodels():
+    from statsmodels.stats.multitest import multipletests
+    rng = np.random.default_rng(11)
+    p_values = np.concatenate((rng.random(40), rng.random(10) * 0.001))
+    groups = np.repeat(["a", "b"], 25)
+
+    for method, name in [("holm", "holm"), ("bh", "fdr_bh"), ("by", "fdr_by")]:
+        corrected = multiple_testing.adjust_p_values(p_values, method, groups)
+        for group in ["a", "b"]:
+            expected = multipletests(p_values[groups == group], method=name)[1]
+            assert np.allclose(corrected[groups == group], expected)
+
+    tests = pd.DataFrame({"p_value": p_values, "family": groups})
+    tests.loc[3, "p_value"] = np.nan
+    corrected = multiple_testing.correct_p_values(tests, "holm", by="family")
+    assert np.isnan(corrected.loc[3, "p_corrected"]) and not corrected.loc[3, "null_rejected"]
+    assert np.allclose(corrected["p_corrected"].drop(index=3),
+                       multiple_testing.holm(tests["p_value"].drop(index=3).values,
+                                             groups=groups[tests.index != 3]).p_corrected)
+
+
+def test_max_t_is_monotone():
+    rng = np.random.default_rng(12)
+    statistics = np.array([12.0, 0.5, 2.0, 3.0])
+    null_statistics = rng.normal(size=(2000, 4)) ** 2
+
+    result = multiple_testing.max_t(statistics, null_statistics)
+    order = np.argsort(-statistics)
+    assert np.all(np.diff(result.p_corrected[order]) >= 0)
+    # the most extreme test only has to beat the max over every test
+    assert np.isclose(result.p_corrected[0], np.mean(null_statistics.max(axis=1) >= 12.0))
+    assert result.rejected.tolist() == [True, False, False, False]
+
+
+def test_stacked_logits_match_statsmodels():
+    import statsmodels.api as sm
+    rng = np.random.default_rng(13)
+    n, frames = 500, ["Economic", "Crime", "Cultural"]
+    covariates = pd.DataFrame({"log_chars": rng.normal(size=n), "is_reply": rng.random(n) < 0.3})
+    self_exposure = (rng.random((n, 3)) < 0.4).astype(float)
+    alter_exposure = rng.poisson(1.0, size=(n, 3)).astype(float)
+    logits = -1 + self_exposure + 0.3 * alter_exposure + 0.5 * covariates[["log_chars"]].values
+    outcomes = (rng.random((n, 3)) < 1 / (1 + np.exp(-logits))).astype(float)
+    alter_exposure[:20, 1] = np.nan
+
+    data = regression.FrameRegressionData(outcomes,
+                                          {"self_exposure": self_exposure,
+                                           "alter_exposure": alter_exposure},
+                                          covariates, frames)
+    table = data.fit("combined").set_index(["frame", "term"])
+    assert table.loc[("Crime", "const"), "n_obs"] == n - 20
+
+    for i, frame in enumerate(frames):
+        exog = covariates.astype(float).assign(alter_exposure=alter_exposure[:, i],
+                                               self_exposure=self_exposure[:, i])
+        keep = exog.notna().all(axis=1).values
+        expected = sm.Logit(outcomes[keep, i], sm.add_constant(exog[keep])).fit(disp=0)
+        assert np.allclose(table.loc[frame, "coef"].values, expected.params.values, atol=1e-6)
+        assert np.allclose(table.loc[frame, "std_err"].values, expected.bse.values, atol=1e-6)
+        assert np.allclose(table.loc[frame, "p_value"].values, expected.pvalues.values, atol=1e-6)
+
+    # same fits from the worker pool, and a different spec from the same data
+    pd.testing.assert_frame_equal(data.fit("combined", n_workers=2).set_index(["frame", "term"]), table)
+    assert set(data.fit("self", covariates=["is_reply"])["term"]) == {"const", "is_reply", "self_exposure"}
@@ -0,0 +1,292 @@
+import asyncio
+import gzip
+import json
+import pandas as pd
+
+from test_edge_finder import public_tweet, journalist_tweet, congress_tweet
+import re
+from async_downloader import AsyncDownloader, ResumeJournal, conversation_job, quote_tweets_job
+from crawl_frontier import CrawlFrontier
+from mock_twitter_server import MockTwitterServer
+from tweet_catalog import IncrementalCatalog, SegmentedTweetStore
+from text_filters import KeywordPrefilter, TextMatcher, classify_texts, expand_keywords, pattern_counts
+from tweet_columns import parse_columns, read_columns
+from tweet_reader import iter_lines, read_tweets
+from tweet_handler import filter_by_text, read_keyword_tweets
+from tweet_store import TweetStore, TweetStoreWriter
+
+
+def test_tweet_store_round_trip(tmp_path):
+    store_path = str(tmp_path / "store")
+    with TweetStoreWriter(store_path) as writer:
+        writer.add(public_tweet())
+        writer.add(journalist_tweet())
+        writer.add(congress_tweet())
+
+    store = TweetStore(store_path)
+    assert len(store) == 3
+    assert "948280895772950535" in store
+    assert 1 not in store
+
+    hot = store.get(["1174838654168182784", "12345", 1053262168534278144])
+    assert list(hot["id"]) == ["1174838654168182784", "1053262168534278144"]
+    assert list(hot["screen_name"]) == ["jdawsey1", "gambler1647"]
+    assert hot["reply_to_id"][0] == "948280895772950535"
+    assert hot["quote_of_id"][1] == "1053110153883643905"
+    assert hot["created_at"][1].year == 2018
+
+    assert store.get_json("948280895772950535") == congress_tweet()
+
+
+def test_tweet_store_last_write_wins(tmp_path):
+    store_path = str(tmp_path / "store")
+    edited = congress_tweet()
+    edited["text"] = "edited"
+    with TweetStoreWriter(store_path, keep_raw=False) as writer:
+        writer.add(congress_tweet())
+        writer.add(edited)
+
+    store = TweetStore(store_path)
+    assert len(store) == 1
+    assert store.get([edited["id"]], columns=["text"])["text"][0] == "edited"
+
+
+def write_gz_lines(path: str, tweets) -> str:
+    with gzip.open(path, "wt") as fout:
+        for tweet in tweets:
+            fout.write(json.dumps(tweet) + "\n")
+    return path
+
+
+def test_read_tweets_streams_in_order(tmp_path):
+    first = [{"id_str": str(i), "id": i, "user": {"id": 99999, "id_str": "99999"}} for i in range(5000)]
+    second = [public_tweet(), journalist_tweet()]
+    paths = [write_gz_lines(str(tmp_path / "a.gz"), first),
+             write_gz_lines(str(tmp_path / "b.gz"), second)]
+
+    tweets = list(read_tweets(paths, n_threads=2))
+    assert tweets == first + second
+
+    # the prefilter only lets through lines with one of the ids, and the
+    # user id doesn't count as the tweet id
+    kept = list(read_tweets(paths, keep_ids=["99999", 42, second[1]["id"]]))
+    assert kept == [first[42], second[1]]
+
+    # stopping early doesn't hang on the threads still reading
+    lines = iter_lines(paths, chunk_size=64)
+    assert json.loads(next(lines)) == first[0]
+    lines.close()
+
+
+def test_read_tweets_skips_corrupted(tmp_path):
+    good = write_gz_lines(str(tmp_path / "good.gz"), [congress_tweet()])
+    bad = str(tmp_path / "bad.gz")
+    with open(bad, "wb") as fout:
+        fout.write(b"not a gzip file")
+
+    assert list(read_tweets([bad, good], skip_corrupted=True)) == [congress_tweet()]
+    try:
+        list(read_tweets([bad, good]))
+        assert False, "corrupted file should raise"
+    except OSError:
+        pass
+
+
+def test_read_columns_projects_fields(tmp_path):
+    path = write_gz_lines(str(tmp_path / "public.gz"), [public_tweet(), [public_tweet(), public_tweet()]])
+    df = read_columns(path, ["id_str", "screen_name", "time_stamp", "year", "quote_of_id", "reply_to_id"])
+
+    assert list(df.columns) == ["id_str", "screen_name", "time_stamp", "year", "quote_of_id", "reply_to_id"]
+    assert df.shape[0] == 3
+    assert df.loc[0, "id_str"] == "1053262168534278144"
+    assert df.loc[0, "quote_of_id"] == "1053110153883643905"
+    assert df["reply_to_id"].isna().all()
+    assert df.loc[0, "time_stamp"] == pd.Timestamp("2018-10-19 12:30:44")
+    assert df.loc[0, "year"] == 2018
+
+    journalists = parse_columns([journalist_tweet()], ["user_id", "reply_to_id", "favorite_count"], "v2")
+    assert journalists.iloc[0].tolist() == ["38936142", "948280895772950535", 309]
+
+
+def test_text_filters_classify_in_one_pass():
+    matcher = TextMatcher("immigration|immigrants?|illegals|undocumented|illegal aliens?|migrants?|migration")
+    texts = pd.Series(['"RT @someone: immigration reform now',
+                       "new take on it QT @other: undocumented immigrants",
+                       "migrants and more migrants @friend",
+                       None,
+                       "nothing to see"])
+
+    classes = classify_texts(texts, matcher)
+    assert classes["retweet"].tolist() == [True, False, False, False, False]
+    assert classes["quote"].tolist() == [False, True, False, False, False]
+    assert classes["keyword"].tolist() == [True, True, True, False, False]
+    assert classes["kept_text"].tolist()[1:3] == ["new take on it ", "migrants and more migrants @friend"]
+    assert pd.isna(classes["kept_text"][0])
+
+    counts = pattern_counts(texts, matcher)
+    assert counts["texts"] == 5 and counts["mention"] == 3 and counts["keyword"] == 3
+    assert counts["migrants?"] == 1 and counts["undocumented"] == 1 and counts["illegals"] == 0
+
+
+def test_keyword_prefilter_matches_query(tmp_path):
+    query = "immigration|immigrants?|illegals|undocumented|illegal aliens?|migrants?|migration"
+    assert expand_keywords("illegal aliens?|migration") == ["illegal alien", "illegal aliens", "migration"]
+
+    prefilter = KeywordPrefilter.from_query(query)
+    texts = ["Immigration", "the migrants", "illegal  aliens", "undocumented", "illegals!", "",
+             "emigration", "an immigrant family", "no match here"]
+    for text in texts:
+        assert prefilter.search(text) == (re.search(query, text) is not None)
+    assert prefilter.matches(texts + [None]).tolist() == [prefilter.search(text) for text in texts] + [False]
+
+    # raw lines are rejected before parsing unless a keyword is in there
+    tweets = [{"id_str": "1", "text": "migration\tpolicy \u00e9"}, {"id_str": "2", "text": "weather"}]
+    path = write_gz_lines(str(tmp_path / "tweets.gz"), tweets)
+    assert list(read_tweets(path, line_filter=prefilter)) == tweets[:1]
+
+    # whitespace inside a multi-word keyword is escaped in the raw line but
+    # a space once the text is cleaned, the tweet still has to get through
+    tweets = [{"id_str": "1", "text": "stop the illegal\nalien invasion"},
+              {"id_str": "2", "text": "illegal alien here"},
+              {"id_str": "3", "text": "illegal\tparking"}]
+    path = write_gz_lines(str(tmp_path / "whitespace.gz"), tweets)
+    assert [tweet["id_str"] for tweet in read_keyword_tweets(path, query)] == ["1", "2"]
+    assert [tweet["id_str"] for tweet in read_keyword_tweets(path, query)] == \
+        [tweet["id_str"] for tweet in tweets if filter_by_text(tweet, query) is not None]
+
+
+def test_async_downloader_resumes_from_journal(tmp_path):
+    # three conversations and a quote job, one page keeps failing on the first run
+    recordings = {f"search:conversation_id:{c}": [[{"id": f"{c}{p}{t}"} for t in range(3)]
+                                                  for p in range(4)]
+                  for c in range(1, 4)}
+    recordings["quotes:9"] = [[{"id": "91"}], [{"id": "92"}]]
+    jobs = [conversation_job(str(c), "2018-01-01T00:00:00Z", "2019-12-31T00:00:00Z") for c in range(1, 4)]
+    jobs.append(quote_tweets_job("9"))
+    out_path = str(tmp_path / "tweets.gz")
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    async def run(server):
+        base_url = await server.start()
+        try:
+            downloader = AsyncDownloader("token", out_path, journal_path, base_url,
+                                         concurrency=4, rate=1000, max_retries=2, backoff=0.01)
+            return await downloader.run(jobs)
+        finally:
+            await server.stop()
+
+    flaky = MockTwitterServer(recordings, failures={("search:conversation_id:2", 2): 2})
+    stats = asyncio.run(run(flaky))
+    assert stats["failed"] == 1 and stats["finished"] == 3
+    assert stats["tweets"] == 3 * 4 * 3 - 2 * 3 + 2
+
+    # a page that was half written when the first run stopped is cut off
+    with open(out_path, "ab") as fout:
+        fout.write(b"\x1f\x8b half a page")
+
+    # the rerun only asks for the pages the first run didn't get
+    server = MockTwitterServer(recordings)
+    stats = asyncio.run(run(server))
+    assert server.requests == [("search:conversation_id:2", 2), ("search:conversation_id:2", 3)]
+    assert stats["finished"] == 1
+
+    tweets = list(read_tweets(out_path))
+    assert sorted(tweet["id"] for tweet in tweets) == sorted(
+        tweet["id"] for pages in recordings.values() for page in pages for tweet in page)
+    assert all(tweet["conversation"] == tweet["id"][0] for tweet in tweets if tweet["id"][0] != "9")
+    assert all(tweet["quote_of"] == "9" for tweet in tweets if tweet["id"][0] == "9")
+
+    # everything is done, nothing left to fetch
+    server = MockTwitterServer(recordings)
+    asyncio.run(run(server))
+    assert server.requests == []
+
+
+def test_async_downloader_caps_pages(tmp_path):
+    recordings = {"quotes:9": [[{"id": str(p)}] for p in range(5)]}
+    out_path = str(tmp_path / "tweets.gz")
+    journal_path = str(tmp_path / "journal.jsonl")
+
+    async def run(server):
+        base_url = await server.start()
+        try:
+            downloader = AsyncDownloader("token", out_path, journal_path, base_url,
+                                         rate=1000, max_pages=3)
+            return await downloader.run([quote_tweets_job("9")])
+        finally:
+            await server.stop()
+
+    # a job with more pages than the cap is done, not left unfinished
+    stats = asyncio.run(run(MockTwitterServer(recordings)))
+    assert stats["capped"] == 1 and stats["finished"] == 0 and stats["pages"] == 3
+    journal = ResumeJournal(journal_path)
+    assert journal.done("quotes:9") and journal.capped("quotes:9")
+    journal.close()
+    assert [tweet["id"] for tweet in read_tweets(out_path)] == ["0", "1", "2"]
+
+    server = MockTwitterServer(recordings)
+    asyncio.run(run(server))
+    assert server.requests == []
+
+
+def test_crawl_frontier_dedups_and_resumes(tmp_path):
+    db_path = str(tmp_path / "frontier.sqlite")
+    frontier = CrawlFrontier(db_path, str(tmp_path / "shards"), max_attempts=2)
+    assert frontier.add("conversation", ["1", "2", "3"], [1, 5, 1]) == 3
+    assert frontier.add("conversation", ["1", "1", "4"], [1, 3, 0]) == 1
+    frontier.mark_done("conversation", ["4"])
+
+    # highest reply volume first, done ids never come back
+    batch = frontier.next_batch(2)
+    assert batch.items == [("conversation", "1"), ("conversation", "2")]
+    frontier.close()
+
+    # a restart gets the same claimed batch back, conversation 2 never finishes
+    frontier = CrawlFrontier(db_path, str(tmp_path / "shards"), max_attempts=2)
+    assert frontier.next_batch(2) == batch
+    journal = ResumeJournal(batch.journal_path)
+    journal.record("conversation:1", None, 7)
+    journal.record("conversation:2", "next", 3)
+    journal.close()
+    assert frontier.finish_batch(batch) == {"done": 1, "unfinished": 1}
+    assert frontier.done_counts("conversation", 1, batch.shard) == [("1", 7)]
+
+    retry = frontier.next_batch(2)
+    assert retry.shard == batch.shard and retry.items == [("conversation", "2")]
+    frontier.finish_batch(retry)
+
+    assert frontier.next_batch(2).items == [("conversation", "3")]
+    assert frontier.add("conversation", ["1", "2"]) == 0
+    assert frontier.status_counts()["conversation"] == {"pending": 0, "claimed": 1, "done": 2, "failed": 1}
+    frontier.close()
+
+
+def test_incremental_catalog_reads_only_new_files(tmp_path):
+    day_1 = write_gz_lines(str(tmp_path / "day_1.gz"), [public_tweet()])
+    second = journalist_tweet()
+    day_2 = write_gz_lines(str(tmp_path / "day_2.gz"), [second, congress_tweet()])
+    catalog_path = str(tmp_path / "catalog")
+
+    def build(files):
+        with IncrementalCatalog(catalog_path, max_segments=2) as catalog:
+            changed = catalog.changed_files(files)
+            with catalog.delta(changed) as writer:
+                for tweet, raw in read_tweets(changed, with_raw=True):
+                    writer.add(tweet, raw=raw)
+        return changed
+
+    assert build([day_1]) == [day_1]
+    assert build([day_1, day_2]) == [day_2]
+    assert build([day_1, day_2]) == []
+
+    # a changed file goes in again and its new copy of the tweet wins
+    edited = dict(second, text="an edited text")
+    write_gz_lines(day_2, [edited])
+    assert build([day_1, day_2]) == [day_2]
+
+    store = SegmentedTweetStore(catalog_path)
+    assert len(store.segments) == 1  # three deltas were compacted
+    assert len(store) == 3
+    assert store.get([congress_tweet()["id"], second["id"], "123"], ["text"])["text"].tolist() == \
+        [congress_tweet()["text"], "an edited text"]
+    assert store.get_json(public_tweet()["id_str"]) == public_tweet()
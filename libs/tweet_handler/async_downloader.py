@@ -0,0 +1,364 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+
+# concurrent twitter api v2 downloads. every user / conversation / quoted
+# tweet is one paginated job, jobs run concurrently over one connection pool
+# and every request takes a token from a shared bucket that follows the
+# x-rate-limit-* headers the api sends back, so we go as fast as the api
+# lets us instead of sleeping a second per tweet.
+#
+# each page is appended to the output as its own gzip member and then
+# recorded in an append-only journal with the token of the next page and
+# the length of the output after it, so a restarted run cuts off whatever
+# was written after the last recorded page and picks every job up at the
+# page it stopped on. a job that runs into the page cap with pages left is
+# recorded as done (and capped) so it isn't retried forever
+
+API_URL = "https://api.twitter.com"
+SEARCH_ALL = "/2/tweets/search/all"
+
+# pages per job, tweepy's Paginator(limit=50) before
+MAX_PAGES = 50
+
+
+def api_fields(tweet_fields: List[str], user_fields: List[str], expansions: List[str]) -> Dict:
+    """
+    Query parameters for the field lists in constants.py, e.g.
+    `api_fields(api_tweet_fields, api_user_fields, api_tweet_expansions)`.
+    """
+    return {"tweet.fields": ",".join(tweet_fields),
+            "user.fields": ",".join(user_fields),
+            "expansions": ",".join(expansions)}
+
+
+def api_time(time_stamp) -> str:
+    # the api wants RFC 3339, constants.py has naive utc datetimes
+    if isinstance(time_stamp, datetime):
+        return time_stamp.strftime("%Y-%m-%dT%H:%M:%SZ")
+    return time_stamp
+
+
+class DownloadJob(NamedTuple):
+    key: str  # unique name for the journal, e.g. "user:benshapiro"
+    path: str  # api path
+    params: Dict  # query parameters
+    extra: Dict = {}  # fields added to every tweet, e.g. {"screen_name": ...}
+    token_param: str = "next_token"  # how the endpoint takes the page token
+
+
+def search_job(key: str, query: str, start_time: str, end_time: str,
+               fields: Optional[Dict] = None, extra: Optional[Dict] = None) -> DownloadJob:
+    """
+    Full archive search job. `fields` holds the tweet.fields / user.fields /
+    expansions parameters.
+    """
+    params = {"query": query,
+              "start_time": api_time(start_time),
+              "end_time": api_time(end_time),
+              "max_results": 500}
+    params.update(fields or {})
+    return DownloadJob(key, SEARCH_ALL, params, extra or {})
+
+
+def conversation_job(conversation_id: str, start_time: str, end_time: str,
+                     fields: Optional[Dict] = None) -> DownloadJob:
+    return search_job(f"conversation:{conversation_id}", f"conversation_id:{conversation_id}",
+                      start_time, end_time, fields, {"conversation": str(conversation_id)})
+
+
+def quote_tweets_job(tweet_id: str, fields: Optional[Dict] = None) -> DownloadJob:
+    params = {"max_results": 100}
+    params.update(fields or {})
+    return DownloadJob(f"quotes:{tweet_id}", f"/2/tweets/{tweet_id}/quote_tweets", params,
+                       {"quote_of": str(tweet_id)}, "pagination_token")
+
+
+class TokenBucket:
+    """
+    Request budget shared by every job. Refills at `rate` requests per
+    second up to `capacity`, and whenever a response says how many requests
+    are left in the window (and when it resets) that takes over: we never
+    spend more than the api says remain, and wait for the reset when none
+    do.
+    """
+
+    def __init__(self, rate: float = 1.0, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.remaining = None  # requests the api says are left in the window
+        self.reset_at = 0.0  # wall clock time the window resets
+        self.lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                # out of requests for this window, wait it out
+                if self.remaining is not None and self.remaining <= 0:
+                    wait = self.reset_at - time.time()
+                    if wait > 0:
+                        logger.info(f"Rate limit reached, waiting {wait:.0f}s for the reset")
+                        await asyncio.sleep(wait)
+                    self.remaining = None
+
+                self._refill()
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    if self.remaining is not None:
+                        self.remaining -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def update(self, headers) -> None:
+        """
+        Take the window state from the x-rate-limit-remaining and
+        x-rate-limit-reset headers of a response.
+        """
+        if "x-rate-limit-remaining" not in headers:
+            return
+        self.remaining = int(headers["x-rate-limit-remaining"])
+        self.reset_at = float(headers.get("x-rate-limit-reset", time.time()))
+
+    def exhausted(self, reset_at: Optional[float] = None) -> None:
+        # a 429, nothing left until the reset
+        self.remaining = 0
+        self.reset_at = reset_at if reset_at is not None else time.time() + 60
+
+
+class ResumeJournal:
+    """
+    Append-only json-lines record of the pages every job has finished. The
+    last entry of a job has the token of its next page, or done. Every
+    entry also has the length of the output once its page was written, the
+    last one is where a resumed download continues from.
+
+    Parameters
+    ----------
+    path: str
+        Journal file, created if it doesn't exist
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.state = {}
+        self.out_bytes = 0
+        if os.path.exists(path):
+            with open(path, "r") as fin:
+                for line in fin:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # cut off by a crash mid write
+                        continue
+                    self.state[entry["job"]] = entry
+                    self.out_bytes = entry.get("out_bytes", self.out_bytes)
+        self.fout = open(path, "a")
+
+    def done(self, key: str) -> bool:
+        return self.state.get(key, {}).get("done", False)
+
+    def next_token(self, key: str) -> Optional[str]:
+        return self.state.get(key, {}).get("next_token")
+
+    def pages(self, key: str) -> int:
+        return self.state.get(key, {}).get("pages", 0)
+
+    def capped(self, key: str) -> bool:
+        return self.state.get(key, {}).get("capped", False)
+
+    def record(self, key: str, next_token: Optional[str], n_tweets: int,
+               out_bytes: Optional[int] = None, capped: bool = False):
+        """
+        Record a finished page of `key`. `out_bytes` is the output's length
+        with the page in it, `capped` ends a job that still has pages left.
+        """
+        if out_bytes is None:
+            out_bytes = self.out_bytes
+        entry = {"job": key,
+                 "next_token": next_token,
+                 "pages": self.pages(key) + 1,
+                 "n_tweets": self.state.get(key, {}).get("n_tweets", 0) + n_tweets,
+                 "out_bytes": out_bytes,
+                 "capped": capped and next_token is not None,
+                 "done": next_token is None or capped}
+        self.state[key] = entry
+        self.out_bytes = out_bytes
+        self.fout.write(json.dumps(entry) + "\n")
+        self.fout.flush()
+
+    def close(self):
+        self.fout.close()
+
+
+class AsyncDownloader:
+    """
+    Runs download jobs concurrently against the api.
+
+    Parameters
+    ----------
+    bearer_token: str
+        Api bearer token
+    out_path: str
+        Gzip json-lines file every tweet is appended to
+    journal_path: str
+        Resume journal
+    base_url: str
+        Api root, e.g. a local `MockTwitterServer` in tests
+    concurrency: int
+        Jobs paginating at once, and connections in the pool
+    rate: float
+        Requests per second when the api hasn't told us otherwise. The full
+        archive search allows one
+    max_pages: int
+        Pages per job, a job with more is recorded as done and capped
+    max_retries: int
+        Attempts for a page that fails with a server or connection error
+    """
+
+    def __init__(self,
+                 bearer_token: str,
+                 out_path: str,
+                 journal_path: str,
+                 base_url: str = API_URL,
+                 concurrency: int = 8,
+                 rate: float = 1.0,
+                 max_pages: int = MAX_PAGES,
+                 max_retries: int = 5,
+                 backoff: float = 2.0):
+        self.headers = {"Authorization": f"Bearer {bearer_token}"}
+        self.out_path = out_path
+        self.journal_path = journal_path
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.rate = rate
+        self.max_pages = max_pages
+        self.max_retries = max_retries
+        self.backoff = backoff
+
+    async def run(self, jobs: Iterable[DownloadJob]) -> Dict[str, int]:
+        """
+        Download every job that isn't finished in the journal.
+
+        Returns
+        -------
+        stats: Dict[str, int]
+            Pages and tweets downloaded this run, jobs finished, jobs
+            stopped at the page cap and jobs that gave up on a page
+        """
+        self.bucket = TokenBucket(self.rate, max(1.0, self.rate))
+        self.journal = ResumeJournal(self.journal_path)
+        self.stats = {"pages": 0, "tweets": 0, "finished": 0, "capped": 0, "failed": 0}
+
+        # drop anything written after the last page in the journal, e.g. a
+        # page that was half written when we stopped
+        if os.path.exists(self.out_path):
+            with open(self.out_path, "r+b") as fout:
+                fout.truncate(self.journal.out_bytes)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        connector = aiohttp.TCPConnector(limit=self.concurrency)
+        try:
+            with open(self.out_path, "ab") as self.fout:
+                async with aiohttp.ClientSession(self.base_url, connector=connector,
+                                                 headers=self.headers) as session:
+
+                    async def run_job(job: DownloadJob):
+                        async with semaphore:
+                            await self._paginate(session, job)
+
+                    await asyncio.gather(*[run_job(job) for job in jobs
+                                           if not self.journal.done(job.key)])
+        finally:
+            self.journal.close()
+        return self.stats
+
+    async def _paginate(self, session: aiohttp.ClientSession, job: DownloadJob):
+        token = self.journal.next_token(job.key)
+        while True:
+            params = dict(job.params)
+            if token is not None:
+                params[job.token_param] = token
+
+            page = await self._get(session, job.path, params)
+            if page is None:
+                self.stats["failed"] += 1
+                return
+
+            tweets = page.get("data", [])
+            self._write(tweets, job.extra)
+            token = page.get("meta", {}).get("next_token")
+            capped = self.journal.pages(job.key) + 1 >= self.max_pages
+            self.journal.record(job.key, token, len(tweets), self.fout.tell(), capped)
+            self.stats["pages"] += 1
+            self.stats["tweets"] += len(tweets)
+            if token is None:
+                self.stats["finished"] += 1
+                return
+            if capped:
+                logger.info(f"{job.key} stopped at {self.max_pages} pages with more left")
+                self.stats["capped"] += 1
+                return
+
+    async def _get(self, session: aiohttp.ClientSession, path: str, params: Dict) -> Optional[Dict]:
+        # waiting out a 429 isn't a failed attempt
+        attempt = 0
+        while attempt < self.max_retries:
+            await self.bucket.acquire()
+            try:
+                async with session.get(path, params=params) as response:
+                    self.bucket.update(response.headers)
+
+                    if response.status == 429:
+                        reset = response.headers.get("x-rate-limit-reset")
+                        self.bucket.exhausted(float(reset) if reset is not None else None)
+                        continue
+                    if response.status >= 500:
+                        raise aiohttp.ClientResponseError(response.request_info, (),
+                                                          status=response.status)
+                    response.raise_for_status()
+                    return await response.json()
+
+            except (aiohttp.ClientConnectionError, aiohttp.ClientResponseError, asyncio.TimeoutError) as e:
+                if isinstance(e, aiohttp.ClientResponseError) and e.status < 500:
+                    logger.warning(f"Giving up on {path}: {e}")
+                    return None
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+                attempt += 1
+
+        logger.warning(f"Giving up on {path} after {self.max_retries} attempts")
+        return None
+
+    def _write(self, tweets: List[Dict], extra: Dict):
+        # one gzip member per page, concatenated members are still one valid
+        # gzip file and the reader goes through them in order
+        if not tweets:
+            return
+        lines = "".join(json.dumps({**tweet, **extra}) + "\n" for tweet in tweets)
+        self.fout.write(gzip.compress(lines.encode("utf-8")))
+        self.fout.flush()
+
+
+def download(jobs: Iterable[DownloadJob], bearer_token: str, out_path: str, journal_path: str,
+             **downloader_kwargs) -> Dict[str, int]:
+    """
+    Blocking `AsyncDownloader(...).run(jobs)`.
+    """
+    downloader = AsyncDownloader(bearer_token, out_path, journal_path, **downloader_kwargs)
+    return asyncio.run(downloader.run(list(jobs)))
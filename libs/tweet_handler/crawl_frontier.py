@@ -0,0 +1,220 @@
+import os
+import sqlite3
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from async_downloader import ResumeJournal
+
+
+# persistent frontier for the conversation / quote crawl. every id we want
+# to download is one row keyed by (kind, id), so seeing an id again only
+# bumps its priority (e.g. one more reply pointing at it) instead of queueing
+# it twice, and ids that are done are never handed out again.
+#
+# ids are handed out in batches by priority. a batch is claimed together
+# with a shard file and the shard's download journal, all of its tweets go
+# into that one gzip file instead of one tiny file per conversation. if we
+# stop mid batch the claimed ids keep their shard and the next run finishes
+# them first, with the journal skipping the pages already in the shard.
+#
+# the source files already scanned for ids are recorded too, so a restart
+# doesn't rescan them and starts downloading right away
+
+PENDING = 0
+CLAIMED = 1
+DONE = 2
+FAILED = 3
+
+
+class ShardBatch(NamedTuple):
+    shard: int
+    path: str  # gzip file the batch's tweets go into
+    journal_path: str  # download journal of the batch
+    items: List[Tuple[str, str]]  # (kind, id) pairs, "kind:id" is the job key
+
+
+class CrawlFrontier:
+    """
+    Queue of ids to crawl kept in sqlite.
+
+    Parameters
+    ----------
+    path: str
+        sqlite file, ":memory:" for a throwaway frontier
+    shard_dir: str
+        Directory the shard files and their journals go in
+    max_attempts: int
+        Tries an id gets to finish before it's given up on
+    """
+
+    def __init__(self, path: str, shard_dir: str, max_attempts: int = 3):
+        self.path = path
+        self.shard_dir = shard_dir
+        self.max_attempts = max_attempts
+        os.makedirs(shard_dir, exist_ok=True)
+
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS frontier
+                                   (kind TEXT NOT NULL,
+                                    id TEXT NOT NULL,
+                                    priority INTEGER NOT NULL DEFAULT 0,
+                                    status INTEGER NOT NULL DEFAULT 0,
+                                    shard INTEGER,
+                                    attempts INTEGER NOT NULL DEFAULT 0,
+                                    n_tweets INTEGER,
+                                    PRIMARY KEY (kind, id))""")
+        self.connection.execute("""CREATE INDEX IF NOT EXISTS pending
+                                   ON frontier (status, priority DESC)""")
+        self.connection.execute("""CREATE INDEX IF NOT EXISTS shards
+                                   ON frontier (shard)""")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS sources
+                                   (path TEXT PRIMARY KEY,
+                                    size INTEGER NOT NULL,
+                                    mtime REAL NOT NULL)""")
+        self.connection.commit()
+
+    def add(self, kind: str, ids: Iterable, priorities: Optional[Iterable[int]] = None) -> int:
+        """
+        Queue ids, or add to the priority of ids already pending. Ids that
+        are claimed, done or failed are left alone.
+
+        Returns
+        -------
+        n_new: int
+            Number of ids that weren't in the frontier before
+        """
+        ids = [str(tweet_id) for tweet_id in ids]
+        priorities = [0] * len(ids) if priorities is None else [int(p) for p in priorities]
+
+        before = self.total()
+        self.connection.executemany("""INSERT INTO frontier (kind, id, priority) VALUES (?, ?, ?)
+                                       ON CONFLICT (kind, id) DO UPDATE
+                                       SET priority = priority + excluded.priority
+                                       WHERE status = 0""",
+                                    [(kind, tweet_id, priority)
+                                     for tweet_id, priority in zip(ids, priorities)])
+        self.connection.commit()
+        return self.total() - before
+
+    def mark_done(self, kind: str, ids: Iterable):
+        """
+        Record ids as done without downloading them, e.g. ones fetched
+        before there was a frontier.
+        """
+        with self.connection:
+            self.connection.executemany("""INSERT INTO frontier (kind, id, status) VALUES (?, ?, ?)
+                                           ON CONFLICT (kind, id) DO UPDATE SET status = excluded.status""",
+                                        [(kind, str(tweet_id), DONE) for tweet_id in ids])
+
+    def seen_source(self, path: str) -> bool:
+        """
+        Whether `path` was already scanned for ids and hasn't changed since.
+        """
+        stat = os.stat(path)
+        row = self.connection.execute("SELECT size, mtime FROM sources WHERE path = ?",
+                                      (path,)).fetchone()
+        return row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime
+
+    def add_source(self, path: str):
+        stat = os.stat(path)
+        self.connection.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?)",
+                                (path, stat.st_size, stat.st_mtime))
+        self.connection.commit()
+
+    def next_batch(self, batch_size: int, kind: Optional[str] = None) -> Optional[ShardBatch]:
+        """
+        The unfinished batch of an earlier run if there is one, otherwise
+        the `batch_size` pending ids with the highest priority claimed into a
+        new shard. None once nothing is left.
+        """
+        row = self.connection.execute("SELECT MIN(shard) FROM frontier WHERE status = ?",
+                                      (CLAIMED,)).fetchone()
+        if row[0] is not None:
+            return self._batch(row[0])
+
+        query = "SELECT kind, id FROM frontier WHERE status = ?"
+        params = [PENDING]
+        if kind is not None:
+            query += " AND kind = ?"
+            params.append(kind)
+        query += " ORDER BY priority DESC, id LIMIT ?"
+        params.append(batch_size)
+        items = self.connection.execute(query, params).fetchall()
+        if not items:
+            return None
+
+        shard = self.connection.execute("SELECT COALESCE(MAX(shard), -1) + 1 "
+                                        "FROM frontier").fetchone()[0]
+        self.connection.executemany("UPDATE frontier SET status = ?, shard = ? "
+                                    "WHERE kind = ? AND id = ?",
+                                    [(CLAIMED, shard, k, i) for k, i in items])
+        self.connection.commit()
+        return self._batch(shard)
+
+    def _batch(self, shard: int) -> ShardBatch:
+        items = self.connection.execute("SELECT kind, id FROM frontier "
+                                        "WHERE shard = ? AND status = ? ORDER BY priority DESC, id",
+                                        (shard, CLAIMED)).fetchall()
+        return ShardBatch(shard,
+                          os.path.join(self.shard_dir, f"shard_{shard:06d}.gz"),
+                          os.path.join(self.shard_dir, f"shard_{shard:06d}.journal"),
+                          [tuple(item) for item in items])
+
+    def finish_batch(self, batch: ShardBatch) -> Dict[str, int]:
+        """
+        Mark the ids the batch's journal has as done, with their tweet
+        counts. The rest stay claimed so the next `next_batch` retries them
+        in the same shard, until they've been tried `max_attempts` times and
+        are marked failed.
+        """
+        journal = ResumeJournal(batch.journal_path)
+        journal.close()
+
+        done = []
+        unfinished = []
+        for kind, tweet_id in batch.items:
+            key = f"{kind}:{tweet_id}"
+            if journal.done(key):
+                done.append((journal.state[key].get("n_tweets", 0), kind, tweet_id))
+            else:
+                unfinished.append((kind, tweet_id))
+
+        # unfinished ids stay in this shard so a retry continues their pages
+        # from the journal instead of downloading them again elsewhere
+        with self.connection:
+            self.connection.executemany("UPDATE frontier SET status = ?, n_tweets = ?, attempts = attempts + 1 "
+                                        "WHERE kind = ? AND id = ?",
+                                        [(DONE,) + item for item in done])
+            self.connection.executemany("UPDATE frontier SET attempts = attempts + 1, "
+                                        "status = CASE WHEN attempts + 1 >= ? THEN ? ELSE ? END "
+                                        "WHERE kind = ? AND id = ?",
+                                        [(self.max_attempts, FAILED, CLAIMED, kind, tweet_id)
+                                         for kind, tweet_id in unfinished])
+        return {"done": len(done), "unfinished": len(unfinished)}
+
+    def done_counts(self, kind: str, min_tweets: int = 0,
+                    shard: Optional[int] = None) -> List[Tuple[str, int]]:
+        """
+        (id, number of tweets) of the finished ids of a kind, optionally
+        only those from one shard.
+        """
+        query = "SELECT id, n_tweets FROM frontier WHERE kind = ? AND status = ? AND n_tweets >= ?"
+        params = [kind, DONE, min_tweets]
+        if shard is not None:
+            query += " AND shard = ?"
+            params.append(shard)
+        return [tuple(row) for row in self.connection.execute(query, params)]
+
+    def status_counts(self) -> Dict[str, Dict[str, int]]:
+        names = {PENDING: "pending", CLAIMED: "claimed", DONE: "done", FAILED: "failed"}
+        counts = {}
+        for kind, status, n in self.connection.execute("SELECT kind, status, COUNT(*) "
+                                                       "FROM frontier GROUP BY kind, status"):
+            counts.setdefault(kind, {name: 0 for name in names.values()})[names[status]] = n
+        return counts
+
+    def total(self) -> int:
+        return self.connection.execute("SELECT COUNT(*) FROM frontier").fetchone()[0]
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+
+# local stand-in for the two api endpoints the downloader uses, replaying
+# recorded pages. it paginates with next tokens, sends x-rate-limit headers
+# and answers 429 once a window's requests are used up, so the downloader
+# (and the scripts built on it) can be run and tested without api access.
+#
+# recordings map a job key to its pages, each page a list of tweets:
+#   {"search:conversation_id:123": [[{...}, {...}], [{...}]],
+#    "quotes:456": [[{...}]]}
+# search keys are "search:" plus the query string
+
+
+class MockTwitterServer:
+    """
+    Parameters
+    ----------
+    recordings: Dict[str, List[List[Dict]]]
+        Pages of tweets by job key
+    limit: int
+        Requests allowed per rate limit window
+    window: float
+        Window length in seconds
+    failures: Dict[Tuple[str, int], int]
+        Number of times to answer 503 for a (key, page index) before
+        serving it, to simulate a flaky api
+    """
+
+    def __init__(self,
+                 recordings: Dict[str, List[List[Dict]]],
+                 limit: int = 300,
+                 window: float = 900.0,
+                 failures: Optional[Dict[Tuple[str, int], int]] = None):
+        self.recordings = recordings
+        self.limit = limit
+        self.window = window
+        self.failures = dict(failures or {})
+        self.requests = []  # (key, page index) of every request served
+        self.window_start = time.time()
+        self.window_used = 0
+        self.runner = None
+
+        self.app = web.Application()
+        self.app.router.add_get("/2/tweets/search/all", self.search_all)
+        self.app.router.add_get("/2/tweets/{tweet_id}/quote_tweets", self.quote_tweets)
+
+    def _rate_headers(self) -> Dict[str, str]:
+        return {"x-rate-limit-limit": str(self.limit),
+                "x-rate-limit-remaining": str(max(0, self.limit - self.window_used)),
+                "x-rate-limit-reset": str(int(self.window_start + self.window) + 1)}
+
+    def _page(self, key: str, token: Optional[str]) -> web.Response:
+        now = time.time()
+        if now >= self.window_start + self.window:
+            self.window_start = now
+            self.window_used = 0
+        if self.window_used >= self.limit:
+            return web.json_response({"title": "Too Many Requests"}, status=429,
+                                     headers=self._rate_headers())
+        self.window_used += 1
+
+        pages = self.recordings.get(key, [])
+        index = int(token) if token else 0
+        if self.failures.get((key, index), 0) > 0:
+            self.failures[(key, index)] -= 1
+            return web.json_response({"title": "Service Unavailable"}, status=503,
+                                     headers=self._rate_headers())
+        self.requests.append((key, index))
+
+        tweets = pages[index] if index < len(pages) else []
+        meta = {"result_count": len(tweets)}
+        if index + 1 < len(pages):
+            meta["next_token"] = str(index + 1)
+        body = {"meta": meta}
+        if tweets:
+            body["data"] = tweets
+        return web.json_response(body, headers=self._rate_headers())
+
+    async def search_all(self, request: web.Request) -> web.Response:
+        return self._page("search:" + request.query.get("query", ""),
+                          request.query.get("next_token"))
+
+    async def quote_tweets(self, request: web.Request) -> web.Response:
+        return self._page("quotes:" + request.match_info["tweet_id"],
+                          request.query.get("pagination_token"))
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """
+        Serve in the running event loop, port 0 picks a free one. Returns
+        the base url to give the downloader.
+        """
+        self.runner = web.AppRunner(self.app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, host, port)
+        await site.start()
+        port = self.runner.addresses[0][1]
+        return f"http://{host}:{port}"
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recorded api pages")
+    parser.add_argument("recordings", help="json file of pages by job key")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--limit", type=int, default=300)
+    parser.add_argument("--window", type=float, default=900.0)
+    args = parser.parse_args()
+
+    with open(args.recordings, "r") as fin:
+        recordings = json.load(fin)
+
+    server = MockTwitterServer(recordings, args.limit, args.window)
+    web.run_app(server.app, host="127.0.0.1", port=args.port)
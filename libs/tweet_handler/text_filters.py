@@ -0,0 +1,253 @@
+import re
+import numpy as np
+import pandas as pd
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Pattern, Union
+
+# aho-corasick automaton for the keyword prefilter when it's installed
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+
+# text matching for the keyword query and the retweet / quote markers. the
+# patterns are compiled once and whole columns of text are matched through
+# the pandas str accessors instead of one re call per tweet per pattern
+
+RETWEET_PREFIX = re.compile(r'^"*RT @')
+QUOTE_MARKER = re.compile(r"QT @")
+QUOTE_TEXT = re.compile(r"(.*)QT @")  # greedy, new text before the last QT
+MENTION = re.compile(r"@([a-zA-Z0-9]+)")
+HAS_MENTION = re.compile(r"@[a-zA-Z0-9]")
+
+
+@lru_cache(maxsize=32)
+def compile_query(query: str) -> Pattern:
+    """
+    Compiled keyword query, cached so the same query string is only
+    compiled once however many times it's used.
+    """
+    return re.compile(query)
+
+
+class TextMatcher:
+    """
+    A keyword query like `config["regex_query"]` compiled once, both as is
+    and as one named group per alternative so a single scan of the texts
+    can tell which keywords were found.
+
+    Parameters
+    ----------
+    query: str
+        Regex alternation of keywords, e.g. "immigration|immigrants?|..."
+    """
+
+    def __init__(self, query: str):
+        self.query = query
+        self.pattern = compile_query(query)
+        self.keywords = query.split("|")
+        self.labeled = re.compile("|".join(f"(?P<k{i}>{keyword})"
+                                           for i, keyword in enumerate(self.keywords)))
+
+    def search(self, text: Optional[str]) -> bool:
+        return text is not None and self.pattern.search(text) is not None
+
+    def matches(self, texts: Union[pd.Series, Iterable[str]]) -> np.ndarray:
+        """
+        Boolean mask of the texts containing any keyword, missing texts
+        don't match.
+        """
+        texts = _as_series(texts)
+        return texts.str.contains(self.pattern, na=False).values.astype(bool)
+
+    def keyword_counts(self, texts: Union[pd.Series, Iterable[str]]) -> Dict[str, int]:
+        """
+        Number of texts each keyword pattern matched in, from one pass over
+        the texts. Overlapping keywords count for the alternative the scan
+        took, e.g. "immigrants" counts for "immigrants?" but not "migrants?".
+        """
+        texts = _as_series(texts)
+        found = texts.str.extractall(self.labeled)
+        counts = {keyword: 0 for keyword in self.keywords}
+        if found.shape[0] == 0:
+            return counts
+
+        # a keyword counts once per text however often it appears
+        per_text = found.notna().groupby(level=0).any().sum()
+        for i, keyword in enumerate(self.keywords):
+            counts[keyword] = int(per_text[f"k{i}"])
+        return counts
+
+
+def classify_texts(texts: Union[pd.Series, Iterable[str]],
+                   matcher: Optional[TextMatcher] = None) -> pd.DataFrame:
+    """
+    Retweet, quote and (with a matcher) keyword flags for a column of texts,
+    plus the text `filter_retweet` would keep: nothing for straight
+    retweets, the new text for quotes and the text itself otherwise.
+    """
+    texts = _as_series(texts)
+    retweet = texts.str.match(RETWEET_PREFIX, na=False).astype(bool)
+    quote = ~retweet & texts.str.contains(QUOTE_MARKER, na=False).astype(bool)
+
+    kept = texts.where(~quote, texts.str.extract(QUOTE_TEXT, expand=False))
+    kept = kept.where(~retweet, None)
+
+    classes = pd.DataFrame({"retweet": retweet.values,
+                            "quote": quote.values,
+                            "kept_text": kept.values},
+                           index=texts.index)
+    if matcher is not None:
+        classes["keyword"] = matcher.matches(texts)
+    return classes
+
+
+def pattern_counts(texts: Union[pd.Series, Iterable[str]],
+                   matcher: Optional[TextMatcher] = None) -> Dict[str, int]:
+    """
+    Pipeline stats: how many texts are retweets, quotes, have mentions, and
+    match each keyword.
+    """
+    texts = _as_series(texts)
+    classes = classify_texts(texts, matcher)
+    counts = {"texts": int(texts.shape[0]),
+              "retweet": int(classes["retweet"].sum()),
+              "quote": int(classes["quote"].sum()),
+              "mention": int(texts.str.contains(HAS_MENTION, na=False).sum())}
+    if matcher is not None:
+        counts["keyword"] = int(classes["keyword"].sum())
+        counts.update(matcher.keyword_counts(texts))
+    return counts
+
+
+# keyword prefilter. the keyword query is an alternation of literal words,
+# some with an optional plural s, so it's really a set of strings and a text
+# matches it exactly when it contains one of them. we only need the strings
+# that don't contain a shorter one ("immigrant" covers "immigrants" and
+# "migrant" covers both) and look for those with an automaton (or one
+# compiled alternation without it). on raw json lines we only look for the
+# first word of every keyword: the space in "illegal alien" can be a tab or
+# a newline in the tweet, which is an escaped \t or \n in the json and only
+# becomes a space once the text is cleaned. that's a superset of the tweets
+# whose text matches, so everything else can be skipped without decoding it
+
+KEYWORD_TERM = re.compile(r"([A-Za-z ]+?)(s\?)?")
+
+
+def expand_keywords(regex_keywords: str) -> List[str]:
+    """
+    Literal keywords of a query like "immigration|immigrants?|...", with
+    "word?" style optional plurals expanded into singular and plural.
+    """
+    keywords = []
+    for word in regex_keywords.split("|"):
+        term = KEYWORD_TERM.fullmatch(word)
+        if term is None:
+            raise ValueError(f"'{word}' is not a plain keyword")
+        if term.group(2):
+            singular = term.group(1)
+            keywords.append(singular)
+            keywords.append(singular + "s")
+        else:
+            keywords.append(word)
+    return keywords
+
+
+def minimal_keywords(keywords: Iterable[str]) -> List[str]:
+    # drop keywords that contain another keyword, they can't match alone
+    keywords = sorted(set(keywords), key=len)
+    minimal = []
+    for keyword in keywords:
+        if not any(shorter in keyword for shorter in minimal):
+            minimal.append(keyword)
+    return minimal
+
+
+class KeywordPrefilter:
+    """
+    Finds any of a set of literal keywords in a text or a raw json line.
+    On decoded text the answer is exactly `re.search(query, text)` for the
+    query the keywords came from, on raw lines it's a superset (the
+    keywords could be in another field, and only the first word of a
+    multi-word keyword is looked for) so the parsed text still has to be
+    checked.
+
+    Parameters
+    ----------
+    keywords: Iterable[str]
+        Literal keywords, e.g. from `expand_keywords`
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords = minimal_keywords(keywords)
+        self.line_keywords = minimal_keywords(keyword.split(" ")[0] for keyword in self.keywords)
+        self.backend = "ahocorasick" if ahocorasick is not None else "re"
+
+        # whole columns of text always go through the regex, one
+        # str.contains call beats a python level loop over the automaton
+        alternation = "|".join(re.escape(keyword) for keyword in self.keywords)
+        self.text_pattern = re.compile(alternation)
+
+        if ahocorasick is not None:
+            # latin-1 maps bytes to code points one to one, and the keywords
+            # are ascii, so raw bytes go through an automaton as text
+            self.automaton = _automaton(self.keywords)
+            self.line_automaton = _automaton(self.line_keywords)
+        else:
+            self.bytes_pattern = re.compile("|".join(re.escape(keyword)
+                                                     for keyword in self.line_keywords).encode())
+
+    @classmethod
+    def from_query(cls, regex_keywords: str) -> "KeywordPrefilter":
+        return cls(expand_keywords(regex_keywords))
+
+    def search(self, text: Optional[str]) -> bool:
+        if text is None:
+            return False
+        if self.backend == "ahocorasick":
+            return next(self.automaton.iter(text), None) is not None
+        return self.text_pattern.search(text) is not None
+
+    def matches(self, texts: Union[pd.Series, Iterable[str]]) -> np.ndarray:
+        """
+        Boolean mask of the texts containing any keyword, missing texts
+        don't match. Same as `search` on every text.
+        """
+        texts = _as_series(texts)
+        return texts.str.contains(self.text_pattern, na=False).values.astype(bool)
+
+    def search_bytes(self, line: bytes) -> bool:
+        if self.backend == "ahocorasick":
+            return next(self.line_automaton.iter(line.decode("latin-1")), None) is not None
+        return self.bytes_pattern.search(line) is not None
+
+    def __call__(self, line: bytes) -> bool:
+        # so it can be passed as a read_tweets line_filter
+        return self.search_bytes(line)
+
+
+def _automaton(keywords: List[str]) -> "ahocorasick.Automaton":
+    automaton = ahocorasick.Automaton()
+    for keyword in keywords:
+        automaton.add_word(keyword, keyword)
+    automaton.make_automaton()
+    return automaton
+
+
+@lru_cache(maxsize=32)
+def keyword_prefilter(query: str) -> Optional[KeywordPrefilter]:
+    """
+    Cached prefilter for a keyword query, None if the query isn't a plain
+    keyword alternation and has to go through the regex.
+    """
+    try:
+        return KeywordPrefilter.from_query(query)
+    except ValueError:
+        return None
+
+
+def _as_series(texts: Union[pd.Series, Iterable[str]]) -> pd.Series:
+    if isinstance(texts, pd.Series):
+        return texts.astype(object)
+    return pd.Series(list(texts), dtype=object)
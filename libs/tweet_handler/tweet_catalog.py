@@ -0,0 +1,328 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import numpy as np
+import pandas as pd
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from tweet_store import (HOT_COLUMNS, ID_COLUMNS, STRING_COLUMNS, TIME_COLUMNS, TweetStore,
+                         TweetStoreWriter, _to_uint64, write_index)
+
+
+# incremental tweet catalog. instead of one tweet store rebuilt from every
+# source file on every run, the catalog is a list of tweet store segments
+# plus a manifest with the fingerprint (size, mtime, sha1) of every source
+# file already in it. a run only reads the files that are new or changed
+# and writes their tweets as one new delta segment, so another day of
+# decahose files costs as much as reading that day.
+#
+# lookups go through the segments newest first so later copies of a tweet
+# win like in a single store. once there are too many segments they are
+# merged into one, optionally on a background thread while ingesting goes
+# on. merging concatenates the columns and blob files and rebuilds the
+# index, nothing gets parsed again.
+#
+# the manifest is only ever replaced whole (write then rename) after the
+# segment it points to is complete, so a crash mid run leaves the catalog
+# as it was before the run
+
+MANIFEST = "manifest.json"
+
+# bytes read at a time when hashing a source file
+HASH_BLOCK = 2 ** 20
+
+
+def file_fingerprint(path: str, with_hash: bool = True) -> Dict:
+    """
+    Size, modification time and (optionally) sha1 of a file's contents.
+    """
+    stat = os.stat(path)
+    fingerprint = {"size": stat.st_size, "mtime": stat.st_mtime}
+    if with_hash:
+        sha1 = hashlib.sha1()
+        with open(path, "rb") as fin:
+            for block in iter(lambda: fin.read(HASH_BLOCK), b""):
+                sha1.update(block)
+        fingerprint["sha1"] = sha1.hexdigest()
+    return fingerprint
+
+
+def merge_stores(paths: List[str], out_path: str):
+    """
+    Write the tweet stores in `paths` as one store, rows in order. Rows
+    overwritten by a later store are kept, the index points at the last
+    copy of every id like it would after adding the tweets in order.
+    """
+    stores = [TweetStore(path) for path in paths]
+    keep_raw = all(store.meta["keep_raw"] for store in stores)
+    os.makedirs(out_path, exist_ok=True)
+
+    for col in ID_COLUMNS + TIME_COLUMNS:
+        np.save(os.path.join(out_path, f"{col}.npy"),
+                np.concatenate([np.asarray(store.column(col)) for store in stores]))
+
+    for col in STRING_COLUMNS + (["raw"] if keep_raw else []):
+        offsets = [np.zeros(1, dtype=np.int64)]
+        shift = 0
+        with open(os.path.join(out_path, f"{col}.bin"), "wb") as fout:
+            for path, store in zip(paths, stores):
+                with open(os.path.join(path, f"{col}.bin"), "rb") as fin:
+                    shutil.copyfileobj(fin, fout)
+                store_offsets = np.asarray(store._load(f"{col}.offsets.npy"))
+                offsets.append(store_offsets[1:] + shift)
+                shift += int(store_offsets[-1])
+        np.save(os.path.join(out_path, f"{col}.offsets.npy"), np.concatenate(offsets))
+
+    write_index(out_path, np.load(os.path.join(out_path, "id.npy")), keep_raw)
+
+
+class SegmentedTweetStore:
+    """
+    Reader for a catalog written by `IncrementalCatalog`, with the same
+    lookups as `TweetStore`. The segments are the ones in the manifest when
+    it's opened.
+
+    Parameters
+    ----------
+    path: str
+        Catalog directory
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, MANIFEST), "r") as fin:
+            self.manifest = json.loads(fin.read())
+        self.segments = [TweetStore(os.path.join(path, "segments", name))
+                         for name in self.manifest["segments"]]
+
+    def rows(self, ids: Iterable) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Segment and row of every id in the newest segment that has it, -1
+        for both where no segment does.
+        """
+        ids = [_to_uint64(i) for i in ids]
+        segment = np.full(len(ids), -1, dtype=np.int64)
+        rows = np.full(len(ids), -1, dtype=np.int64)
+        for s in range(len(self.segments) - 1, -1, -1):
+            missing = np.flatnonzero(rows < 0)
+            if missing.shape[0] == 0:
+                break
+            found = self.segments[s].rows([ids[i] for i in missing])
+            hit = found >= 0
+            segment[missing[hit]] = s
+            rows[missing[hit]] = found[hit]
+        return segment, rows
+
+    def get(self, ids: Iterable, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Hot fields for the requested ids in request order, ids we don't
+        have are dropped. See `TweetStore.get`.
+        """
+        if columns is None:
+            columns = HOT_COLUMNS
+
+        segment, rows = self.rows(ids)
+        parts = []
+        for s in np.unique(segment[segment >= 0]):
+            positions = np.flatnonzero(segment == s)
+            part = self.segments[s].get_rows(rows[positions], columns)
+            part.index = positions
+            parts.append(part)
+
+        if not parts:
+            return pd.DataFrame({col: [] for col in columns}, columns=columns)
+        return pd.concat(parts).sort_index().reset_index(drop=True)
+
+    def get_json(self, tweet_id) -> Optional[Dict]:
+        segment, rows = self.rows([tweet_id])
+        if rows[0] < 0:
+            return None
+        store = self.segments[segment[0]]
+        if not store.meta["keep_raw"]:
+            raise ValueError("Tweet store was written without raw json")
+        return json.loads(store._strings("raw", [rows[0]])[0])
+
+    def column(self, col: str) -> np.ndarray:
+        """
+        Full fixed width column of every segment in order (includes
+        overwritten rows).
+        """
+        return np.concatenate([np.asarray(store.column(col)) for store in self.segments])
+
+    def __contains__(self, tweet_id) -> bool:
+        return self.rows([tweet_id])[1][0] >= 0
+
+    def __len__(self) -> int:
+        if not self.segments:
+            return 0
+        return int(np.unique(np.concatenate([np.asarray(store.index_ids)
+                                             for store in self.segments])).shape[0])
+
+
+def open_store(path: str):
+    """
+    `SegmentedTweetStore` for an incremental catalog, `TweetStore` for a
+    store written in one go.
+    """
+    if os.path.exists(os.path.join(path, MANIFEST)):
+        return SegmentedTweetStore(path)
+    return TweetStore(path)
+
+
+class IncrementalCatalog:
+    """
+    Writer side of the segmented catalog.
+
+    Parameters
+    ----------
+    path: str
+        Catalog directory, created if it doesn't exist
+    keep_raw: bool
+        Whether segments keep the full json of every tweet
+    max_segments: int
+        Compact once there are more segments than this
+    """
+
+    def __init__(self, path: str, keep_raw: bool = True, max_segments: int = 8):
+        self.path = path
+        self.keep_raw = keep_raw
+        self.max_segments = max_segments
+        self.lock = threading.Lock()
+        self.compaction = None
+        os.makedirs(os.path.join(path, "segments"), exist_ok=True)
+
+        manifest_path = os.path.join(path, MANIFEST)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r") as fin:
+                self.manifest = json.loads(fin.read())
+        else:
+            self.manifest = {"segments": [], "next_segment": 0, "files": {}}
+
+        # leftovers of a run that stopped mid write or mid compaction
+        for name in os.listdir(os.path.join(path, "segments")):
+            if name not in self.manifest["segments"]:
+                shutil.rmtree(os.path.join(path, "segments", name), ignore_errors=True)
+
+    def _write_manifest(self):
+        tmp_path = os.path.join(self.path, MANIFEST + ".tmp")
+        with open(tmp_path, "w") as fout:
+            json.dump(self.manifest, fout)
+        os.replace(tmp_path, os.path.join(self.path, MANIFEST))
+
+    def _new_segment(self) -> str:
+        with self.lock:
+            name = f"seg_{self.manifest['next_segment']:06d}"
+            self.manifest["next_segment"] += 1
+        return name
+
+    def changed_files(self, paths: Iterable[str]) -> List[str]:
+        """
+        The files that aren't in the catalog or changed since they were
+        added. Files with the same size and mtime are taken as unchanged
+        without reading them, the rest are hashed so a file that was only
+        touched isn't read again.
+        """
+        changed = []
+        for path in paths:
+            known = self.manifest["files"].get(os.path.abspath(path))
+            if known is not None:
+                quick = file_fingerprint(path, with_hash=False)
+                if quick["size"] == known["size"] and quick["mtime"] == known["mtime"]:
+                    continue
+                if file_fingerprint(path)["sha1"] == known["sha1"]:
+                    continue
+            changed.append(path)
+        return changed
+
+    @contextmanager
+    def delta(self, paths: List[str]) -> Iterator[TweetStoreWriter]:
+        """
+        Writer for a new segment holding the tweets of `paths`. When the
+        block finishes the segment and the files' fingerprints go into the
+        manifest together, if it raises nothing is recorded and the files
+        will be read again next time. Starts a background compaction when
+        there are too many segments.
+
+        Examples
+        --------
+        >>> files = catalog.changed_files(all_files)
+        >>> with catalog.delta(files) as writer:
+        ...     for tweet, raw in read_tweets(files, with_raw=True):
+        ...         writer.add(tweet, raw=raw)
+        """
+        # fingerprints from before reading, a file that changes while we
+        # read it gets read again next time
+        fingerprints = {os.path.abspath(path): file_fingerprint(path) for path in paths}
+        name = self._new_segment()
+        tmp_path = os.path.join(self.path, "segments", name + ".tmp")
+
+        writer = TweetStoreWriter(tmp_path, keep_raw=self.keep_raw)
+        try:
+            yield writer
+            writer.close()
+        except BaseException:
+            writer.close()
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+
+        with self.lock:
+            if writer.n_rows > 0:
+                os.replace(tmp_path, os.path.join(self.path, "segments", name))
+                self.manifest["segments"].append(name)
+            else:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+            self.manifest["files"].update(fingerprints)
+            self._write_manifest()
+
+        if len(self.manifest["segments"]) > self.max_segments:
+            self.compact(background=True)
+
+    def compact(self, background: bool = False) -> Optional[threading.Thread]:
+        """
+        Merge the current segments into one. Segments added while the merge
+        runs are kept after the merged one. With `background` the merge runs
+        on a thread that is returned (and waited for by `close`).
+        """
+        if self.compaction is not None and self.compaction.is_alive():
+            return self.compaction
+
+        with self.lock:
+            merging = list(self.manifest["segments"])
+        if len(merging) < 2:
+            return None
+
+        if background:
+            self.compaction = threading.Thread(target=self._compact, args=(merging,))
+            self.compaction.start()
+            return self.compaction
+        self._compact(merging)
+        return None
+
+    def _compact(self, merging: List[str]):
+        name = self._new_segment()
+        tmp_path = os.path.join(self.path, "segments", name + ".tmp")
+        merge_stores([os.path.join(self.path, "segments", segment) for segment in merging], tmp_path)
+        os.replace(tmp_path, os.path.join(self.path, "segments", name))
+
+        with self.lock:
+            # everything added since goes after the merged segment
+            newer = self.manifest["segments"][len(merging):]
+            self.manifest["segments"] = [name] + newer
+            self._write_manifest()
+
+        # open readers keep their memory maps, the files go once they close
+        for segment in merging:
+            shutil.rmtree(os.path.join(self.path, "segments", segment), ignore_errors=True)
+
+    def close(self):
+        if self.compaction is not None:
+            self.compaction.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,184 @@
+import pandas as pd
+from typing import Callable, Dict, Iterable, List, Optional, Union
+
+from tweet_reader import read_tweets
+
+
+# columnar tweet parsing. instead of building a row dict per tweet and
+# calling strptime on every time stamp, callers name the columns they want,
+# we pull only those fields out of each tweet straight into one list per
+# column, and the time stamps are parsed as a whole column at the end with
+# a fixed format.
+#
+# column names match the parse_tweet_json_* functions in tweet_handler
+
+
+# where each column lives in each kind of tweet object, as a path of keys
+FIELD_PATHS = {
+    "v1": {"id_str": ("id_str",),
+           "user_id": ("user", "id_str"),
+           "screen_name": ("user", "screen_name"),
+           "time_stamp": ("created_at",),
+           "user_followers": ("user", "followers_count"),
+           "user_posts": ("user", "statuses_count"),
+           "quote_count": ("quote_count",),
+           "reply_count": ("reply_count",),
+           "favorite_count": ("favorite_count",),
+           "retweet_count": ("retweet_count",),
+           "reply_to_id": ("in_reply_to_status_id_str",),
+           "quote_of_id": ("quoted_status_id_str",),
+           "retweet_of_id": ("retweeted_status", "id_str")},
+    "v2": {"id_str": ("id",),
+           "user_id": ("author_id",),
+           "screen_name": ("screen_name",),
+           "time_stamp": ("created_at",),
+           "text": ("text",),
+           "quote_count": ("public_metrics", "quote_count"),
+           "reply_count": ("public_metrics", "reply_count"),
+           "favorite_count": ("public_metrics", "like_count"),
+           "retweet_count": ("public_metrics", "retweet_count")},
+    "congress": {"id_str": ("id",),
+                 "user_id": ("user_id",),
+                 "screen_name": ("screen_name",),
+                 "time_stamp": ("time",),
+                 "text": ("text",)},
+    "trump": {"id_str": ("id",),
+              "time_stamp": ("date",),
+              "text": ("text",),
+              "favorite_count": ("favorites",),
+              "retweet_count": ("retweets",)},
+}
+FIELD_PATHS["v1_retweet"] = FIELD_PATHS["v1"]
+
+TIME_FORMATS = {"v1": "%a %b %d %H:%M:%S +0000 %Y",
+                "v1_retweet": "%a %b %d %H:%M:%S +0000 %Y",
+                "v2": "%Y-%m-%dT%H:%M:%S.000Z",
+                "congress": "ISO8601",
+                "trump": "%Y-%m-%d %H:%M:%S"}
+
+
+def _path_getter(path: tuple) -> Callable[[Dict], object]:
+    def get(tweet: Dict):
+        value = tweet
+        for key in path:
+            if not isinstance(value, dict) or key not in value:
+                return None
+            value = value[key]
+        return value
+    return get
+
+
+def _v1_text(tweet: Dict) -> Optional[str]:
+    if "extended_tweet" in tweet:
+        return tweet["extended_tweet"]["full_text"]
+    return tweet.get("text")
+
+
+def _v1_retweet_text(tweet: Dict) -> Optional[str]:
+    if "retweeted_status" not in tweet:
+        return None
+    return _v1_text(tweet["retweeted_status"])
+
+
+def _v2_reference_getter(kind: str) -> Callable[[Dict], Optional[str]]:
+    def get(tweet: Dict):
+        for ref_tw in tweet.get("referenced_tweets", ()):
+            if ref_tw["type"] == kind:
+                return ref_tw["id"]
+        return None
+    return get
+
+
+# columns that aren't a plain path
+SPECIAL_GETTERS = {
+    "v1": {"text": _v1_text},
+    "v1_retweet": {"text": _v1_retweet_text},
+    "v2": {"reply_to_id": _v2_reference_getter("replied_to"),
+           "retweet_of_id": _v2_reference_getter("retweeted"),
+           "quote_of_id": _v2_reference_getter("quoted")},
+    "trump": {"screen_name": lambda tweet: "realDonaldTrump"},
+}
+
+
+def column_getters(columns: List[str], source: str = "v1") -> Dict[str, Callable]:
+    """
+    Function pulling each requested column out of a tweet object. "year"
+    and "time_stamp" both read the time stamp.
+    """
+    if source not in FIELD_PATHS:
+        raise ValueError(f"No source '{source}' implemented for column parsing")
+
+    getters = {}
+    for column in columns:
+        if column == "year":
+            continue
+        if column in SPECIAL_GETTERS.get(source, {}):
+            getters[column] = SPECIAL_GETTERS[source][column]
+        elif column in FIELD_PATHS[source]:
+            getters[column] = _path_getter(FIELD_PATHS[source][column])
+        else:
+            raise KeyError(f"Column '{column}' not available for source '{source}'")
+
+    if "year" in columns and "time_stamp" not in getters:
+        getters["time_stamp"] = _path_getter(FIELD_PATHS[source]["time_stamp"])
+    return getters
+
+
+def parse_columns(tweets: Iterable[Union[Dict, List[Dict]]],
+                  columns: List[str],
+                  source: str = "v1") -> pd.DataFrame:
+    """
+    DataFrame of only the requested columns of a stream of tweet objects.
+    Items that are lists of tweets (like the lines of the down sampled
+    public data) are flattened.
+
+    Parameters
+    ----------
+    tweets: Iterable[Union[Dict, List[Dict]]]
+        Parsed tweets, e.g. from `read_tweets`
+    columns: List[str]
+        Column names as in the parse_tweet_json_* functions, plus "user_id"
+    source: str
+        "v1", "v1_retweet", "v2", "congress" or "trump"
+
+    Returns
+    -------
+    df: pd.DataFrame
+        One row per tweet with `columns` in order. "time_stamp" is naive
+        datetime64 parsed in one go, "text" has tabs and newlines removed
+    """
+    getters = column_getters(columns, source)
+    values = {column: [] for column in getters}
+    appends = [(values[column].append, get) for column, get in getters.items()]
+
+    for item in tweets:
+        for tweet in (item if isinstance(item, list) else (item,)):
+            for append, get in appends:
+                append(get(tweet))
+
+    df = pd.DataFrame(values)
+    if "time_stamp" in df:
+        # naive utc like everywhere else in the data
+        df["time_stamp"] = pd.to_datetime(df["time_stamp"], format=TIME_FORMATS[source],
+                                          utc=True).dt.tz_localize(None)
+        if "year" in columns:
+            df["year"] = df["time_stamp"].dt.year
+    if "text" in df:
+        # tabs and newlines break our tsv files
+        df["text"] = df["text"].str.replace("\t", " ", regex=False).str.replace("\n", " ", regex=False)
+    for column in ["id_str", "user_id", "reply_to_id", "quote_of_id", "retweet_of_id"]:
+        if column in df:
+            df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+
+    return df[columns]
+
+
+def read_columns(paths: Union[str, Iterable[str]],
+                 columns: List[str],
+                 source: str = "v1",
+                 **read_kwargs) -> pd.DataFrame:
+    """
+    `parse_columns` straight from gzipped json-lines files, keyword
+    arguments go to `read_tweets`.
+    """
+    return parse_columns(read_tweets(paths, **read_kwargs), columns, source)
@@ -4,6 +4,10 @@ import re
 import tweepy
 import time
 from constants import *
+from async_downloader import DownloadJob, api_fields, quote_tweets_job, search_job
+from tweet_reader import loads, read_tweets
+from text_filters import (QUOTE_MARKER, QUOTE_TEXT, RETWEET_PREFIX, TextMatcher, compile_query,
+                          expand_keywords, keyword_prefilter)
 from datetime import datetime
 from typing import List, Optional, Dict
 
@@ -16,7 +20,12 @@ def get_tweet_text(obj):
         tweet_text = obj['extended_tweet']['full_text']
     else:
         tweet_text = obj['text']
-    return tweet_text.replace('\t', ' ').replace('\n', ' ')
+    return clean_text(tweet_text)
+
+
+def clean_text(text: str) -> str:
+    # tabs and newlines break our tsv files
+    return text.replace('\t', ' ').replace('\n', ' ')
 
 def get_retweet_text(obj):
     if "retweeted_status" not in obj:
@@ -28,22 +37,12 @@ def get_retweet_text(obj):
 
 
 def load_tweets_from_gz(filename, keep_ids=None):
-    all_tweets = []
-    with gzip.open(filename, 'r') as f:
-        for i, line in enumerate(f):
-            tweet_obj = load_tweet_obj(line)
-            # for taking samples
-            if keep_ids:
-                if tweet_obj["id_str"] in keep_ids:
-                    all_tweets.append(tweet_obj)
-            else:
-                all_tweets.append(tweet_obj)
-
-    return all_tweets
+    # for taking samples, use read_tweets directly to stream instead
+    return list(read_tweets(filename, keep_ids or None))
 
 
 def load_tweet_obj(line):
-    return json.loads(line.decode('utf-8').strip())
+    return loads(line)
 
 
 # these ones are new by me :)
@@ -55,7 +54,12 @@ def filter_by_text(tweet_json: dict, query: str) -> Optional[dict]:
     # if we find the query return the tweet
     if text is None:
         return None
-    elif re.search(query, text):
+
+    # plain keyword queries don't need the regex
+    prefilter = keyword_prefilter(query)
+    if prefilter is not None and prefilter.search(text):
+        return tweet_json
+    elif prefilter is None and compile_query(query).search(text):
         return tweet_json
     else:
         return None
@@ -63,24 +67,31 @@ def filter_by_text(tweet_json: dict, query: str) -> Optional[dict]:
 
 def filter_tweet_list(tweet_list: List[dict], text_query: str, return_rejects=False) -> List[dict]:
 
-    # just applying our the filter by text function to a bunch of tweets
-    keep_tweets = []
-    rejected_tweets = []
-
-    for tweet in tweet_list:
-        filtered_tweet = filter_by_text(tweet, text_query)
+    # match every text in one go instead of tweet by tweet
+    texts = [get_tweet_text(tweet) for tweet in tweet_list]
+    prefilter = keyword_prefilter(text_query)
+    if prefilter is not None:
+        keep = prefilter.matches(texts)
+    else:
+        keep = TextMatcher(text_query).matches(texts)
 
-        if filtered_tweet is not None:
-            keep_tweets.append(filtered_tweet)
-        elif return_rejects:
-            rejected_tweets.append(tweet)
+    keep_tweets = [tweet for tweet, kept in zip(tweet_list, keep) if kept]
 
     if return_rejects:
+        rejected_tweets = [tweet for tweet, kept in zip(tweet_list, keep) if not kept]
         return keep_tweets, rejected_tweets
     
     return keep_tweets
 
 
+def read_keyword_tweets(paths, query: str = immigration_keywords, **read_kwargs):
+    # stream the tweets whose text matches the query. lines without any of
+    # the keywords anywhere are dropped before they are decoded
+    for tweet in read_tweets(paths, line_filter=keyword_prefilter(query), **read_kwargs):
+        if filter_by_text(tweet, query) is not None:
+            yield tweet
+
+
 def download_immigration_tweets(screen_name: str,
                                 start_date: datetime,
                                 end_date: datetime,
@@ -109,6 +120,33 @@ def download_immigration_tweets(screen_name: str,
 
     return user_immigration_tweets
 
+def immigration_tweets_job(screen_name: str) -> DownloadJob:
+    # download_immigration_tweets as a job for the async downloader
+    return search_job(f"user:{screen_name}",
+                      build_user_immigration_query(screen_name),
+                      start_date,
+                      end_date,
+                      api_fields(api_tweet_fields, api_user_fields, api_tweet_expansions),
+                      {"screen_name": screen_name})
+
+def conversation_tweets_job(conversation_id: str, immigration_only: bool = True) -> DownloadJob:
+    # download_conversation as a job for the async downloader
+    if immigration_only:
+        api_query = build_conversation_immigration_query(conversation_id)
+    else:
+        api_query = f"conversation_id:{conversation_id} lang:en"
+
+    return search_job(f"conversation:{conversation_id}",
+                      api_query,
+                      start_date,
+                      end_date,
+                      api_fields(api_tweet_fields, api_user_fields, api_tweet_expansions),
+                      {"conversation": str(conversation_id)})
+
+def quote_job(tweet_id: str) -> DownloadJob:
+    # download_quote_tweets as a job for the async downloader
+    return quote_tweets_job(tweet_id, api_fields(api_tweet_fields, api_user_fields, api_tweet_expansions))
+
 def download_conversation(conversation_id: str,
                           api_bearer_token: str,
                           immigration_only: bool = True) -> List[dict]:
@@ -191,19 +229,7 @@ def build_user_immigration_query(screen_name: str,
                                  regex_keywords: str = immigration_keywords):
 
     # we need to reformat the keywords for the twitter api
-    api_keywords = []
-    words = immigration_keywords.split("|")
-
-    for word in words:
-        # i could have just done this by hand wow
-        # instead im tough and unpacked it in *code*
-        m = re.match(r"([a-z ]+)s\?", word)
-        if m:
-            singular = m.group(1)
-            api_keywords.append(singular)
-            api_keywords.append(singular + "s")
-        else:
-            api_keywords.append(word)
+    api_keywords = expand_keywords(regex_keywords)
 
     explicit_or_keywords = " OR ".join(api_keywords)
 
@@ -215,19 +241,7 @@ def build_conversation_immigration_query(conversation_id: str,
                                          regex_keywords: str = immigration_keywords):
 
     # we need to reformat the keywords for the twitter api
-    api_keywords = []
-    words = immigration_keywords.split("|")
-
-    for word in words:
-        # i could have just done this by hand wow
-        # instead im tough and unpacked it in *code*
-        m = re.match(r"([a-z ]+)s\?", word)
-        if m:
-            singular = m.group(1)
-            api_keywords.append(singular)
-            api_keywords.append(singular + "s")
-        else:
-            api_keywords.append(word)
+    api_keywords = expand_keywords(regex_keywords)
 
     explicit_or_keywords = " OR ".join(api_keywords)
 
@@ -272,7 +286,7 @@ def parse_tweet_json_trump(tweet_json: dict) -> dict:
     new_row["time_stamp"] = dt
 
     new_row["screen_name"] = "realDonaldTrump"
-    new_row["text"] = tweet_json["text"].replace("\t", " ").replace("\n", " ")
+    new_row["text"] = clean_text(tweet_json["text"])
 
     new_row["favorite_count"] = tweet_json["favorites"]
     new_row["retweet_count"] = tweet_json["retweets"]
@@ -358,7 +372,7 @@ def parse_tweet_json_v2(tweet_json: dict) -> dict:
     new_row["time_stamp"] = time_stamp
     new_row["screen_name"] = tweet_json["screen_name"]
 
-    new_row["text"] = tweet_json["text"].replace("\t", " ").replace("\n", " ")
+    new_row["text"] = clean_text(tweet_json["text"])
 
     # metrics. every tweet should also have these
     metrics = tweet_json["public_metrics"]
@@ -393,7 +407,7 @@ def parse_tweet_json_congress(tweet_json: dict) -> dict:
     new_row["time_stamp"] = dt
 
     new_row["screen_name"] = tweet_json["screen_name"]
-    new_row["text"] = tweet_json["text"].replace("\t", " ").replace("\n", " ")
+    new_row["text"] = clean_text(tweet_json["text"])
 
     return new_row
 
@@ -401,12 +415,12 @@ def parse_tweet_json_congress(tweet_json: dict) -> dict:
 def filter_retweet(tweet_text: str) -> Optional[str]:
 
     # skip straight retweets
-    if re.match(r'^\"*RT @', tweet_text):
+    if RETWEET_PREFIX.match(tweet_text):
         return None
 
     # grab new text from quotes
-    elif re.search(r'QT @', tweet_text):
-        return re.findall(r"(.*)QT @", tweet_text)[0]
+    elif QUOTE_MARKER.search(tweet_text):
+        return QUOTE_TEXT.search(tweet_text).group(1)
 
     # regular tweets just pass through
     else:
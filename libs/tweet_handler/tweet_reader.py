@@ -0,0 +1,189 @@
+import gzip
+import json
+import logging
+import queue
+import re
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, Optional, Union
+
+# orjson parses tweets several times faster, use it when it's around
+try:
+    import orjson
+    loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    loads = json.loads
+    JSON_BACKEND = "json"
+
+logger = logging.getLogger(__name__)
+
+
+# streaming reader for the gzipped json-lines tweet files. files are
+# decompressed on a few threads at once (zlib lets go of the GIL while it
+# inflates) in big blocks that get split into lines, each file feeds its own
+# bounded queue so memory stays flat and lines come out in file order.
+#
+# with keep_ids we look for the ids in the raw bytes first and only parse
+# the lines that could match, most lines never get decoded
+
+# bytes of compressed file decompressed per read
+CHUNK_SIZE = 2 ** 20
+
+# blocks of lines buffered per file
+QUEUE_SIZE = 16
+
+# every "id": 123 / "id_str": "123" / "id": "123" in a raw line
+ID_PATTERN = re.compile(rb'"id(?:_str)?"\s*:\s*"?(\d+)')
+
+_DONE = object()
+
+
+def id_prefilter(keep_ids: Iterable) -> Callable[[bytes], bool]:
+    """
+    Check on the raw bytes of a line whether it mentions any of `keep_ids`
+    as an id. Lines that fail definitely aren't one of the tweets, lines
+    that pass still have to be checked after parsing.
+    """
+    keep = {str(tweet_id).encode() for tweet_id in keep_ids}
+
+    def could_match(line: bytes) -> bool:
+        return any(match in keep for match in ID_PATTERN.findall(line))
+
+    return could_match
+
+
+def _read_file(path: str,
+               lines: queue.Queue,
+               stop: threading.Event,
+               chunk_size: int,
+               skip_corrupted: bool):
+    # producer for one file, puts lists of raw lines and then _DONE
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                lines.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        remainder = b""
+        with gzip.open(path, "rb") as fin:
+            while True:
+                block = fin.read(chunk_size)
+                if not block:
+                    break
+                block_lines = (remainder + block).split(b"\n")
+                remainder = block_lines.pop()
+                if not put(block_lines):
+                    return
+        if remainder:
+            put([remainder])
+
+    # at least one of the daily retweet files is corrupted
+    except (OSError, EOFError, zlib.error) as e:
+        if not skip_corrupted:
+            put(e)
+            return
+        logger.warning(f"Corrupted gzip file {path}: {type(e).__name__}: {e}")
+
+    except Exception as e:
+        put(e)
+        return
+
+    put(_DONE)
+
+
+def iter_lines(paths: Union[str, Iterable[str]],
+               n_threads: int = 4,
+               chunk_size: int = CHUNK_SIZE,
+               skip_corrupted: bool = False) -> Iterator[bytes]:
+    """
+    Raw lines of one or more gzip files, in order. Up to `n_threads` files
+    are decompressed ahead of the one being read. Blank lines are skipped.
+
+    Parameters
+    ----------
+    paths: Union[str, Iterable[str]]
+        gzip file or files
+    n_threads: int
+        Number of files decompressed at once
+    skip_corrupted: bool
+        Log and move on when a file turns out to be corrupted, keeping the
+        lines read before the bad part, instead of raising
+    """
+    paths = [paths] if isinstance(paths, str) else list(paths)
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=QUEUE_SIZE) for _ in paths]
+
+    pool = ThreadPoolExecutor(max_workers=max(1, n_threads))
+    try:
+        for path, lines in zip(paths, queues):
+            pool.submit(_read_file, path, lines, stop, chunk_size, skip_corrupted)
+
+        for lines in queues:
+            while True:
+                block = lines.get()
+                if block is _DONE:
+                    break
+                if isinstance(block, Exception):
+                    raise block
+                for line in block:
+                    if line.strip():
+                        yield line
+    finally:
+        # the consumer stopped early, let the producers go
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def read_tweets(paths: Union[str, Iterable[str]],
+                keep_ids: Optional[Iterable] = None,
+                n_threads: int = 4,
+                skip_corrupted: bool = False,
+                with_raw: bool = False,
+                line_filter: Optional[Callable[[bytes], bool]] = None) -> Iterator[Union[Dict, tuple]]:
+    """
+    Tweets from gzipped json-lines files, parsed one at a time as they are
+    read.
+
+    Parameters
+    ----------
+    paths: Union[str, Iterable[str]]
+        gzip file or files
+    keep_ids: Iterable
+        Only yield tweets whose "id_str" (or "id") is one of these
+    n_threads: int
+        Number of files decompressed at once
+    skip_corrupted: bool
+        Log and skip the rest of corrupted files instead of raising
+    with_raw: bool
+        Yield (tweet, raw line) pairs, e.g. for the tweet store
+    line_filter: Callable[[bytes], bool]
+        Check on the raw line before parsing, lines it rejects are skipped
+        without decoding, e.g. a `text_filters.KeywordPrefilter`
+
+    Yields
+    ------
+    tweet: dict
+        Parsed tweet, or a (tweet, raw line) pair with `with_raw`
+    """
+    could_match = None
+    if keep_ids is not None:
+        keep_ids = {str(tweet_id) for tweet_id in keep_ids}
+        could_match = id_prefilter(keep_ids)
+
+    for line in iter_lines(paths, n_threads, skip_corrupted=skip_corrupted):
+        if could_match is not None and not could_match(line):
+            continue
+        if line_filter is not None and not line_filter(line):
+            continue
+
+        tweet = loads(line)
+        if keep_ids is not None and str(tweet.get("id_str", tweet.get("id"))) not in keep_ids:
+            continue
+
+        yield (tweet, line) if with_raw else tweet
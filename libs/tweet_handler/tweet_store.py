@@ -0,0 +1,293 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+
+# the hot fields we pull out of every tweet regardless of where it came from.
+# ids are stored as uint64 with 0 meaning missing, times as datetime64[s]
+# and strings as one utf-8 blob per column plus row offsets
+ID_COLUMNS = ["id", "user_id", "reply_to_id", "quote_of_id", "retweet_of_id"]
+TIME_COLUMNS = ["created_at"]
+STRING_COLUMNS = ["screen_name", "text"]
+HOT_COLUMNS = ID_COLUMNS + ["screen_name", "created_at", "text"]
+
+MISSING_TIME = np.iinfo(np.int64).min  # this is how numpy spells NaT
+
+
+def hot_fields(tweet: Dict) -> Dict:
+    """
+    Pull the hot fields out of a tweet json object. Handles the v1 api
+    objects in the public data, the v2 objects we downloaded for the
+    journalists, the congress scrape, and the trump twitter archive.
+    """
+    fields = {"reply_to_id": None, "quote_of_id": None, "retweet_of_id": None}
+    fields["id"] = tweet["id"]
+
+    # v1 api (public data and decahose)
+    if "user" in tweet:
+        fields["user_id"] = tweet["user"]["id"]
+        fields["screen_name"] = tweet["user"]["screen_name"]
+        fields["created_at"] = datetime.strptime(tweet["created_at"],
+                                                 "%a %b %d %H:%M:%S +0000 %Y")
+        fields["text"] = tweet.get("extended_tweet", {}).get("full_text", tweet.get("text"))
+        fields["reply_to_id"] = tweet.get("in_reply_to_status_id")
+        if "quoted_status" in tweet:
+            fields["quote_of_id"] = tweet["quoted_status"]["id"]
+        if "retweeted_status" in tweet:
+            fields["retweet_of_id"] = tweet["retweeted_status"]["id"]
+
+    # v2 api (journalists)
+    elif "author_id" in tweet:
+        fields["user_id"] = tweet["author_id"]
+        fields["screen_name"] = tweet.get("screen_name")
+        fields["created_at"] = datetime.strptime(tweet["created_at"],
+                                                 "%Y-%m-%dT%H:%M:%S.000Z")
+        fields["text"] = tweet.get("text")
+        kind_columns = {"replied_to": "reply_to_id",
+                        "quoted": "quote_of_id",
+                        "retweeted": "retweet_of_id"}
+        for ref_tw in tweet.get("referenced_tweets", []):
+            if ref_tw["type"] in kind_columns:
+                fields[kind_columns[ref_tw["type"]]] = ref_tw["id"]
+
+    # congress
+    elif "user_id" in tweet:
+        fields["user_id"] = tweet["user_id"]
+        fields["screen_name"] = tweet["screen_name"]
+        fields["created_at"] = datetime.fromisoformat(tweet["time"])
+        fields["text"] = tweet.get("text")
+
+    # trump twitter archive
+    elif "date" in tweet:
+        fields["user_id"] = None
+        fields["screen_name"] = "realDonaldTrump"
+        fields["created_at"] = datetime.strptime(tweet["date"], "%Y-%m-%d %H:%M:%S")
+        fields["text"] = tweet.get("text")
+
+    else:
+        raise KeyError(f"Standard keys not present in tweet: {tweet}")
+
+    return fields
+
+
+def _to_uint64(value) -> int:
+    if value is None or value == "null" or value == "":
+        return 0
+    return int(value)
+
+
+def _to_epoch_seconds(time_stamp: Optional[datetime]) -> int:
+    if time_stamp is None:
+        return MISSING_TIME
+
+    # naive times in our data are all utc
+    if time_stamp.tzinfo is None:
+        time_stamp = time_stamp.replace(tzinfo=timezone.utc)
+    return int(time_stamp.timestamp())
+
+
+def write_index(path: str, ids: np.ndarray, keep_raw: bool):
+    """
+    Sorted id index for binary search and the meta file of a store whose
+    `id` column is `ids`. Later copies of an id win, same as writing them
+    into a dict in order.
+    """
+    reversed_ids = ids[::-1]
+    index_ids, first_in_reversed = np.unique(reversed_ids, return_index=True)
+    index_rows = (ids.shape[0] - 1 - first_in_reversed).astype(np.int64)
+    np.save(os.path.join(path, "index_ids.npy"), index_ids)
+    np.save(os.path.join(path, "index_rows.npy"), index_rows)
+
+    with open(os.path.join(path, "meta.json"), "w") as fout:
+        json.dump({"n_rows": int(ids.shape[0]),
+                   "n_tweets": int(index_ids.shape[0]),
+                   "keep_raw": keep_raw,
+                   "columns": HOT_COLUMNS}, fout)
+
+
+class TweetStoreWriter:
+    """
+    Builds a tweet store on disk one tweet at a time. String and raw json
+    columns are streamed straight to their blob files, only the fixed width
+    columns are held in memory until `close` writes them out with the index.
+
+    Parameters
+    ----------
+    path: str
+        Directory to write the store into
+    keep_raw: bool
+        Whether to also keep the full json of every tweet as a blob column
+    """
+
+    def __init__(self, path: str, keep_raw: bool = True):
+        self.path = path
+        self.keep_raw = keep_raw
+        os.makedirs(path, exist_ok=True)
+
+        self.n_rows = 0
+        self.ids = {col: array("Q") for col in ID_COLUMNS}
+        self.times = {col: array("q") for col in TIME_COLUMNS}
+
+        blob_columns = STRING_COLUMNS + (["raw"] if keep_raw else [])
+        self.blobs = {col: open(os.path.join(path, f"{col}.bin"), "wb")
+                      for col in blob_columns}
+        self.offsets = {col: array("q", [0]) for col in blob_columns}
+
+    def add(self, tweet: Dict, raw: Optional[bytes] = None):
+        """
+        Add one tweet. `raw` can be the original json line to avoid dumping
+        the object again.
+        """
+        fields = hot_fields(tweet)
+
+        for col in ID_COLUMNS:
+            self.ids[col].append(_to_uint64(fields[col]))
+        for col in TIME_COLUMNS:
+            self.times[col].append(_to_epoch_seconds(fields[col]))
+        for col in STRING_COLUMNS:
+            self._write_blob(col, (fields[col] or "").encode("utf-8"))
+
+        if self.keep_raw:
+            if raw is None:
+                raw = json.dumps(tweet).encode("utf-8")
+            self._write_blob("raw", raw.strip())
+
+        self.n_rows += 1
+
+    def _write_blob(self, col: str, value: bytes):
+        self.blobs[col].write(value)
+        self.offsets[col].append(self.offsets[col][-1] + len(value))
+
+    def close(self):
+        for col in self.blobs:
+            self.blobs[col].close()
+            np.save(os.path.join(self.path, f"{col}.offsets.npy"),
+                    np.frombuffer(self.offsets[col], dtype=np.int64))
+
+        for col in ID_COLUMNS:
+            np.save(os.path.join(self.path, f"{col}.npy"),
+                    np.frombuffer(self.ids[col], dtype=np.uint64))
+        for col in TIME_COLUMNS:
+            np.save(os.path.join(self.path, f"{col}.npy"),
+                    np.frombuffer(self.times[col], dtype=np.int64).view("datetime64[s]"))
+
+        write_index(self.path, np.frombuffer(self.ids["id"], dtype=np.uint64), self.keep_raw)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TweetStore:
+    """
+    Random access reader for a tweet store written by `TweetStoreWriter`.
+    Everything is memory mapped so opening the store is cheap and looking up
+    a few thousand ids only touches the rows we ask for.
+
+    Parameters
+    ----------
+    path: str
+        Directory the store was written to
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), "r") as fin:
+            self.meta = json.loads(fin.read())
+
+        self.index_ids = self._load("index_ids.npy")
+        self.index_rows = self._load("index_rows.npy")
+        self._columns = {}
+
+    def _load(self, file_name: str) -> np.ndarray:
+        return np.load(os.path.join(self.path, file_name), mmap_mode="r")
+
+    def _blob(self, col: str):
+        if col not in self._columns:
+            blob_path = os.path.join(self.path, f"{col}.bin")
+            # np.memmap can't map empty files
+            if os.path.getsize(blob_path) > 0:
+                blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+            else:
+                blob = np.zeros(0, dtype=np.uint8)
+            self._columns[col] = (blob, self._load(f"{col}.offsets.npy"))
+        return self._columns[col]
+
+    def column(self, col: str) -> np.ndarray:
+        """
+        Full fixed width column in row order (includes overwritten rows).
+        """
+        if col not in self._columns:
+            self._columns[col] = self._load(f"{col}.npy")
+        return self._columns[col]
+
+    def rows(self, ids: Iterable) -> np.ndarray:
+        """
+        Row number of every id, -1 for ids that are not in the store.
+        """
+        ids = np.array([_to_uint64(i) for i in ids], dtype=np.uint64)
+        positions = np.searchsorted(self.index_ids, ids)
+        positions = np.minimum(positions, max(self.index_ids.shape[0] - 1, 0))
+
+        rows = np.full(ids.shape[0], -1, dtype=np.int64)
+        if self.index_ids.shape[0] > 0:
+            found = self.index_ids[positions] == ids
+            rows[found] = self.index_rows[positions[found]]
+        return rows
+
+    def _strings(self, col: str, rows: np.ndarray) -> List[str]:
+        blob, offsets = self._blob(col)
+        return [bytes(blob[offsets[r]:offsets[r + 1]]).decode("utf-8") for r in rows]
+
+    def get(self, ids: Iterable, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Hot fields for the requested ids as a dataframe in request order. Ids
+        we don't have are dropped. Ids come back as strings like "id_str".
+        """
+        rows = self.rows(ids)
+        return self.get_rows(rows[rows >= 0], columns)
+
+    def get_rows(self, rows: np.ndarray, columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        Hot fields of the given row numbers, like `get`.
+        """
+        if columns is None:
+            columns = HOT_COLUMNS
+
+        df = {}
+        for col in columns:
+            if col in ID_COLUMNS:
+                values = np.asarray(self.column(col)[rows])
+                df[col] = [str(v) if v else None for v in values]
+            elif col in TIME_COLUMNS:
+                df[col] = pd.to_datetime(np.asarray(self.column(col)[rows]), utc=True)
+            elif col in STRING_COLUMNS:
+                df[col] = self._strings(col, rows)
+            else:
+                raise KeyError(f"No column '{col}' in tweet store")
+
+        return pd.DataFrame(df, columns=columns)
+
+    def get_json(self, tweet_id) -> Optional[Dict]:
+        """
+        The original json of one tweet, None if we don't have it.
+        """
+        if not self.meta["keep_raw"]:
+            raise ValueError("Tweet store was written without raw json")
+
+        row = self.rows([tweet_id])[0]
+        if row < 0:
+            return None
+        return json.loads(self._strings("raw", [row])[0])
+
+    def __contains__(self, tweet_id) -> bool:
+        return self.rows([tweet_id])[0] >= 0
+
+    def __len__(self) -> int:
+        return self.meta["n_tweets"]
@@ -50,14 +50,16 @@ if rerun_bootstrap:
                 group_dfs.append(predictions)
 
 
+        # every frame column bootstrapped from the same resamples
+        frame_cis = bootstrap_ci(predictions[all_frames].values,
+                                 "proportion",
+                                 10000,
+                                 0.05,
+                                 seed=123)
+
         group_frames = {}
         for i, frame in enumerate(all_frames):
-
-            group_frames[frame] = bootstrap_ci(predictions[frame].values,
-                                               lambda x: x.sum() / x.shape[0],
-                                               10000,
-                                               0.05,
-                                               seed=123)
+            group_frames[frame] = {key: value[i] for key, value in frame_cis.items()}
 
         frame_probs[group] = group_frames
 
@@ -150,6 +152,13 @@ def diversity(df):
 
     return normed_entropy
 
+
+# same thing for a whole batch of bootstrapped frame sums at once
+def diversity_from_sums(frame_sums):
+    frame_distribution = frame_sums / frame_sums.sum(axis=1, keepdims=True)
+
+    return entropy(frame_distribution, axis=1) / np.log(frame_distribution.shape[1])
+
 # %%
 rerun_bootstrap = False
 
@@ -165,7 +174,8 @@ if rerun_bootstrap:
                                                      diversity,
                                                      10000,
                                                      "rows",
-                                                     0.05)
+                                                     0.05,
+                                                     sum_statistic=diversity_from_sums)
 
             row_dict = {"group": group,
                         "frame_type": frame_type,
@@ -37,17 +37,19 @@ congress_preds = ds.load_congress_frames()
 # %%
 frame_cols = config["frames"]["generic"] + config["frames"]["specific"] + config["frames"]["narrative"]
 new_rows = []
-for i, frame in enumerate(congress_preds[frame_cols]):
-    for affiliation in congress_preds["Affiliation"].unique():
+for affiliation in congress_preds["Affiliation"].unique():
+    aff_preds = congress_preds[congress_preds["Affiliation"] == affiliation]
+
+    # every frame column bootstrapped from the same resamples
+    frame_cis = bootstrap_ci(aff_preds[frame_cols].values,
+                             "proportion",
+                             1000,
+                             0.05)
+
+    for i, frame in enumerate(frame_cols):
         new_row = {"Affiliation": affiliation}
         new_row["Frame"] = frame
-
-        aff_preds = congress_preds[congress_preds["Affiliation"]
-                                   == affiliation]
-        new_row.update(bootstrap_ci(aff_preds[frame].values,
-                                    lambda x: x.sum() / x.shape[0],
-                                    1000,
-                                    0.05))
+        new_row.update({key: value[i] for key, value in frame_cis.items()})
 
         new_rows.append(new_row)
 
@@ -149,17 +151,19 @@ journo = journo.dropna(subset="affiliation")
 
 
 new_rows = []
-for i, frame in enumerate(journo[frame_cols]):
-    for affiliation in journo["affiliation"].unique():
+for affiliation in journo["affiliation"].unique():
+    journo_aff = journo[journo["affiliation"] == affiliation]
+
+    # every frame column bootstrapped from the same resamples
+    frame_cis = bootstrap_ci(journo_aff[frame_cols].values,
+                             "proportion",
+                             1000,
+                             0.05)
+
+    for i, frame in enumerate(frame_cols):
         new_row = {"Affiliation": affiliation}
         new_row["Frame"] = frame
-
-        journo_aff = journo[journo["affiliation"]
-                                   == affiliation]
-        new_row.update(bootstrap_ci(journo_aff[frame].values,
-                                    lambda x: x.sum() / x.shape[0],
-                                    1000,
-                                    0.05))
+        new_row.update({key: value[i] for key, value in frame_cis.items()})
 
         new_rows.append(new_row)
 
@@ -194,17 +198,19 @@ plt.axvline(mean_ideology)
 public_frames["affiliation"] = public_frames["ideology"].map(bias_to_label)
 
 new_rows = []
-for i, frame in enumerate(public_frames[frame_cols]):
-    for affiliation in public_frames["affiliation"].unique():
+for affiliation in public_frames["affiliation"].unique():
+    public_aff = public_frames[public_frames["affiliation"] == affiliation]
+
+    # every frame column bootstrapped from the same resamples
+    frame_cis = bootstrap_ci(public_aff[frame_cols].values,
+                             "proportion",
+                             100,
+                             0.05)
+
+    for i, frame in enumerate(frame_cols):
         new_row = {"Affiliation": affiliation}
         new_row["Frame"] = frame
-
-        public_aff = public_frames[public_frames["affiliation"]
-                                   == affiliation]
-        new_row.update(bootstrap_ci(public_aff[frame].values,
-                                    lambda x: x.sum() / x.shape[0],
-                                    100,
-                                    0.05))
+        new_row.update({key: value[i] for key, value in frame_cis.items()})
 
         new_rows.append(new_row)
 
@@ -253,139 +253,49 @@ categories = group_politics + ["trump"]
 test_pairs = list(permutations(categories, 2))
 
 
-def run_granger_causality(pair: Tuple,
-                          data: dict,
-                          events: Iterable,
-                          frame: str,
-                          shuffle_source: bool = False) -> dict:
-    
-    # we're going to return a dict we can use as a dataframe row
-    result = {}
-    result["frame"] = frame
-    
-    # pull out a dictionary for the data we are looking at
-    if type(pair[0]) == tuple:
-        source_data = data[pair[0][0]][pair[0][1]][frame].copy()
-        result["source"] = pair[0][0] + "-" + pair[0][1]
-    else:
-        source_data = data[pair[0]][frame].copy()
-        result["source"] = pair[0]
-    
-    if type(pair[1]) == tuple:
-        target_data = data[pair[1][0]][pair[1][1]][frame].copy()
-        result["target"] = pair[1][0] + "-" + pair[1][1]
-    else:
-        target_data = data[pair[1]][frame].copy()
-        result["target"] = pair[1]
-
-    if shuffle_source:
-        source_data = np.random.permutation(source_data)
-    
-    gcdf = pd.DataFrame({"source": source_data, "target": target_data, "events": events}).fillna(0)
-    
-
-    if len(gcdf.columns[gcdf.nunique() <= 1]) > 0:
-        return {}
-    
-    with warnings.catch_warnings():
-        warnings.filterwarnings("ignore")
-        var_fit = VAR(gcdf).fit(maxlags=21, ic="aic")
-    
-    if var_fit.k_ar > 0:
-        gc_without_events = {}
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore")
-            gc_output = var_fit.test_causality("target", "source")
-        gc_without_events["p_value"] = gc_output.pvalue
-        gc_without_events["f_statistic"] = gc_output.test_statistic
-        gc_without_events["events_causing"] = False
-        no_event_result = result.copy()
-        no_event_result.update(gc_without_events)
-
-        gc_with_events = {}
-        with warnings.catch_warnings():
-            warnings.filterwarnings("ignore")
-            gc_output = var_fit.test_causality("target", ["source", "events"])
-        gc_with_events["p_value"] = gc_output.pvalue
-        gc_with_events["f_statistic"] = gc_output.test_statistic
-        gc_with_events["events_causing"] = True
-        result.update(gc_with_events)
-    else:
-        gc_without_events = {}
-        gc_without_events["p_value"] = 1
-        gc_without_events["f_statistic"] = 0
-        gc_without_events["events_causing"] = False
-        no_event_result = result.copy()
-        no_event_result.update(gc_without_events)
-
-        gc_with_events = {}
-        gc_with_events["p_value"] = 1
-        gc_with_events["f_statistic"] = 0
-        gc_with_events["events_causing"] = True
-        result.update(gc_with_events)
+# the sweep runs every pair and frame on its own process, picks the lag
+# order once per pair and frame and reuses it for the 100 shuffles of the
+# source. rows are appended to the sweep tsv as they finish so an
+# interrupted run picks up where it left off
+from frame_stats.granger import run_granger_sweep
 
-    return [no_event_result, result]
 
+def category_name(category) -> str:
+    return category if type(category) != tuple else category[0] + "-" + category[1]
 
-output_rows = []
-for pair in tqdm(test_pairs):
-    for frame in good_frames:
-        output_rows.extend(run_granger_causality(pair, residuals, scaffolded_events["event"].values, frame))
 
-granger_df = pd.DataFrame(output_rows).reset_index()
+category_series = {}
+for category in categories:
+    if type(category) == tuple:
+        category_series[category_name(category)] = residuals[category[0]][category[1]]
+    else:
+        category_series[category_name(category)] = residuals[category]
+
+granger_df = run_granger_sweep(category_series,
+                               [(category_name(s), category_name(t)) for s, t in test_pairs],
+                               good_frames,
+                               scaffolded_events["event"].values,
+                               f"data/time_series_output/granger_sweep_partisan_{normalize}.tsv",
+                               maxlags=21,
+                               ic="aic",
+                               n_shuffles=100,
+                               seed=0,
+                               n_workers=os.cpu_count())
 granger_df.to_csv(f"data/time_series_output/all_grangers_partisan_{normalize}.tsv", sep="\t")
 
 
 alpha = 0.05
 
 # multiple testing proceedure
-def bonferroni_holm(data, alpha):
-    sorted = data.sort_values("p_value")
-    rejections = np.zeros(sorted.shape[0], dtype=bool)
-    new_p = np.zeros(sorted.shape[0])
-
-    for row_i in range(sorted.shape[0]):
-
-        # functional alpha for each iteration
-        abh = alpha / (sorted.shape[0] - row_i)
-        new_p[row_i] = (sorted.iloc[row_i]["p_value"] * (sorted.shape[0] - row_i))
-
-        if sorted.iloc[row_i]["p_value"] < abh:
-            rejections[row_i] = True
+from frame_stats.multiple_testing import correct_p_values
 
-    sorted["null_rejected"] = rejections
-    sorted["p_corrected"] = new_p
-    return sorted
-
-gcdf_corrected = bonferroni_holm(granger_df, 0.05)
+gcdf_corrected = correct_p_values(granger_df, "holm", alpha).sort_values("p_value")
 signif = gcdf_corrected[gcdf_corrected["null_rejected"] == True]
 signif.to_csv(f"data/time_series_output/significant_complete_granger_partisan_{normalize}.tsv", sep="\t")
 
 # %%
-# bootstrap gc runs
-output_rows = []
-n_boots = 100
-for pair in tqdm(test_pairs):
-    for frame in good_frames:
-        for _ in range(n_boots):
-            output_rows.extend(run_granger_causality(pair, residuals, scaffolded_events["event"].values, frame, shuffle_source=True))
-
-bootstrap_gcs = pd.DataFrame(output_rows)
-bootstrap_gcs.to_csv("bootstrap_gc.tsv", sep="\t", index=False)
-# %%
-# This really should live else where but for now its here
-bootstrap_gcs
-# %%
-observed_quantiles = []
-for i, row in signif.iterrows():
-    boots = bootstrap_gcs[(bootstrap_gcs["frame"] == row["frame"]) &
-                          (bootstrap_gcs["source"] == row["source"]) &
-                          (bootstrap_gcs["target"] == row["target"]) &
-                          (bootstrap_gcs["events_causing"] == row["events_causing"])]
-    
-    observed_quantiles.append(np.mean(row["f_statistic"] < boots["f_statistic"]))
-
-signif["bootstrap_p"] = observed_quantiles
+# shuffle null from the sweep, fraction of shuffled F statistics above the
+# observed one
 boot_signif = signif[signif["bootstrap_p"] < 0.05]
 signif.to_csv("data/time_series_output/significant_complete_granger_partisan_{normalized}_bootstrap.tsv")
 # %%
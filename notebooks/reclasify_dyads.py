@@ -5,7 +5,8 @@ import pandas as pd
 import numpy as np
 import scipy.linalg as sla
 import tqdm
-from simpletransformers.classification import MultiLabelClassificationModel as MLCM
+from frame_classifier import FrameClassifier
+from prediction_cache import PredictionCache
 
 from functools import reduce
 
@@ -19,76 +20,57 @@ with open("workflow/config.json") as config_file:
 print(len(dyads))
 
 # %%
-general = MLCM(model_type=config["model"],
-               model_name=config["model_names"]["generic"],
-               use_cuda=False)
-specific = MLCM(model_type=config["model"],
-                model_name=config["model_names"]["specific"],
-                use_cuda=False)
-narrative = MLCM(model_type=config["model"],
-                 model_name=config["model_names"]["narrative"],
-                 use_cuda=False)
-
-models = {}
-models["generic"] = general
-models["specific"] = specific
-models["narrative"] = narrative
+with open("workflow/paths.json") as paths_file:
+    paths = json.loads(paths_file.read())
+
+# all three models run together and repeated texts come from the cache
+cache = PredictionCache(paths["prediction_cache"])
+classifier = FrameClassifier(config, cache=cache)
 
 # %%
+# we classify every text in one go and then put the dyads back together
+dyad_objects = [json.loads(dyad) for dyad in dyads]
+texts = []
+text_rows = []
+for obj in dyad_objects:
+    rows = {"target": len(texts)}
+    texts.append(obj["target_full"]["text"])
+
+    # retweets carry the target text so only the others need the source
+    if obj["relationship"] != "retweet":
+        rows["source"] = len(texts)
+        texts.append(obj["source_full"]["text"])
+    text_rows.append(rows)
+
+predictions = classifier.predict(texts)
+all_frames = np.hstack((predictions["generic"],
+                        predictions["specific"],
+                        predictions["narrative"]))
+print(cache.stats())
+
 # %%
 framed_objects = []
-for i, dyad in enumerate(tqdm.tqdm(dyads)):
+for i, obj in enumerate(tqdm.tqdm(dyad_objects)):
     frame_dyad = {}
-    obj = json.loads(dyad)
-    if obj["relationship"] == "retweet":
-        # classify the target only
-        target_generic_frames = general.predict([obj["target_full"]["text"]])[0]
-        target_specific_frames = specific.predict([obj["target_full"]["text"]])[0]
-        target_narrative_frames = narrative.predict([obj["target_full"]["text"]])[0]
-
-        target_frames = np.hstack((target_generic_frames,
-                                   target_specific_frames,
-                                   target_narrative_frames))
+    target_frames = all_frames[text_rows[i]["target"]].tolist()
 
+    if obj["relationship"] == "retweet":
         frame_dyad["source_frames"] = target_frames
         frame_dyad["target_frames"] = target_frames
-
-        frame_dyad["relationship"] = obj["relationship"]
-
-        frame_dyad["source"] = obj["source_full"]["screen_name"]
-        frame_dyad["target"] = obj["target_full"]["screen_name"]
-
-        frame_dyad["created_at"] = obj["source_full"]["created_at"]
-
-        framed_objects.append(frame_dyad)
     elif obj["relationship"] == "quote" or obj["relationship"] == "reply":
-        target_generic_frames = general.predict([obj["target_full"]["text"]])[0]
-        target_specific_frames = specific.predict([obj["target_full"]["text"]])[0]
-        target_narrative_frames = narrative.predict([obj["target_full"]["text"]])[0]
-        target_frames = np.hstack((target_generic_frames,
-                                   target_specific_frames,
-                                   target_narrative_frames))
-
-
-        source_generic_frames = general.predict([obj["source_full"]["text"]])[0]
-        source_specific_frames = specific.predict([obj["source_full"]["text"]])[0]
-        source_narrative_frames = narrative.predict([obj["source_full"]["text"]])[0]
-        source_frames = np.hstack((source_generic_frames,
-                                   source_specific_frames,
-                                   source_narrative_frames))
-
-
-        frame_dyad["source_frames"] = source_frames
+        frame_dyad["source_frames"] = all_frames[text_rows[i]["source"]].tolist()
         frame_dyad["target_frames"] = target_frames
+    else:
+        continue
+
+    frame_dyad["relationship"] = obj["relationship"]
 
-        frame_dyad["relationship"] = obj["relationship"]
+    frame_dyad["source"] = obj["source_full"]["screen_name"]
+    frame_dyad["target"] = obj["target_full"]["screen_name"]
 
-        frame_dyad["source"] = obj["source_full"]["screen_name"]
-        frame_dyad["target"] = obj["target_full"]["screen_name"]
+    frame_dyad["created_at"] = obj["source_full"]["created_at"]
 
-        frame_dyad["created_at"] = obj["source_full"]["created_at"]
-        
-        framed_objects.append(frame_dyad)
+    framed_objects.append(frame_dyad)
 
 with open("data/edge_lists/classified_dyads.json", "w") as fout:
     json.dump(framed_objects, fout)
@@ -356,25 +356,9 @@ print(gcdf)
 alpha = 0.05
 
 # multiple testing proceedure
-def bonferroni_holm(data, alpha):
-    sorted = data.sort_values("p_value")
-    rejections = np.zeros(sorted.shape[0], dtype=bool)
-    new_p = np.zeros(sorted.shape[0])
+from frame_stats.multiple_testing import correct_p_values
 
-    for row_i in range(sorted.shape[0]):
-
-        # functional alpha for each iteration
-        abh = alpha / (sorted.shape[0] - row_i)
-        new_p[row_i] = (sorted.iloc[row_i]["p_value"] * (sorted.shape[0] - row_i))
-
-        if sorted.iloc[row_i]["p_value"] < abh:
-            rejections[row_i] = True
-
-    sorted["null_rejected"] = rejections
-    sorted["p_corrected"] = new_p
-    return sorted
-
-gcdf_corrected = bonferroni_holm(gcdf, 0.05)
+gcdf_corrected = correct_p_values(gcdf, "holm", alpha).sort_values("p_value")
 signif = gcdf_corrected[gcdf_corrected["null_rejected"] == True]
 signif.to_csv(f"../data/time_series_output/significant_complete_granger{norm_label}.tsv", sep="\t")
 # %% [markdown]
@@ -487,7 +471,7 @@ gcdf.to_csv(f"../data/time_series_output/optimal_granger_causality{norm_label}.t
             sep="\t",
             index=False)
 
-gcdf_corrected = bonferroni_holm(gcdf, 0.05)
+gcdf_corrected = correct_p_values(gcdf, "holm", alpha).sort_values("p_value")
 signif = gcdf_corrected
 signif.to_csv(f"../data/time_series_output/significant_complete_granger{norm_label}_optimal_ar.tsv", sep="\t")
 # %%
@@ -6,8 +6,8 @@ import json
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-import pickle
 import seaborn as sns
+from scipy.stats import norm
 
 import os
 if os.getcwd().split("/")[-1] == "scripts" or os.getcwd().split("/")[-1] == "notebooks":
@@ -24,9 +24,27 @@ with open("workflow/paths.json", "r") as pf:
     paths = json.loads(pf.read())
 print("config and paths loaded")
 
-# load the results dictionary
-with open(paths["regression"]["result_pickles"] + "self_influence.pkl", "rb") as self_pkl:
-    self_results = pickle.load(self_pkl)
+# coefficient tables written by the logistic_regressions notebook, one row
+# per frame and term
+def load_coefficients(specification: str) -> pd.DataFrame:
+    return pd.read_csv(paths["regression"][f"{specification}_output"] + "coefficients.tsv", sep="\t")
+
+
+def term_results(coefficients: pd.DataFrame, term: str, frames: list,
+                 generic_label: str = "Generic", specific_label: str = "Specific") -> pd.DataFrame:
+    # coefficient, p-value and 95% interval half width of one term for every
+    # frame, in the order of `frames`
+    rows = coefficients[coefficients["term"] == term].set_index("frame").loc[frames]
+    results = pd.DataFrame({"frame": frames,
+                            "coef": rows["coef"].values,
+                            "pvalue": rows["p_value"].values,
+                            "ci": rows["std_err"].values * norm.ppf(0.975)})
+    results["Frame Type"] = [generic_label if frame in config["frames"]["generic"] else specific_label
+                             for frame in frames]
+    return results
+
+
+self_results = load_coefficients("self")
 
 # wse want to use only a subset of the frames
 granger_causal_frames = ["Morality and Ethics",
@@ -55,22 +73,7 @@ good_frames = [frame for frame in all_frames if frame not in config["frames"]["l
 #
 # This value is on the x-axis along with confidence intervals
 # %%
-collected_self_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-
-    collected_self_results["frame"].append(frame)
-    collected_self_results["coef"].append(self_results[frame].params["exposure"])
-    collected_self_results["pvalue"].append(self_results[frame].pvalues["exposure"])
-    collected_self_results["ci"].append(self_results[frame].conf_int().loc["exposure"][1] - self_results[frame].params["exposure"])
-    
-    if frame in config["frames"]["generic"]:
-        ftype = "Issue-Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Issue-Specific"
-    collected_self_results["Frame Type"].append(ftype)
-
-exposure_results = pd.DataFrame(collected_self_results)
+exposure_results = term_results(self_results, "self_exposure", good_frames, "Issue-Generic", "Issue-Specific")
 exposure_results["bonferroni_pvalue"] = exposure_results["pvalue"] * exposure_results.shape[0]
 exposure_results["Significant"] = exposure_results["bonferroni_pvalue"] < 0.05
 
@@ -110,22 +113,7 @@ plt.show()
 # Here we're going to put ideology on the x-axis. More positive means more
 # right wing users use the frame negative means left-wing.
 # %%
-collected_self_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-    collected_self_results["frame"].append(frame)
-    collected_self_results["coef"].append(self_results[frame].params["ideology"])
-    collected_self_results["pvalue"].append(self_results[frame].pvalues["ideology"])
-    collected_self_results["ci"].append(self_results[frame].conf_int().loc["ideology"][1] - self_results[frame].params["ideology"])
-
-    if frame in config["frames"]["generic"]:
-        ftype = "Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Specific"
-
-    collected_self_results["Frame Type"].append(ftype)
-
-ideology_results = pd.DataFrame(collected_self_results)
+ideology_results = term_results(self_results, "ideology", good_frames)
 ideology_results["bonferroni_pvalue"] = ideology_results["pvalue"] * ideology_results.shape[0]
 ideology_results["Significant"] = ideology_results["bonferroni_pvalue"] < 0.05
 
@@ -160,25 +148,9 @@ plt.show()
 # This figure shows the log odds ratio for frame cueing but with frame exposure
 # from ones mention network neighbors rather than ones self
 # %%
-with open(paths["regression"]["result_pickles"] + "alter_influence.pkl", "rb") as self_pkl:
-    alter_results = pickle.load(self_pkl)
-
-collected_alter_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-    collected_alter_results["frame"].append(frame)
-    collected_alter_results["coef"].append(alter_results[frame].params["exposure"])
-    collected_alter_results["pvalue"].append(alter_results[frame].pvalues["exposure"])
-    collected_alter_results["ci"].append(alter_results[frame].conf_int().loc["exposure"][1] - alter_results[frame].params["exposure"])
-
-    if frame in config["frames"]["generic"]:
-        ftype = "Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Specific"
-    
-    collected_alter_results["Frame Type"].append(ftype)
+alter_results = load_coefficients("alter")
 
-exposure_results = pd.DataFrame(collected_alter_results)
+exposure_results = term_results(alter_results, "alter_exposure", good_frames)
 exposure_results["bonferroni_pvalue"] = exposure_results["pvalue"] * exposure_results.shape[0]
 exposure_results["Significant"] = exposure_results["bonferroni_pvalue"] < 0.05
 
@@ -223,22 +195,7 @@ plt.show()
 # Here we're going to put ideology on the x-axis. More positive means more
 # right wing users use the frame negative means left-wing.
 # %%
-collected_alter_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-    collected_alter_results["frame"].append(frame)
-    collected_alter_results["coef"].append(alter_results[frame].params["ideology"])
-    collected_alter_results["pvalue"].append(alter_results[frame].pvalues["ideology"])
-    collected_alter_results["ci"].append(alter_results[frame].conf_int().loc["ideology"][1] - alter_results[frame].params["ideology"])
-
-    if frame in config["frames"]["generic"]:
-        ftype = "Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Specific"
-
-    collected_alter_results["Frame Type"].append(ftype)
-
-ideology_results = pd.DataFrame(collected_alter_results)
+ideology_results = term_results(alter_results, "ideology", good_frames)
 ideology_results["bonferroni_pvalue"] = ideology_results["pvalue"] * ideology_results.shape[0]
 ideology_results["Significant"] = ideology_results["bonferroni_pvalue"] < 0.05
 
@@ -268,23 +225,16 @@ plt.show()
 # %% [markdown]
 # #quick sidebar: correlarion between frequency and log odds ratios
 # %%
-collected_results = {"frame": [], "exposure": [], "ideology": [], "Frame Type": []}
-for frame in good_frames:
-    if (alter_results[frame].pvalues["ideology"] * len(good_frames) < 0.05) and \
-       (alter_results[frame].pvalues["exposure"] * len(good_frames) < 0.05):
-
-        collected_results["frame"].append(frame)
-        collected_results["ideology"].append(alter_results[frame].params["ideology"])
-        collected_results["exposure"].append(alter_results[frame].params["exposure"])
-
-        if frame in config["frames"]["generic"]:
-            ftype = "Generic"
-        if frame in config["frames"]["specific"]:
-            ftype = "Specific"
-
-        collected_results["Frame Type"].append(ftype)
-
-collected_df = pd.DataFrame(collected_results)
+alter_exposure = term_results(alter_results, "alter_exposure", good_frames).set_index("frame")
+alter_ideology = term_results(alter_results, "ideology", good_frames).set_index("frame")
+both_significant = (alter_ideology["pvalue"] * len(good_frames) < 0.05) & \
+                   (alter_exposure["pvalue"] * len(good_frames) < 0.05)
+
+collected_results = pd.DataFrame({"frame": alter_exposure.index,
+                                  "exposure": alter_exposure["coef"].values,
+                                  "ideology": alter_ideology["coef"].values,
+                                  "Frame Type": alter_exposure["Frame Type"].values})[both_significant.values]
+collected_df = collected_results.reset_index(drop=True)
 # %%
 frame_probs = pd.read_csv("data/eda_bootstrap/coarse_frequency_boot.tsv", sep="\t", index_col=0)
 public_probs = frame_probs[frame_probs["Group"] == "public"]
@@ -307,22 +257,7 @@ plt.savefig("plots/regression/alter_odds_frequency.svg", dpi=300)
 from scipy.stats import spearmanr
 
 # %%
-collected_self_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-
-    collected_self_results["frame"].append(frame)
-    collected_self_results["coef"].append(self_results[frame].params["exposure"])
-    collected_self_results["pvalue"].append(self_results[frame].pvalues["exposure"])
-    collected_self_results["ci"].append(self_results[frame].conf_int().loc["exposure"][1] - self_results[frame].params["exposure"])
-    
-    if frame in config["frames"]["generic"]:
-        ftype = "Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Specific"
-    collected_self_results["Frame Type"].append(ftype)
-
-exposure_results = pd.DataFrame(collected_self_results)
+exposure_results = term_results(self_results, "self_exposure", good_frames)
 exposure_results["bonferroni_pvalue"] = exposure_results["pvalue"] * exposure_results.shape[0]
 exposure_results["Significant"] = exposure_results["bonferroni_pvalue"] < 0.05
 
@@ -332,22 +267,7 @@ self_df["self_coef"] = self_df["coef"]
 self_df["self_p"] = self_df["bonferroni_pvalue"]
 
 
-collected_alter_results = {"frame": [], "coef": [], "pvalue": [], "ci": [], "Frame Type": []}
-
-for frame in good_frames:
-    collected_alter_results["frame"].append(frame)
-    collected_alter_results["coef"].append(alter_results[frame].params["exposure"])
-    collected_alter_results["pvalue"].append(alter_results[frame].pvalues["exposure"])
-    collected_alter_results["ci"].append(alter_results[frame].conf_int().loc["exposure"][1] - alter_results[frame].params["exposure"])
-
-    if frame in config["frames"]["generic"]:
-        ftype = "Generic"
-    if frame in config["frames"]["specific"]:
-        ftype = "Specific"
-    
-    collected_alter_results["Frame Type"].append(ftype)
-
-exposure_results = pd.DataFrame(collected_alter_results)
+exposure_results = term_results(alter_results, "alter_exposure", good_frames)
 exposure_results["bonferroni_pvalue"] = exposure_results["pvalue"] * exposure_results.shape[0]
 exposure_results["Significant"] = exposure_results["bonferroni_pvalue"] < 0.05
 
@@ -12,6 +12,7 @@ from datetime import timedelta
 import frame_stats as fs
 import frame_stats.time_series as ts
 import frame_stats.causal_inferrence as ci  # has the functions for setting up regression
+from data_selector.mention_network import MentionGraph
 
 
 # config has frame names
@@ -28,43 +29,17 @@ filtered_tweets = fs.filter_users_by_activity(f, 10)
 # FOR TESTING
 filtered_tweets = filtered_tweets.sample(frac=1)
 
-# connect screen names and user ids. needed to work with mention network
-user_id_map = pd.read_csv(paths["public"]["user_id_map"], sep="\t",
-                          dtype={"screen_name": str, "user_id": str})
-
-# to speed up our lookups in the loop later
-print("building name to id mappers")
-name_to_id = {row["screen_name"]: row["user_id"] for _, row in user_id_map.iterrows()}
-id_to_name = {row["user_id"]: row["screen_name"] for _, row in user_id_map.iterrows()}
-print("name to id mappers built")
-
-# the mention network itself
-mentions = pd.read_csv(paths["mentions"]["network"], sep="\t",
-                       dtype={"uid1": str, "uid2": str,
-                              "1to2freq": int, "2to1freq": int})
-
-# make long to make building dict easier
-print("making mentions longer")
-top_half = mentions[["uid1", "uid2"]].rename({"uid1": "source",
-                                                  "uid2": "target"},
-                                                  axis="columns")
-bottom_half = mentions[["uid2", "uid1"]].rename({"uid2": "source",
-                                                     "uid1": "target"},
-                                                  axis="columns")
-mentions = pd.concat((top_half, bottom_half)).drop_duplicates()
-print("mentions complete")
-
-# the key to speeding up the loop below
-print("building mention neighbor dict\n")
-neighbors = {}
-neighbors_df = mentions.groupby("source")["target"].unique().reset_index()
-
-for _, row in tqdm(neighbors_df.iterrows()):
-    neighbors[row["source"]] = list(row["target"])
+# the mention network as a sparse matrix, with the user id map attached so
+# we can go between screen names and user ids
+print("building mention graph")
+graph = MentionGraph.from_files(paths["mentions"]["network"],
+                                paths["public"]["user_id_map"])
 
+# id keyed adjacency list is still written out for anything that wants it
+neighbors = {user_id: list(graph.neighbors(user_id)) for user_id in tqdm(graph.user_ids)}
 with open(paths["mentions"]["adjacency_list_ids"], "w") as fout:
     json.dump(neighbors, fout)
-print("mention neighbor dict complete")
+print("mention graph built")
 
 # list of all frame names
 all_frame_list = config["frames"]["generic"] + config["frames"]["specific"] + config["frames"]["narrative"]
@@ -77,83 +52,18 @@ meta_subset = pd.merge(filtered_tweets[["id_str"]], meta, how="left", on="id_str
 meta_subset["id_str"] = meta_subset["id_str"].astype(str)
 
 
-def get_unique_mentions(user: str,
-                        mentions: pd.DataFrame,
-                        name_to_id_map: Dict,
-                        id_to_name_map: Dict) -> Optional[Tuple[int, List[str]]]:
-    user_id = ts.get_user_id(user, user_id_map)
-
-    # if we have the user in our map we continue doing stuff
-    if user in name_to_id_map:
-        user_id = name_to_id_map[user]
-        user_mentions = mentions[(mentions["uid1"] == user_id) | (mentions["uid2"] == user_id)]
-        unique_mentions = user_mentions.shape[0]
-
-        neighbor_ids = np.hstack((user_mentions["uid1"].values,
-                                 user_mentions["uid2"].values))
-        
-        neighbor_ids = neighbor_ids[neighbor_ids != user_id]
-        
-        neighbors = []
-        for id in neighbor_ids:
-
-            # skip the self in making this list
-            if id in id_to_name_map:
-                name = id_to_name_map[id]
-
-            # again we might not have the user in our map
-                neighbors.append(name)
-
-        return (unique_mentions, neighbors)
-
-    else:
-         return None
-
-
-def get_neighbors(user: str,
-                  mention_neighbors: dict,
-                  name_to_id_map: Dict,
-                  id_to_name_map: Dict) -> Optional[Tuple[int, List[str]]]:
-    user_id = ts.get_user_id(user, user_id_map)
-
-    # if we have the user in our map we continue doing stuff
-    if user in name_to_id_map:
-
-        user_id = name_to_id_map[user]
-        if user_id in mention_neighbors:
-            all_neighbors = mention_neighbors[user_id]
-            unique_mentions = len(all_neighbors)
-
-            neighbors = []
-            for id in all_neighbors:
-
-                # skip the self in making this list
-                if id in id_to_name_map:
-                    name = id_to_name_map[id]
-
-                # again we might not have the user in our map
-                    neighbors.append(name)
-
-                return (unique_mentions, neighbors)
-            else:
-                return None
-
-    else:
-         return None
-
-
-
 feature_rows = []
 mention_neighbors = {}
 for user in tqdm(filtered_tweets["screen_name"]):
     user_features = {}
 
-    # convert user screen name to user id number
-    lookup = get_neighbors(user, neighbors, name_to_id, id_to_name)
+    # every mention neighbor of the user, None if they're not in the graph
+    user_id = graph.user_id(user)
+    targets = graph.neighbor_names(user)
+
+    if targets is not None:
 
-    if lookup:
-        
-        unique_mentions, targets = lookup
+        unique_mentions = graph.neighbors(user_id).shape[0]
         user_features["log_unique_mentions"] = np.log(unique_mentions + 1)
 
         # add the tweet id to the row in case we need to merge later
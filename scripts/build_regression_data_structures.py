@@ -14,6 +14,8 @@ from sys import argv
 import frame_stats as fs
 import frame_stats.time_series as ts
 import frame_stats.causal_inferrence as ci  # has the functions for setting up regression
+from frame_stats.frame_tensor import FrameTensor
+from data_selector.mention_network import MentionGraph
 import pickle
 
 # we dont want to be working in notebooks/ for pathing reasons
@@ -48,16 +50,17 @@ features = pd.read_csv(paths["regression"]["features"], sep="\t", dtype={"id_str
 features = features.drop_duplicates()
 print("features loaded")
 
-# adjacency list for neighbor lookup
-print("loading adjacency list")
-with open(paths["mentions"]["adjacency_list"], "r") as fout:
-    mention_neighbors = json.loads(fout.read())
-print("adjacency list loaded")
+# mention graph for neighbor lookup
+print("loading mention graph")
+mention_graph = MentionGraph.from_files(paths["mentions"]["network"],
+                                        paths["public"]["user_id_map"])
+print("mention graph loaded")
 
-print("loading user time series hash")
-with open(paths["user_time_series"], "rb") as utspkl:
-    user_time_series = pickle.load(utspkl)
-print("loaded user time series hash")
+# memory mapped, user_time_series[user] gives the same dataframe the old
+# pickled hash did
+print("opening user frame tensor")
+user_time_series = FrameTensor(paths["user_frame_tensor"])
+print("opened user frame tensor")
 
 # %%
 # this time we want to do all pairs whether or not a user cued frames on 
@@ -112,60 +115,47 @@ if not argv[1] == "--skip-self":
     with open(paths["regression"]["self_influence_pairs"], "wb") as fout:
         pickle.dump(self_regression_pairs, fout)
 # %%
-# same proceedure for the alter pairs
-def get_alter_regression_pairs(user,
-                               user_tweets,
-                               time_series_hash,
-                               alter_names,
-                               window_days) -> List[Dict]:
-    
+# same proceedure for the alter pairs. each tweet's exposure to its alters
+# is read straight off the memory mapped tensor, only at the (user, day)
+# cells the tweets are in, instead of building the full users x days x
+# frames exposure array
+def get_alter_regression_pairs(tweets: pd.DataFrame,
+                               frame_tensor: FrameTensor,
+                               mention_graph: MentionGraph,
+                               window_days: int) -> List[Dict]:
+
+    adjacency = mention_graph.adjacency_for(frame_tensor.users, "both", weighted=False)
+
+    # users missing from the mention network don't get alter pairs
+    in_graph = np.array([mention_graph.user_id(user) in mention_graph
+                         for user in tweets["screen_name"]], dtype=bool)
+    tweets = tweets[in_graph]
+
+    tweet_exposure, _ = ci.tweet_window_exposure(frame_tensor.counts,
+                                                 frame_tensor.periods,
+                                                 frame_tensor.rows(tweets["screen_name"]),
+                                                 tweets["time_stamp"],
+                                                 window=window_days,
+                                                 lag=1,
+                                                 adjacency=adjacency,
+                                                 weighted=False)
+    tweet_exposure = tweet_exposure.astype(bool).astype(int)
 
     user_pairs = []
-
-    # relevant timedelatas
-    window = pd.Timedelta(f"{window_days}D")
-    oneday = pd.Timedelta("1D")
-
-    for _, tweet in user_tweets.iterrows():
-
+    for i, (_, tweet) in enumerate(tqdm(tweets.iterrows(), total=tweets.shape[0])):
         new_pair = {}
         new_pair["t+1"] = tweet  # full tweet into into "t+1" slot
-
-        # sum frames within the window for each alter
-        frame_array = np.zeros(time_series_hash[user].shape[1])
-        for alter in alter_names:
-            posting_date = tweet["time_stamp"].date()
-            frames_in_window = time_series_hash[alter][posting_date - window : posting_date - oneday]
-            total_window_frames = frames_in_window.sum()
-            frame_array += total_window_frames.values
-        
-        frame_series = pd.Series(frame_array, index=time_series_hash[user].columns)
-        exposures = frames_in_window.astype(bool).astype(int)
-        new_pair["t"] = exposures
+        new_pair["t"] = pd.DataFrame([tweet_exposure[i]], columns=frame_tensor.frames)
 
         user_pairs.append(new_pair)
-    
-    return user_pairs
 
-import warnings
-
-alter_regression_pairs = []
-with warnings.catch_warnings():
-    warnings.simplefilter("ignore")
-
-    for user in tqdm(filtered_tweets["screen_name"].unique()):
-        user_tweets = filtered_tweets[filtered_tweets["screen_name"] == user]
-        try:
+    return user_pairs
 
-            alter_regression_pairs.extend(get_alter_regression_pairs(user,
-                                                                   user_tweets,
-                                                                   user_time_series,
-                                                                   mention_neighbors[user],
-                                                                   1))
-        except Exception as e:
-            # print(f"{type(e).__name__}: {e}")
-            continue
 
+alter_regression_pairs = get_alter_regression_pairs(filtered_tweets,
+                                                    user_time_series,
+                                                    mention_graph,
+                                                    1)
 
 with open(paths["regression"]["alter_influence_pairs"], "wb") as fout:
     pickle.dump(alter_regression_pairs, fout)
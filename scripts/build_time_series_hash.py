@@ -9,6 +9,7 @@ from datetime import timedelta
 
 import frame_stats as fs
 import frame_stats.time_series as ts
+from frame_stats.frame_tensor import save_frame_tensor
 
 import sys
 import os
@@ -36,12 +37,15 @@ filtered_tweets = pd.read_csv(paths["all_frames"], sep="\t")
 print("tweets loaded")
 
 # %%
-user_time_series = {}
-for user in tqdm(filtered_tweets["screen_name"].unique()):
-    user_ts = ts.construct_frame_time_series(user, filtered_tweets, "1D", config)
-    user_time_series[user] = user_ts
-
-
-with open(paths["user_time_series"], "wb") as fout:
-    pickle.dump(user_time_series, fout)
+# every user's daily frame counts in one groupby pass. we keep it sparse
+# since most users don't tweet on most days
+print("building time series")
+all_time_series = ts.construct_all_frame_time_series(filtered_tweets, "1D", config, sparse=True)
+print("time series built")
+
+# memory mapped user x day x frame tensor. readers can slice users and date
+# windows straight off disk instead of unpickling a dict of dataframes
+print("writing tensor")
+save_frame_tensor(paths["user_frame_tensor"], all_time_series)
+print("tensor written")
 # %%
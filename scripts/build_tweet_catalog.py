@@ -1,11 +1,9 @@
-import gzip
 import json
-import pandas as pd
-import numpy as np
 import sys
 from glob import glob
 from tqdm import tqdm
-from functools import reduce
+from tweet_reader import read_tweets
+from tweet_catalog import IncrementalCatalog
 
 
 with open("workflow/paths.json", "r") as path_file:
@@ -14,48 +12,40 @@ with open("workflow/paths.json", "r") as path_file:
 with open("workflow/config.json", "r") as config_file:
     config = json.loads(config_file.read())
 
-tweet_catalog = {}
-
-# this is an annoying part, we have to iterate over each json file
-# and put all of the relevant json into the catalog keyed by the id string
+# the catalog remembers which source files it already has (by size, mtime
+# and hash), every run only reads the new or changed ones into a new delta
+# segment. segments get compacted in the background once there are enough
 if len(sys.argv) == 1: 
-    print("Catalogging Public tweets")
-    for tweet_json in tqdm(gzip.open(paths["public"]["2018_json"])):
-        tweet = json.loads(tweet_json)
-        tweet_catalog[tweet["id_str"]] = json.dumps(tweet)
-
-    for tweet_json in tqdm(gzip.open(paths["public"]["2019_json"])):
-        tweet = json.loads(tweet_json)
-        tweet_catalog[tweet["id_str"]] = json.dumps(tweet)
-
-
-    print("Catalogging Journalists tweets")
-    with open(paths["journalists"]["tweet_json"], "r") as json_file:
-        for tweet in tqdm(json.loads(json_file.read())):
-            tweet_catalog[str(tweet["id"])] = json.dumps(tweet)
-
-
-    print("Catalogging Congress tweets")
-    with open(paths["congress"]["tweet_json"], "r") as json_file:
-        for tweet in tqdm(json.loads(json_file.read())):
-            tweet_catalog[str(tweet["id"])] = json.dumps(tweet)
-
-    print("Writing file")
-    with open("data/immigration_tweets/tweets_by_id.json", "w") as tc_fout:
-        json.dump(tweet_catalog, tc_fout)
+    with IncrementalCatalog(paths["tweet_store"]) as catalog:
+        public_files = catalog.changed_files([paths["public"]["2018_json"],
+                                              paths["public"]["2019_json"]])
+        json_files = catalog.changed_files([paths["journalists"]["tweet_json"],
+                                            paths["congress"]["tweet_json"]])
+
+        with catalog.delta(public_files + json_files) as tweet_store:
+            print(f"Catalogging Public tweets from {len(public_files)} new files")
+            for tweet, raw in tqdm(read_tweets(public_files, with_raw=True)):
+                tweet_store.add(tweet, raw=raw)
+
+            # journalists and congress tweets are one json list per file
+            print(f"Catalogging Journalists and Congress tweets from {len(json_files)} new files")
+            for json_path in json_files:
+                with open(json_path, "r") as json_file:
+                    for tweet in tqdm(json.loads(json_file.read())):
+                        tweet_store.add(tweet)
+
+            print("Writing index")
 
 elif sys.argv[1] == "retweets":
     print("Catalogging Retweets")
     year = sys.argv[3]
-    files = glob(paths["public"]["retweet_dir"] + f"decahose.{year}*.gz")
-    for file in tqdm(files):
-        try:
-            for tweet_json in gzip.open(file):
-                tweet = json.loads(tweet_json)
-                tweet_catalog[str(tweet["id_str"])] = json.dumps(tweet)
-        except:
-            continue
-
-    print("Writing file")
-    with open(sys.argv[2], "w") as tc_fout:
-        json.dump(tweet_catalog, tc_fout)
+    with IncrementalCatalog(sys.argv[2]) as catalog:
+        files = catalog.changed_files(sorted(glob(paths["public"]["retweet_dir"] + f"decahose.{year}*.gz")))
+        print(f"{len(files)} new or changed files")
+
+        with catalog.delta(files) as tweet_store:
+            # corrupted files get logged and skipped
+            for tweet, raw in tqdm(read_tweets(files, skip_corrupted=True, with_raw=True)):
+                tweet_store.add(tweet, raw=raw)
+
+            print("Writing index")
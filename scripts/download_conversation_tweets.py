@@ -1,8 +1,11 @@
+import glob
 import gzip
 import json
-import time
 import tweet_handler as th
-import glob
+import pandas as pd
+from async_downloader import download
+from crawl_frontier import CrawlFrontier
+from tweet_columns import read_columns
 
 
 # get api keys
@@ -10,30 +13,59 @@ with open("workflow/twitter_api_keys.json", "r") as fin:
     keys = json.loads(fin.read())
 
 years = ["2018", "2019"]
+batch_size = 1000
+
+# the frontier remembers what's queued, what's done and which source files
+# were already scanned, so restarting picks up right where we left off. it
+# lives next to the old one-file-per-conversation directory, not inside it
+crawl_dir = "data/immigration_tweets/conversation_crawl"
+frontier = CrawlFrontier(f"{crawl_dir}/frontier.sqlite", f"{crawl_dir}/shards")
 
-# figure out what we have already
-parse_id = lambda x: x.split("/")[-1].split(".")[0]
-downloaded_convs = [parse_id(file) for file in  glob.glob("data/immigration_tweets/conversations/*")]
-checked = set(downloaded_convs)
+# conversations downloaded one file each before we had the frontier. the
+# ones that had tweets get their quotes queued like the crawled ones do
+if frontier.total() == 0:
+    parse_id = lambda x: x.split("/")[-1].split(".")[0]
 
+    def has_tweets(path):
+        with gzip.open(path, "r") as fin:
+            return len(fin.read(4)) > 3
+
+    legacy_files = glob.glob("data/immigration_tweets/conversations/*.gz")
+    frontier.mark_done("conversation", [parse_id(file) for file in legacy_files])
+    frontier.add("quotes", [parse_id(file) for file in legacy_files if has_tweets(file)])
+
+# queue every conversation a tweet replies to, the ones with the most
+# replies in our data first
 for year in years:
-    with gzip.open(f"data/immigration_tweets/US_{year}.gz", "r") as fgz:
-        for i, line in enumerate(fgz):
+    source = f"data/immigration_tweets/US_{year}.gz"
+    if frontier.seen_source(source):
+        continue
+
+    replies = read_columns(source, ["reply_to_id"])["reply_to_id"].dropna()
+    reply_counts = replies.value_counts()
+    n_new = frontier.add("conversation", reply_counts.index, reply_counts.values)
+    frontier.add_source(source)
+    print(f"{source}: {n_new} new conversations")
 
-            get_id = False
-            obj = json.loads(line.decode('utf-8').strip())
+# each batch is one concurrent download into one shard file
+while True:
+    batch = frontier.next_batch(batch_size)
+    if batch is None:
+        break
 
-            if obj["in_reply_to_status_id"] != "null":
-                get_id = obj["in_reply_to_status_id"]
+    jobs = []
+    for kind, tweet_id in batch.items:
+        if kind == "conversation":
+            jobs.append(th.conversation_tweets_job(tweet_id, immigration_only=False))
+        else:
+            jobs.append(th.quote_job(tweet_id))
 
-            if get_id and get_id not in checked:
-                try:
-                    conversation_tweets = th.download_conversation(get_id, keys["bearer_token"], immigration_only=False)
-                    checked.add(get_id)
+    download(jobs, keys["bearer_token"], batch.path, batch.journal_path)
+    print(f"shard {batch.shard}: {frontier.finish_batch(batch)}")
 
-                    with gzip.open(f"data/immigration_tweets/conversations/{get_id}.gz", "w") as fout:
-                        fout.write(json.dumps(conversation_tweets).encode())
-                        fout.flush()
-                except:
-                    continue
+    # quotes of the conversations that turned out to have tweets, by size
+    conversations = pd.Series(dict(frontier.done_counts("conversation", 1, batch.shard)), dtype=int)
+    frontier.add("quotes", conversations.index, conversations.values)
 
+print(frontier.status_counts())
+frontier.close()
@@ -2,6 +2,8 @@ import json
 import tweet_handler as th
 import os
 import pandas as pd
+from async_downloader import ResumeJournal, download
+from tweet_reader import read_tweets
 
 # get api keys
 with open("twitter_api_keys.json", "r") as fin:
@@ -10,22 +12,30 @@ with open("twitter_api_keys.json", "r") as fin:
 # load the journalists
 journalists = pd.read_csv("data/users_of_interest/top_536_journos.tsv", sep="\t")
 
-for focal_account in journalists["username"]:
+# already have this one
+accounts = [account for account in journalists["username"] if account != "benshapiro"]
 
-    # already have this one
-    if focal_account == "benshapiro":
-        continue
-
-    # function handles all api requests
-    try:
-        user_tweets = th.download_immigration_tweets(focal_account,
-                                                     th.start_date,
-                                                     th.end_date,
-                                                     keys["bearer_token"])
-    except:
-        continue
+# every journalist's search runs concurrently under the shared rate limit.
+# pages land in one gzip file and the journal lets a rerun pick up where
+# this one stopped
+out_path = "data/immigration_tweets/journalists/download.gz"
+journal_path = "data/immigration_tweets/journalists/download_journal.jsonl"
+stats = download([th.immigration_tweets_job(account) for account in accounts],
+                 keys["bearer_token"],
+                 out_path,
+                 journal_path)
+print(stats)
 
+# write out each users tweets
+user_tweets = {account: [] for account in accounts}
+if os.path.exists(out_path):
+    for tweet in read_tweets(out_path, skip_corrupted=True):
+        user_tweets[tweet["screen_name"]].append(tweet)
 
-    # write out each users tweets
+journal = ResumeJournal(journal_path)
+for focal_account, tweets in user_tweets.items():
+    if not journal.done(f"user:{focal_account}"):
+        continue
     with open(f"data/immigration_tweets/journalists/{focal_account}.json", "w") as fout:
-        json.dump(user_tweets, fout)
+        json.dump(tweets, fout)
+journal.close()
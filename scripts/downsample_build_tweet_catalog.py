@@ -1,4 +1,3 @@
-import gzip
 import json
 import pandas as pd
 import numpy as np
@@ -6,6 +5,7 @@ import sys
 from glob import glob
 from tqdm import tqdm
 from functools import reduce
+from tweet_reader import read_tweets
 
 
 with open("workflow/sample_paths.json", "r") as path_file:
@@ -20,13 +20,8 @@ tweet_catalog = {}
 # and put all of the relevant json into the catalog keyed by the id string
 if len(sys.argv) == 1: 
     print("Catalogging Public tweets")
-    for tweet_json in tqdm(gzip.open(paths["public"]["2018_json"])):
-        tweets = json.loads(tweet_json)
-        for tweet in tweets:
-            tweet_catalog[tweet["id_str"]] = json.dumps(tweet)
-
-    for tweet_json in tqdm(gzip.open(paths["public"]["2019_json"])):
-        tweets = json.loads(tweet_json)
+    # every line of the down sample is a list of tweets
+    for tweets in tqdm(read_tweets([paths["public"]["2018_json"], paths["public"]["2019_json"]])):
         for tweet in tweets:
             tweet_catalog[tweet["id_str"]] = json.dumps(tweet)
 
@@ -50,13 +45,8 @@ elif sys.argv[1] == "retweets":
     print("Catalogging Retweets")
     year = sys.argv[3]
     files = glob(paths["public"]["retweet_dir"] + f"decahose.{year}*.gz")
-    for file in tqdm(files):
-        try:
-            for tweet_json in gzip.open(file):
-                tweet = json.loads(tweet_json)
-                tweet_catalog[str(tweet["id_str"])] = json.dumps(tweet)
-        except:
-            continue
+    for tweet in tqdm(read_tweets(files, skip_corrupted=True)):
+        tweet_catalog[str(tweet["id_str"])] = json.dumps(tweet)
 
     print("Writing file")
     with open(sys.argv[2], "w") as tc_fout:
@@ -3,6 +3,7 @@ import json
 import gzip
 
 from edge_finder import check_connections
+from tweet_reader import read_tweets
 from glob import glob
 from tqdm import tqdm
 
@@ -17,8 +18,7 @@ congress_path = "data/down_sample/immigration_tweets/congress.json"
 
 print("Extracting Public Edges 2018...")
 new_rows = []
-for t in gzip.open(paths["public"]["2018_json"]):
-    tweet_json = json.loads(t)
+for tweet_json in read_tweets(paths["public"]["2018_json"]):
     for tweet in tqdm(tweet_json):
         edges = check_connections(tweet, "public")
         if edges:
@@ -28,8 +28,7 @@ pd.DataFrame(new_rows).to_csv("data/down_sample/edge_lists/public_2018_successor
 
 print("Extracting Public Edges 2019...")
 new_rows = []
-for t in gzip.open(paths["public"]["2019_json"]):
-    tweet_json = json.loads(t)
+for tweet_json in read_tweets(paths["public"]["2019_json"]):
     for tweet in tqdm(tweet_json):
         edges = check_connections(tweet, "public")
         if edges:
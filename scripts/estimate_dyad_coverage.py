@@ -4,6 +4,7 @@ import json
 import pandas as pd
 
 from edge_finder import build_sample_catalog, check_sample_group
+from tweet_columns import read_columns
 from glob import glob
 from tqdm import tqdm
 from typing import List
@@ -22,21 +23,10 @@ with open("workflow/paths.json", "r") as path_json:
 # first we need to load some minimal version of the tweet data
 
 def build_minimal_public_df(path):
-    
-    # build up a list of rows to convert to df
-    rows = []
-
-    for tweet in tqdm(gzip.open(path)):
-        new_row = {}
-        tweet_json = json.loads(tweet)
-
-        new_row["id_str"] = str(tweet_json["id_str"])
-        new_row["user_id"] = tweet_json["user"]["id_str"]
-        new_row["user_name"] = tweet_json["user"]["screen_name"]
-
-        rows.append(new_row)
 
-    return pd.DataFrame(rows)
+    # only the three columns we need, no per tweet rows
+    public_df = read_columns(path, ["id_str", "user_id", "screen_name"])
+    return public_df.rename(columns={"screen_name": "user_name"})
 
 
 def assemble_catalog(dfs: pd.DataFrame, keep_cols=["target_id", "sample"]) -> pd.DataFrame:
@@ -1,11 +1,14 @@
 import pandas as pd
 import json
-import gzip
+import logging
 
-from edge_finder import check_connections
+from edge_finder import check_connections, extract_edges
 from glob import glob
 from tqdm import tqdm
 
+# corrupted gzip members get reported by the extractor
+logging.basicConfig(level=logging.INFO)
+
 with open("workflow/paths.json", "r") as path_file:
     paths = json.loads(path_file.read())
 
@@ -14,43 +17,20 @@ with open("workflow/paths.json", "r") as path_file:
 public_2018_path = "data/immigration_tweets/US_2018.gz"
 public_2019_path = "data/immigration_tweets/US_2019.gz"
 journalist_paths = glob("data/immigration_tweets/journalists/*.json")
-retweet_paths = glob("data/decahose_retweets/decahose*.gz")
+retweet_paths = sorted(glob("data/decahose_retweets/decahose*.gz"))
 congress_path = "data/immigration_tweets/congress.json"
 
+# each year is a single big dump, extract_edges splits it into blocks of
+# lines so the whole pool works on it
 print("Extracting Public Edges 2018...")
-new_rows = []
-for t in tqdm(gzip.open(paths["public"]["2018_json"])):
-    tweet_json = json.loads(t)
-    edges = check_connections(tweet_json, "public")
-    if edges:
-        new_rows.append(edges)
-
-pd.DataFrame(new_rows).to_csv("data/edge_lists/public_2018_successors.tsv", sep="\t", index=False)
+extract_edges([paths["public"]["2018_json"]], "data/edge_lists/public_2018_successors.tsv", "public")
 
 print("Extracting Public Edges 2019...")
-new_rows = []
-for t in tqdm(gzip.open(paths["public"]["2019_json"])):
-    tweet_json = json.loads(t)
-    edges = check_connections(tweet_json, "public")
-    if edges:
-        new_rows.append(edges)
-
-pd.DataFrame(new_rows).to_csv("data/edge_lists/public_2019_successors.tsv", sep="\t", index=False)
+extract_edges([paths["public"]["2019_json"]], "data/edge_lists/public_2019_successors.tsv", "public")
 
 
 print("Extracting Public retweets...")
-new_rows = []
-for daily_path in tqdm(retweet_paths):
-    try:  # at least one of the daily retweet files is corrupted
-        for t in gzip.open(daily_path):
-            tweet_json = json.loads(t)
-            edges = check_connections(tweet_json, "public")
-            if edges:
-                new_rows.append(edges)
-    except:
-        continue
-
-pd.DataFrame(new_rows).to_csv("data/edge_lists/retweet_successors.tsv", sep="\t", index=False)
+extract_edges(retweet_paths, "data/edge_lists/retweet_successors.tsv", "public")
 
 print("Extracting Journalist Edges...")
 new_rows = []
@@ -63,6 +43,7 @@ with open(paths["journalists"]["tweet_json"], "r") as fin:
 pd.DataFrame(new_rows).to_csv("data/edge_lists/journalists_successors.tsv", sep="\t", index=False)
 
 print("Extracting Congress Edges")
+new_rows = []
 with open(paths["congress"]["tweet_json"], "r") as fin:
     for t in tqdm(json.loads(fin.read())):
         edges = check_connections(t, "congress")
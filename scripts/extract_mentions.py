@@ -5,6 +5,7 @@ import json
 
 from tqdm import tqdm
 from typing import Dict
+from tweet_catalog import open_store
 
 import os
 if os.getcwd().split("/")[-1] == "scripts" or os.getcwd().split("/")[-1] == "notebooks":
@@ -14,27 +15,11 @@ print(f"Working in {os.getcwd()}")
 with open("workflow/paths.json", "r") as pf:
     paths = json.loads(pf.read())
 
-def extract_user(tweet: Dict) -> str:
-    if "user_id" in tweet:
-        return tweet['user_id']
-    elif "user" in tweet:
-        return tweet['user']['id']
-    elif "author_id":
-        return tweet['author_id']
-    else:
-        raise KeyError(f"Standard keys not present in tweet: {tweet}")
-
 # %%
-# get all of the uids for users in our sample
-with open(paths["tweet_catalog"], "r") as all_tweets:
-    tweets = json.loads(all_tweets.read())
-
-
-all_users = set([])
-
-for tweet_id in tqdm(tweets.keys()):
-    tweet = json.loads(tweets[tweet_id])
-    all_users.add(extract_user(tweet))
+# get all of the uids for users in our sample. the store keeps them as a
+# column so we don't have to parse any json
+tweets = open_store(paths["tweet_store"])
+all_users = set(int(uid) for uid in np.unique(tweets.column("user_id")) if uid)
 
 # %%
 mentions = pd.read_csv(paths["mentions"]["raw_network"], sep="\t")
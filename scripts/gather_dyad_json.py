@@ -6,6 +6,7 @@ import re
 from tqdm import tqdm
 from typing import Dict
 from functools import reduce
+from tweet_catalog import open_store
 
 # convert ugly named series to nice little dict
 def frame_series_to_dict(frame_series: pd.Series, prefix: str) -> Dict:
@@ -20,8 +21,10 @@ def frame_series_to_dict(frame_series: pd.Series, prefix: str) -> Dict:
 
 in_sample_dyads = pd.read_csv("data/edge_lists/in_sample_dyads.tsv", sep="\t")
 
-with open("data/immigration_tweets/tweets_by_id.json", "r") as tweet_fin:
-    tweet_catalog = json.loads(tweet_fin.read())
+with open("workflow/paths.json", "r") as path_file:
+    paths = json.loads(path_file.read())
+
+tweet_store = open_store(paths["tweet_store"])
 
 frame_catalog = pd.read_csv("data/binary_frames/all_group_frames.tsv", sep="\t").drop(["text", "Unnamed: 0", "Threat", "Victim", "Hero"], axis="columns")
 print("Data Loaded to memory")
@@ -51,8 +54,8 @@ print("Beginning Loop")
 for row_i, dyad in dyads_framed.iterrows():
     dyad_json = {}
     
-    dyad_json["source_full"] = json.loads(tweet_catalog[str(dyad["tweet_id"])])
-    dyad_json["target_full"] = json.loads(tweet_catalog[str(dyad["target_id"])])
+    dyad_json["source_full"] = tweet_store.get_json(dyad["tweet_id"])
+    dyad_json["target_full"] = tweet_store.get_json(dyad["target_id"])
     
     source_frames = dyad[source_frame_cols]
     source_frames = frame_series_to_dict(source_frames, "s_")
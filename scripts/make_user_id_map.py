@@ -14,26 +14,10 @@ with open("workflow/config.json", "r") as cf:
 
 with open("workflow/paths.json", "r") as pf:
     paths = json.loads(pf.read())
-import gzip
+from tweet_columns import read_columns
 
-user_map = []
-
-years = ["2018", "2019"]
-for year in years:
-    for tweet_str in gzip.open(paths["public"][year + "_json"]):
-        tweet = json.loads(tweet_str)
-
-        if paths["dataset"] == "full":
-                user = {}
-                user["screen_name"] = tweet["user"]["screen_name"]
-                user["user_id"] = tweet["user"]["id"]
-                user_map.append(user)
-        else:
-            for t in tweet:
-                user = {}
-                user["screen_name"] = tweet["user"]["screen_name"]
-                user["user_id"] = tweet["user"]["id"]
-                user_map.append(user)
-
-df = pd.DataFrame(user_map).drop_duplicates()
+# only the two columns, the down sampled files (a list of tweets per line)
+# get flattened on the way
+df = read_columns([paths["public"]["2018_json"], paths["public"]["2019_json"]],
+                  ["screen_name", "user_id"]).drop_duplicates()
 df.to_csv(paths["public"]["user_id_map"], sep="\t", index=False)